@@ -0,0 +1,90 @@
+"""
+Сравнение стандартной AiohttpSession aiogram и профиля bot.session.create_session
+на локальном фейковом Bot API.
+С настройками по умолчанию у обоих профилей пул на 100 соединений, и их результаты
+совпадают в пределах шума. Разница появляется, когда --pool-size больше 100,
+а --concurrency и --latency держат занятым весь стандартный пул.
+
+Запуск: python -m benchmarks.bench_session --requests 5000 --concurrency 200 --latency 0.05 --pool-size 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from benchmarks.fake_bot_api import FakeBotAPI
+from bot.session import create_session
+
+
+TOKEN = "123456:bench"
+
+
+def percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def drive(bot: Bot, requests: int, concurrency: int) -> dict:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.send_message(chat_id=index % 1000 + 1, text=f"Сообщение рассылки {index}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000
+    }
+
+
+async def run_profile(name: str, make_session, args) -> dict:
+    server = FakeBotAPI(latency=args.latency)
+    base_url = await server.start()
+    bot = Bot(token=TOKEN, session=make_session(base_url))
+    try:
+        # Прогрев: пул соединений и кэш DNS
+        await drive(bot, min(args.concurrency, args.requests), args.concurrency)
+        server.connections.clear()
+        result = await drive(bot, args.requests, args.concurrency)
+        result["connections"] = len(server.connections)
+    finally:
+        await bot.session.close()
+        await server.stop()
+    result["profile"] = name
+    return result
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответа фейкового API, секунды")
+    parser.add_argument("--pool-size", type=int, default=None, help="размер пула для профиля tuned")
+    args = parser.parse_args()
+
+    profiles = [
+        ("default", lambda url: AiohttpSession(api=TelegramAPIServer.from_base(url))),
+        ("tuned", lambda url: create_session(api_url=url, pool_size=args.pool_size, outbound=False)),
+    ]
+    results = [await run_profile(name, make_session, args) for name, make_session in profiles]
+
+    print(f"{'profile':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'conns':>8}")
+    for result in results:
+        print(
+            f"{result['profile']:<10}{result['rps']:>10.0f}{result['p50_ms']:>10.1f}"
+            f"{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['connections']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,249 @@
+"""
+Бенчмарк горячих путей bot/db.py и розыгрыша scheduler.select_winners на синтетической базе
+с пользователями, реферальным графом и участниками. Данные генерируются из --seed,
+поэтому прогоны воспроизводимы. Результаты пишутся в JSON и сравниваются с базовой линией.
+
+Запуск: python -m benchmarks.bench_storage --sizes 10000,100000,1000000 --output storage.json
+Сравнение: python -m benchmarks.bench_storage --baseline storage_baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+
+PARTICIPANT_SHARE = 0.5  # доля пользователей, участвующих в разыгрываемом розыгрыше
+REFERRAL_SHARE = 0.3  # доля пользователей, пришедших по реферальной ссылке
+ACTIVE_GIVEAWAYS = 20
+INSERT_BATCH = 50000
+
+
+def summarize(latencies: list) -> dict:
+    """Перцентили в миллисекундах и пропускная способность по замерам в секундах"""
+    if len(latencies) < 2:
+        value = latencies[0] * 1000 if latencies else 0.0
+        cuts = [value] * 99
+    else:
+        cuts = [cut * 1000 for cut in statistics.quantiles(latencies, n=100, method="inclusive")]
+    total = sum(latencies)
+    return {
+        "calls": len(latencies),
+        "mean_ms": total / len(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": cuts[49],
+        "p95_ms": cuts[94],
+        "p99_ms": cuts[98],
+        "ops_per_s": len(latencies) / total if total else 0.0
+    }
+
+
+async def measure(calls: list) -> dict:
+    """calls - список фабрик корутин; каждая выполняется и замеряется по отдельности"""
+    latencies = []
+    for make_call in calls:
+        started = time.perf_counter()
+        await make_call()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def referrer_of(rng: random.Random, user_index: int) -> int:
+    """Индекс реферера: чаще ранние пользователи, как у реальных реферальных программ"""
+    return int(user_index * rng.random() ** 3)
+
+
+async def populate(db, rng: random.Random, size: int, first_user_id: int) -> dict:
+    """Пользователи, реферальный граф, активные розыгрыши и участники разыгрываемого розыгрыша"""
+    connection = db.db_connection
+    started = time.perf_counter()
+    for offset in range(0, size, INSERT_BATCH):
+        indexes = range(offset, min(size, offset + INSERT_BATCH))
+        await connection.executemany(
+            "INSERT INTO users (user_id, username, fullname) VALUES (?, ?, ?)",
+            [(first_user_id + i, f"user{i}", f"User {i}") for i in indexes]
+        )
+        await connection.executemany(
+            "INSERT INTO referrals (referrer_id, referee_id) VALUES (?, ?)",
+            [
+                (first_user_id + referrer_of(rng, i), first_user_id + i)
+                for i in indexes if i and rng.random() < REFERRAL_SHARE
+            ]
+        )
+    await connection.commit()
+    await db.recompute_referral_counts()
+
+    announcement_date = (datetime.now() + timedelta(days=30)).strftime(db.DATE_FORMAT)
+    giveaway_ids = []
+    for number in range(ACTIVE_GIVEAWAYS):
+        ids = await db.create_giveaways(f"Розыгрыш {number}", 10, announcement_date, [-1001000000000 - number])
+        giveaway_ids.extend(ids.values())
+    draw_giveaway = giveaway_ids[0]
+
+    participants = rng.sample(range(size), int(size * PARTICIPANT_SHARE))
+    for offset in range(0, len(participants), INSERT_BATCH):
+        await connection.executemany(
+            "INSERT INTO participants (giveaway_id, user_id) VALUES (?, ?)",
+            [(draw_giveaway, first_user_id + i) for i in participants[offset:offset + INSERT_BATCH]]
+        )
+    await connection.execute(
+        "UPDATE giveaways SET participants_count = ? WHERE id = ?", (len(participants), draw_giveaway)
+    )
+    await connection.commit()
+    return {
+        "seconds": time.perf_counter() - started,
+        "giveaway_ids": giveaway_ids,
+        "draw_giveaway": draw_giveaway,
+        "participants": len(participants)
+    }
+
+
+async def run_size(size: int, args, workdir: str) -> dict:
+    import bot.db as db
+    from bot.config import Config
+    from bot.scheduler import select_winners
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    first_user_id = 1000000
+    Config.DB_URL = os.path.join(workdir, f"storage_{size}.db")
+    await db.init_db()
+    try:
+        data = await populate(db, rng, size, first_user_id)
+        print(f"size {size}: populated in {data['seconds']:.1f}s ({data['participants']} participants)", flush=True)
+        ops = args.ops
+        user_ids = [first_user_id + rng.randrange(size) for _ in range(ops)]
+        new_user_ids = [first_user_id + size + i for i in range(ops)]
+        active_ids = data["giveaway_ids"][1:]
+        draw_giveaway = data["draw_giveaway"]
+
+        results = {"populate_s": data["seconds"], "participants": data["participants"]}
+        referrer_ids = [rng.choice(user_ids) if rng.random() < REFERRAL_SHARE else None for _ in range(ops)]
+        results["add_user"] = await measure([
+            (lambda user_id=user_id, referrer_id=referrer_id: db.add_user(user_id, f"new{user_id}", "New user", referrer_id))
+            for user_id, referrer_id in zip(new_user_ids, referrer_ids)
+        ])
+        results["add_participant"] = await measure([
+            (lambda giveaway_id=rng.choice(active_ids), user_id=user_id: db.add_participant(giveaway_id, user_id))
+            for user_id in user_ids
+        ])
+        results["get_active_giveaways"] = await measure([db.get_active_giveaways for _ in range(ops)])
+        results["is_participant"] = await measure([
+            (lambda user_id=user_id: db.is_participant(draw_giveaway, user_id)) for user_id in user_ids
+        ])
+        # Ранние пользователи - самые активные рефереры, их списки длиннее
+        results["get_user_referrals"] = await measure([
+            (lambda user_id=first_user_id + referrer_of(rng, size): db.get_user_referrals(user_id)) for _ in range(ops)
+        ])
+
+        async def draw():
+            participants = await db.get_participants(draw_giveaway)
+            return await select_winners(participants, args.winners)
+
+        results["draw"] = await measure([draw for _ in range(args.draws)])
+        tracemalloc.start()
+        try:
+            await draw()
+            results["draw"]["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+        results["db_size_mb"] = os.path.getsize(Config.DB_URL) / 1024 / 1024
+        results["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return results
+    finally:
+        await db.db_connection.close()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Операции, у которых p50 вырос больше чем на tolerance относительно базовой линии"""
+    regressions = []
+    for size, operations in results["results"].items():
+        for name, current in operations.items():
+            previous = baseline.get("results", {}).get(size, {}).get(name)
+            if not isinstance(current, dict) or not isinstance(previous, dict) or not previous.get("p50_ms"):
+                continue
+            change = current["p50_ms"] / previous["p50_ms"] - 1
+            current["baseline_p50_ms"] = previous["p50_ms"]
+            current["change"] = change
+            if change > tolerance:
+                regressions.append(f"{size} {name}: p50 {previous['p50_ms']:.3f} -> {current['p50_ms']:.3f} ms ({change:+.0%})")
+    return regressions
+
+
+def print_results(results: dict):
+    print(f"\n{'size':>9} {'operation':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>11}{'vs base':>9}")
+    for size, operations in results["results"].items():
+        for name, stats in operations.items():
+            if not isinstance(stats, dict):
+                continue
+            change = f"{stats['change']:+.0%}" if "change" in stats else ""
+            print(
+                f"{size:>9} {name:<22}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+                f"{stats['p99_ms']:>10.3f}{stats['ops_per_s']:>11.1f}{change:>9}"
+            )
+        draw = operations["draw"]
+        print(
+            f"{size:>9} draw peak memory {draw['peak_memory_mb']:.1f} MB, "
+            f"db {operations['db_size_mb']:.1f} MB, max RSS {operations['max_rss_mb']:.0f} MB"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="число пользователей, через запятую")
+    parser.add_argument("--ops", type=int, default=1000, help="вызовов каждой операции")
+    parser.add_argument("--draws", type=int, default=3, help="повторов полного розыгрыша")
+    parser.add_argument("--winners", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимый рост p50 относительно базовой линии")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_storage_")
+    # До импорта bot.*: конфигурация читается при импорте
+    os.environ.update({
+        "LOG_DIR": os.path.join(workdir, "logs"),
+        "LOG_CONSOLE": "0",
+        "GOOGLE_SHEET_LINK": ""
+    })
+    results = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "ops": args.ops,
+            "draws": args.draws,
+            "winners": args.winners
+        },
+        "results": {}
+    }
+    for size in (int(value) for value in args.sizes.split(",")):
+        results["results"][str(size)] = await run_size(size, args, workdir)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    print(f"\ndatabases and logs: {workdir}")
+    if regressions:
+        print("\nRegressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+"""
+Локальный сервер, отвечающий как Bot API, для бенчмарков и нагрузочных тестов без обращения к Telegram.
+Умеет отдавать апдейты через getUpdates, добавлять задержку и разброс ответа,
+случайные 429 и эмулировать лимиты Telegram на отправку сообщений.
+
+Запуск отдельно: python -m benchmarks.fake_bot_api --port 8081 --latency 0.02 --flood
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+from aiohttp import web
+
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake bot", "username": "fake_bot"}
+
+# Методы, на которые Telegram накладывает лимиты сообщений
+SEND_METHODS = frozenset({
+    "sendmessage", "sendphoto", "sendmediagroup", "senddocument", "copymessage", "forwardmessage"
+})
+# Служебные запросы запуска бота, которые не получают случайных 429
+STARTUP_METHODS = frozenset({"getme", "deletewebhook", "setwebhook"})
+# Лимиты Telegram: (сообщений, за секунд)
+FLOOD_LIMITS = {"global": (30, 1), "private": (1, 1), "group": (20, 60)}
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after: int = 1,
+        flood: bool = False,
+        flood_limits: dict = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.flood = flood
+        self.flood_limits = flood_limits or FLOOD_LIMITS
+        self.requests = 0
+        self.methods = {}
+        self.rejected = 0
+        self.connections = set()
+        # Вызывается (метод, параметры) на каждый успешный запрос, кроме getUpdates
+        self.on_request = None
+        self._message_id = 0
+        self._update_id = 0
+        self._updates = deque()
+        self._new_updates = asyncio.Event()
+        self._windows = {}
+
+    def push_update(self, update: dict) -> int:
+        """Ставит апдейт в очередь getUpdates и возвращает его update_id"""
+        self._update_id += 1
+        update["update_id"] = self._update_id
+        self._updates.append(update)
+        self._new_updates.set()
+        return self._update_id
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        # Апдейты до offset бот подтвердил
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return [self._updates[index] for index in range(min(limit, len(self._updates)))]
+
+    def _message(self, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": int(params.get("message_id") or self._message_id),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+            "text": params.get("text", "")
+        }
+
+    def result(self, method: str, params: dict):
+        if method == "getme":
+            return BOT_USER
+        if method in ("sendmessage", "sendphoto", "senddocument", "copymessage", "forwardmessage"):
+            return self._message(params)
+        if method in ("editmessagetext", "editmessagereplymarkup", "editmessagecaption"):
+            return self._message(params)
+        if method == "sendmediagroup":
+            media = params.get("media", "[]")
+            media = json.loads(media) if isinstance(media, str) else media
+            return [self._message(params) for _ in media]
+        if method == "getchatmember":
+            user_id = int(params.get("user_id", 0))
+            return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}}
+        return True
+
+    def _flood_retry_after(self, method: str, params: dict) -> int:
+        """Сколько ждать до отправки по лимитам Telegram; 0 - отправка разрешена"""
+        if method not in SEND_METHODS:
+            return 0
+        chat_id = int(params.get("chat_id", 0))
+        keys = [("global", "global"), (chat_id, "private" if chat_id > 0 else "group")]
+        now = time.monotonic()
+        wait = 0.0
+        for key, kind in keys:
+            limit, period = self.flood_limits[kind]
+            window = self._windows.setdefault(key, deque())
+            while window and window[0] <= now - period:
+                window.popleft()
+            if len(window) >= limit:
+                wait = max(wait, window[0] + period - now)
+        if wait > 0:
+            return max(1, math.ceil(wait))
+        for key, _ in keys:
+            self._windows[key].append(now)
+        return 0
+
+    @staticmethod
+    def _too_many_requests(retry_after: int) -> web.Response:
+        return web.json_response({
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {retry_after}",
+            "parameters": {"retry_after": retry_after}
+        }, status=429)
+
+    async def handle(self, request: web.Request):
+        self.requests += 1
+        self.connections.add(id(request.transport))
+        method = request.match_info["method"].lower()
+        self.methods[method] = self.methods.get(method, 0) + 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        retry_after = self._flood_retry_after(method, params) if self.flood else 0
+        if (
+            not retry_after and self.error_rate and method not in STARTUP_METHODS
+            and random.random() < self.error_rate
+        ):
+            retry_after = self.retry_after
+        if retry_after:
+            self.rejected += 1
+            return self._too_many_requests(retry_after)
+
+        result = self.result(method, params)
+        if self.on_request is not None:
+            self.on_request(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Запускает сервер и возвращает его базовый URL"""
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, до секунд")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля запросов, получающих 429")
+    parser.add_argument("--flood", action="store_true", help="эмулировать лимиты Telegram на сообщения")
+    args = parser.parse_args()
+    server = FakeBotAPI(args.latency, jitter=args.jitter, error_rate=args.error_rate, flood=args.flood)
+    web.run_app(server.make_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Нагрузочный тест всего бота: main.py запускается отдельным процессом против локального
+фейкового Bot API, а синтетические пользователи шлют апдейты с заданной частотой.
+Время ответа - от постановки апдейта в getUpdates до первого ответа бота пользователю
+(answerCallbackQuery или сообщение в его чат).
+
+Запуск: python -m benchmarks.loadtest --rate 50 --duration 60 --storm-every 10 --storm-size 300 --flood
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from benchmarks.fake_bot_api import FakeBotAPI
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:loadtest"
+CHANNEL_ID = -1001000000001
+ADMIN_IDS = [1, 2, 3, 4, 5]
+FIRST_USER_ID = 100000
+ADMIN_ACTIONS = ["Все розыгрыши", "/top", "Подключенные каналы", "/slow_queries", "Список активных розыгрышей"]
+DEFAULT_MIX = "start=3,participate=5,subscription=1,browse=1,admin=0.2"
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def quantiles(values: list) -> dict:
+    if len(values) < 2:
+        value = values[0] * 1000 if values else 0.0
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50_ms": cuts[49] * 1000, "p95_ms": cuts[94] * 1000, "p99_ms": cuts[98] * 1000}
+
+
+class LoadDriver:
+    """Синтетические пользователи и учет времени ответа бота на каждый апдейт"""
+
+    def __init__(self, api: FakeBotAPI, giveaway_id: int, post_message_id: int, seed_users: int, referral_share: float):
+        self.api = api
+        self.giveaway_id = giveaway_id
+        self.post_message_id = post_message_id
+        self.referral_share = referral_share
+        self.registered = list(range(FIRST_USER_ID, FIRST_USER_ID + seed_users))
+        self.next_user_id = FIRST_USER_ID + seed_users
+        self.next_callback_id = 0
+        # chat_id -> (сценарий, время отправки); у пользователя не больше одного сообщения в работе
+        self.pending_messages = {}
+        # callback_query_id -> (сценарий, время отправки, user_id)
+        self.pending_callbacks = {}
+        self.latencies = {}
+        self.sent = {}
+        self.skipped = 0
+        api.on_request = self.on_request
+
+    def on_request(self, method: str, params: dict):
+        if method == "answercallbackquery":
+            entry = self.pending_callbacks.pop(params.get("callback_query_id"), None)
+            if entry:
+                self._resolve(entry[0], entry[1])
+            return
+        chat_id = params.get("chat_id")
+        if chat_id is None or method in ("getchatmember", "getme"):
+            return
+        chat_id = int(chat_id)
+        entry = self.pending_messages.pop(chat_id, None)
+        if entry:
+            self._resolve(*entry)
+            if entry[0] == "start":
+                self.registered.append(chat_id)
+            return
+        # Обработчик callback-а мог ответить сообщением вместо answerCallbackQuery
+        for callback_id, (scenario, started, user_id) in self.pending_callbacks.items():
+            if user_id == chat_id:
+                del self.pending_callbacks[callback_id]
+                self._resolve(scenario, started)
+                return
+
+    def _resolve(self, scenario: str, started: float):
+        self.latencies.setdefault(scenario, []).append(time.perf_counter() - started)
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+
+    def _message(self, scenario: str, user_id: int, text: str):
+        if user_id in self.pending_messages:
+            self.skipped += 1
+            return
+        self.sent[scenario] = self.sent.get(scenario, 0) + 1
+        message = {
+            "message_id": random.randint(1, 10 ** 9),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"User {user_id}"},
+            "from": self._user(user_id),
+            "text": text
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self.pending_messages[user_id] = (scenario, time.perf_counter())
+        self.api.push_update({"message": message})
+
+    def _callback(self, scenario: str, user_id: int, data: str, chat: dict, message_id: int):
+        self.next_callback_id += 1
+        callback_id = str(self.next_callback_id)
+        self.sent[scenario] = self.sent.get(scenario, 0) + 1
+        self.pending_callbacks[callback_id] = (scenario, time.perf_counter(), user_id)
+        self.api.push_update({"callback_query": {
+            "id": callback_id,
+            "from": self._user(user_id),
+            "chat_instance": str(chat["id"]),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": chat,
+                "from": {"id": 1, "is_bot": True, "first_name": "Fake bot"},
+                "text": "Розыгрыш"
+            }
+        }})
+
+    def start(self):
+        user_id = self.next_user_id
+        self.next_user_id += 1
+        text = "/start"
+        if self.registered and random.random() < self.referral_share:
+            text = f"/start {random.choice(self.registered)}"
+        self._message("start", user_id, text)
+
+    def participate(self):
+        self._callback(
+            "participate", random.choice(self.registered), f"p1:{self.giveaway_id}",
+            {"id": CHANNEL_ID, "type": "channel", "title": "Канал нагрузочного теста"}, self.post_message_id
+        )
+
+    def subscription(self):
+        user_id = random.choice(self.registered)
+        self._callback("subscription", user_id, "cs1", {"id": user_id, "type": "private"}, random.randint(1, 10 ** 9))
+
+    def browse(self):
+        self._message("browse", random.choice(self.registered), "Список активных розыгрышей")
+
+    def admin(self):
+        self._message("admin", random.choice(ADMIN_IDS), random.choice(ADMIN_ACTIONS))
+
+    def storm(self, size: int):
+        """Волна нажатий «Участвовать» от разных пользователей одновременно"""
+        for _ in range(size):
+            self.participate()
+
+    async def run(self, rate: float, duration: float, mix: dict, storm_every: float, storm_size: int):
+        scenarios = list(mix)
+        weights = [mix[name] for name in scenarios]
+        started = time.perf_counter()
+        next_storm = started + storm_every if storm_every else None
+        count = 0
+        while True:
+            now = time.perf_counter()
+            if now - started >= duration:
+                break
+            if next_storm and now >= next_storm:
+                self.storm(storm_size)
+                next_storm += storm_every
+            getattr(self, random.choices(scenarios, weights)[0])()
+            count += 1
+            # Открытая модель нагрузки: апдейты идут по расписанию, не дожидаясь ответов
+            await asyncio.sleep(max(0.0, started + count / rate - time.perf_counter()))
+
+    async def drain(self, timeout: float):
+        deadline = time.perf_counter() + timeout
+        while (self.pending_messages or self.pending_callbacks) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+
+    def report(self, elapsed: float) -> dict:
+        lost = {}
+        for scenario, *_ in list(self.pending_messages.values()) + list(self.pending_callbacks.values()):
+            lost[scenario] = lost.get(scenario, 0) + 1
+        rows = []
+        for scenario in sorted(self.sent):
+            latencies = self.latencies.get(scenario, [])
+            rows.append({
+                "scenario": scenario,
+                "sent": self.sent[scenario],
+                "answered": len(latencies),
+                "lost": lost.get(scenario, 0),
+                **quantiles(latencies)
+            })
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        return {
+            "elapsed_s": elapsed,
+            "throughput_rps": len(all_latencies) / elapsed if elapsed else 0.0,
+            "skipped": self.skipped,
+            "total": {
+                "scenario": "total",
+                "sent": sum(self.sent.values()),
+                "answered": len(all_latencies),
+                "lost": sum(lost.values()),
+                **quantiles(all_latencies)
+            },
+            "scenarios": rows
+        }
+
+
+async def seed_database(seed_users: int) -> tuple:
+    """Пользователи, канал и активный розыгрыш с постом; возвращает (giveaway_id, message_id поста)"""
+    import bot.db as db
+
+    await db.init_db()
+    await db.add_channel(CHANNEL_ID, "Канал нагрузочного теста")
+    await db.db_connection.executemany(
+        "INSERT OR IGNORE INTO users (user_id, username, fullname) VALUES (?, ?, ?)",
+        [(user_id, f"user{user_id}", f"User {user_id}") for user_id in range(FIRST_USER_ID, FIRST_USER_ID + seed_users)]
+    )
+    await db.db_connection.commit()
+    announcement_date = (datetime.now() + timedelta(days=1)).strftime(db.DATE_FORMAT)
+    giveaway_ids = await db.create_giveaways("Нагрузочный тест", 3, announcement_date, [CHANNEL_ID])
+    giveaway_id = giveaway_ids[CHANNEL_ID]
+    post_message_id = 1
+    await db.set_giveaway_messages({giveaway_id: post_message_id})
+    await db.db_connection.close()
+    return giveaway_id, post_message_id
+
+
+async def wait_for_polling(api: FakeBotAPI, process, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    while not api.methods.get("getupdates"):
+        if process.returncode is not None:
+            raise RuntimeError(f"Bot exited with code {process.returncode} before polling")
+        if time.perf_counter() > deadline:
+            raise RuntimeError("Bot did not start polling in time")
+        await asyncio.sleep(0.1)
+
+
+async def stop_bot(process, timeout: float = 30):
+    if process.returncode is not None:
+        return
+    process.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+def print_report(result: dict, api: FakeBotAPI):
+    print(f"{'scenario':<14}{'sent':>8}{'answered':>10}{'lost':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for row in result["scenarios"] + [result["total"]]:
+        print(
+            f"{row['scenario']:<14}{row['sent']:>8}{row['answered']:>10}{row['lost']:>8}"
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+        )
+    print(f"\nthroughput: {result['throughput_rps']:.1f} answered updates/s over {result['elapsed_s']:.1f}s")
+    print(f"skipped (user busy): {result['skipped']}, Bot API 429 sent: {api.rejected}")
+    print("Bot API calls: " + ", ".join(f"{method}={count}" for method, count in sorted(api.methods.items())))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20, help="апдейтов в секунду")
+    parser.add_argument("--duration", type=float, default=30, help="секунды генерации нагрузки")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="веса сценариев: start, participate, subscription, browse, admin")
+    parser.add_argument("--seed-users", type=int, default=1000, help="пользователей в базе до начала теста")
+    parser.add_argument("--referral-share", type=float, default=0.5, help="доля /start по реферальной ссылке")
+    parser.add_argument("--storm-every", type=float, default=0, help="секунды между волнами нажатий «Участвовать»")
+    parser.add_argument("--storm-size", type=int, default=200, help="нажатий в волне")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка фейкового Bot API, секунды")
+    parser.add_argument("--jitter", type=float, default=0.01, help="случайная добавка к задержке, до секунд")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля запросов, получающих 429")
+    parser.add_argument("--flood", action="store_true", help="эмулировать лимиты Telegram на сообщения")
+    parser.add_argument("--workers", type=int, default=1, help="WORKERS для бота")
+    parser.add_argument("--timeout", type=float, default=30, help="секунды ожидания ответов после генерации")
+    parser.add_argument("--json", help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+    api = FakeBotAPI(args.latency, jitter=args.jitter, error_rate=args.error_rate, flood=args.flood)
+    base_url = await api.start()
+    # Окружение общее для наполнения базы здесь и для процесса бота
+    os.environ.update({
+        "BOT_TOKEN": TOKEN,
+        "BOT_API_URL": base_url,
+        "BOT_USERNAME": "fake_bot",
+        "DB_URL": os.path.join(workdir, "loadtest.db"),
+        "ADMIN_IDS": json.dumps(ADMIN_IDS),
+        "GOOGLE_SHEET_LINK": "",
+        "LOG_DIR": os.path.join(workdir, "logs"),
+        "LOG_CONSOLE": "0",
+        "WORKERS": str(args.workers)
+    })
+    giveaway_id, post_message_id = await seed_database(args.seed_users)
+    driver = LoadDriver(api, giveaway_id, post_message_id, args.seed_users, args.referral_share)
+
+    process = await asyncio.create_subprocess_exec(sys.executable, "main.py", cwd=ROOT, env=os.environ.copy())
+    try:
+        await wait_for_polling(api, process)
+        started = time.perf_counter()
+        await driver.run(args.rate, args.duration, parse_mix(args.mix), args.storm_every, args.storm_size)
+        await driver.drain(args.timeout)
+        result = driver.report(time.perf_counter() - started)
+    finally:
+        await stop_bot(process)
+        await api.stop()
+
+    result["config"] = vars(args)
+    result["workdir"] = workdir
+    print_report(result, api)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f"\nbot logs and database: {workdir}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
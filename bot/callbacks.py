@@ -0,0 +1,182 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State
+from aiogram.types import CallbackQuery
+from bot.logger import logger
+from bot.metrics import track_handler
+
+
+# Префиксы короткие (лимит callback_data - 64 байта) и содержат версию формата:
+# при изменении полей версия повышается, а кнопки старого формата уходят в общий обработчик
+
+SEPARATOR = ":"
+
+
+class Participate(CallbackData, prefix="p1"):
+    giveaway_id: int
+
+
+class ToggleChannel(CallbackData, prefix="tc1"):
+    channel_id: int
+
+
+class SaveChannels(CallbackData, prefix="sc1"):
+    pass
+
+
+class NoChannelsSelected(CallbackData, prefix="nc1"):
+    pass
+
+
+class ConfirmGiveaway(CallbackData, prefix="cg1"):
+    pass
+
+
+class CancelGiveaway(CallbackData, prefix="xg1"):
+    pass
+
+
+class GiveawaysPage(CallbackData, prefix="gl1"):
+    page: int
+
+
+class DeleteGiveaway(CallbackData, prefix="dg1"):
+    giveaway_id: int
+
+
+class CopyReferral(CallbackData, prefix="cr1"):
+    user_id: int
+
+
+class SelectWinners(CallbackData, prefix="sw1"):
+    giveaway_id: int
+
+
+class ToggleWinner(CallbackData, prefix="wt1"):
+    giveaway_id: int
+    user_id: int
+    page: int
+    after: int
+
+
+class WinnersPage(CallbackData, prefix="wp1"):
+    giveaway_id: int
+    page: int
+    after: Optional[int] = None
+    before: Optional[int] = None
+
+
+class WinnersJump(CallbackData, prefix="wj1"):
+    giveaway_id: int
+
+
+class WinnersSearch(CallbackData, prefix="ws1"):
+    giveaway_id: int
+
+
+class WinnersClear(CallbackData, prefix="wc1"):
+    giveaway_id: int
+
+
+class SaveWinners(CallbackData, prefix="sv1"):
+    giveaway_id: int
+
+
+class CancelWinners(CallbackData, prefix="cw1"):
+    giveaway_id: int
+
+
+class AddChannel(CallbackData, prefix="ac1"):
+    pass
+
+
+class ConfirmChannel(CallbackData, prefix="cc1"):
+    pass
+
+
+class CancelChannel(CallbackData, prefix="xc1"):
+    pass
+
+
+class CheckSubscriptions(CallbackData, prefix="cs1"):
+    pass
+
+
+class ConfirmPhotos(CallbackData, prefix="bp1"):
+    pass
+
+
+class NoPhotos(CallbackData, prefix="bn1"):
+    pass
+
+
+class CancelBroadcast(CallbackData, prefix="xb1"):
+    pass
+
+
+# Кнопки «Участвовать» старого формата остаются в опубликованных постах навсегда
+LEGACY_PAYLOADS = {
+    "participate": lambda value: Participate(giveaway_id=int(value)),
+}
+
+
+class CallbackDispatcher(BaseMiddleware):
+    """
+    Маршрутизация callback-ов по префиксу CallbackData через словарь.
+    Обработчик получает уже разобранный объект в аргументе callback_data,
+    а цена выбора маршрута не зависит от числа зарегистрированных обработчиков.
+    Callback без известного префикса передается дальше в роутер.
+    """
+
+    def __init__(self):
+        # prefix -> [(класс CallbackData, допустимые состояния, обработчик)]
+        self.routes: Dict[str, list] = {}
+
+    def register(self, callback_data: type, *states: State):
+        """Декоратор регистрации обработчика; без состояний обработчик срабатывает в любом"""
+        allowed = frozenset(state.state for state in states)
+
+        def decorator(callback: Callable[..., Awaitable[Any]]):
+            self.routes.setdefault(callback_data.__prefix__, []).append(
+                (callback_data, allowed, CallableObject(callback))
+            )
+            return callback
+        return decorator
+
+    def decode(self, payload: str):
+        """Возвращает (объект CallbackData, маршруты) или (None, None)"""
+        prefix = payload.split(SEPARATOR, 1)[0]
+        routes = self.routes.get(prefix)
+        if routes is not None:
+            return routes[0][0].unpack(payload), routes
+
+        prefix, _, value = payload.rpartition("_")
+        legacy = LEGACY_PAYLOADS.get(prefix)
+        if legacy is not None:
+            callback_data = legacy(value)
+            return callback_data, self.routes.get(callback_data.__prefix__)
+        return None, None
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            callback_data, routes = self.decode(event.data or "")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Malformed callback data '{event.data}' from user {event.from_user.id}: {str(e)}")
+            callback_data, routes = None, None
+        if not routes:
+            return await handler(event, data)
+
+        raw_state = data.get("raw_state")
+        for _, allowed, callable_object in routes:
+            if not allowed or raw_state in allowed:
+                # Обработчики отсюда минуют роутер, поэтому метрики снимаются здесь
+                with track_handler(callable_object.callback.__name__):
+                    return await callable_object.call(event, **data, callback_data=callback_data)
+        return await handler(event, data)
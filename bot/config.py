@@ -22,6 +22,64 @@ class Config:
     GOOGLE_SHEET_LINK = os.getenv('GOOGLE_SHEET_LINK')
     GOOGLE_SHEETS_FILE_ID = re.search(r'/d/([a-zA-Z0-9-_]+)', GOOGLE_SHEET_LINK).group(1) if GOOGLE_SHEET_LINK else None
     BOT_USERNAME = os.getenv('BOT_USERNAME')
+    DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT', 5000))  # мс ожидания блокировки SQLite
+    DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 100))  # порог медленного запроса
+    DB_QUERY_STATS_SIZE = int(os.getenv('DB_QUERY_STATS_SIZE', 500))  # отпечатков запросов в статистике
+    FSM_TTL = int(os.getenv('FSM_TTL', 86400))  # секунды жизни брошенной FSM-сессии
+    FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', 10000))  # только для процесса, единолично владеющего ключами FSM
+    LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', 6))  # секунды до перехвата аренды лидера
+    LEADER_HEARTBEAT = float(os.getenv('LEADER_HEARTBEAT', 2))
+    SCHEDULER_SYNC_INTERVAL = int(os.getenv('SCHEDULER_SYNC_INTERVAL', 30))  # подхват розыгрышей других воркеров
+    ANNOUNCE_LEASE_TTL = float(os.getenv('ANNOUNCE_LEASE_TTL', 600))  # секунды до повтора прерванного объявления
+    WORKERS = int(os.getenv('WORKERS', 1))  # >1 - фронт-процесс и шардированные воркеры
+    WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', 10000))
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # если не задан, фронт работает через polling
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+    # Префикс callback -> [нажатий, за секунд]
+    THROTTLE_RULES = json.loads(os.getenv(
+        'THROTTLE_RULES',
+        '{"p1:": [3, 10], "participate_": [3, 10], "wp1:": [10, 10], "cs1": [3, 30]}'
+    ))
+    BOT_API_URL = os.getenv('BOT_API_URL')  # свой Bot API сервер, например http://localhost:8081
+    BOT_API_POOL_SIZE = int(os.getenv('BOT_API_POOL_SIZE', 100))  # соединений с Bot API
+    BOT_API_POOL_PER_HOST = int(os.getenv('BOT_API_POOL_PER_HOST', 0))  # 0 - без отдельного лимита
+    BOT_API_KEEPALIVE = float(os.getenv('BOT_API_KEEPALIVE', 60))  # секунды жизни простаивающего соединения
+    BOT_API_DNS_TTL = int(os.getenv('BOT_API_DNS_TTL', 3600))
+    BOT_API_TIMEOUT = float(os.getenv('BOT_API_TIMEOUT', 30))  # секунды на запрос, getUpdates получает свой
+    BOT_API_FAST_JSON = os.getenv('BOT_API_FAST_JSON', '1') == '1'  # orjson, если установлен
+    OUTBOUND_RATE = float(os.getenv('OUTBOUND_RATE', 30))  # сообщений в секунду на бота
+    OUTBOUND_PRIVATE_INTERVAL = float(os.getenv('OUTBOUND_PRIVATE_INTERVAL', 1))  # секунды между сообщениями в личный чат
+    OUTBOUND_GROUP_LIMIT = json.loads(os.getenv('OUTBOUND_GROUP_LIMIT', '[20, 60]'))  # сообщений в группу, за секунд
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))  # повторов после 429
+    BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', 100))  # одновременно отправляемых сообщений рассылки
+    LIVE_COUNTER_INTERVAL = float(os.getenv('LIVE_COUNTER_INTERVAL', 5))  # секунды между правками счетчика на посте
+    THROTTLE_MAX_CONCURRENT = int(os.getenv('THROTTLE_MAX_CONCURRENT', 200))
+    THROTTLE_MAX_USERS = int(os.getenv('THROTTLE_MAX_USERS', 100000))
+    LOG_DIR = os.getenv('LOG_DIR', 'logs')
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = json.loads(os.getenv('LOG_LEVELS', '{"aiogram": "INFO", "apscheduler": "WARNING"}'))  # уровни по модулям
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text или json
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))  # 0 - только по времени
+    LOG_RETENTION = int(os.getenv('LOG_RETENTION', 14))  # файлов после ротации
+    LOG_CONSOLE = os.getenv('LOG_CONSOLE', '1') == '1'
+    LOOP_WATCHDOG = os.getenv('LOOP_WATCHDOG', '1') == '1'
+    LOOP_WATCHDOG_INTERVAL = float(os.getenv('LOOP_WATCHDOG_INTERVAL', 0.5))  # секунды между замерами задержки цикла
+    LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', 0.25))  # секунды, после которых пишется стек
+    LOOP_DEBUG = os.getenv('LOOP_DEBUG', '0') == '1'  # отладка asyncio: медленные колбэки в лог
+    PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', 300))  # предел /profile и /memprofile
+    PROFILE_TRACEMALLOC_FRAMES = int(os.getenv('PROFILE_TRACEMALLOC_FRAMES', 1))  # глубина стека выделений
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # 0 - без /metrics; воркеры занимают следующие порты
+    KEYBOARD_CACHE_SIZE = int(os.getenv('KEYBOARD_CACHE_SIZE', 1024))
+    HANDLER_CONCURRENCY = int(os.getenv('HANDLER_CONCURRENCY', 32))  # одновременно выполняемых обработчиков
+    HANDLER_QUEUE_LIMITS = json.loads(os.getenv(
+        'HANDLER_QUEUE_LIMITS',
+        '{"admin": 100, "interactive": 2000, "background": 200}'
+    ))
 
 
 def is_admin(user_id: int):
@@ -1,16 +1,33 @@
-import aiosqlite
 import json
+import time
+import aiosqlite
+from datetime import datetime
 from bot.config import Config
 from bot.logger import logger
+from bot.metrics import instrument
+from bot.query_log import InstrumentedConnection
 
 
 db_connection = None
 
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"  # формат announcement_date
+
+
+async def open_connection(db_path: str = None):
+    """
+    Открывает соединение с БД в режиме WAL, чтобы с базой могли работать несколько процессов.
+    Запросы соединения замеряются, медленные попадают в лог и /slow_queries.
+    """
+    connection = await aiosqlite.connect(db_path or Config.DB_URL)
+    await connection.execute("PRAGMA journal_mode=WAL")
+    await connection.execute(f"PRAGMA busy_timeout={Config.DB_BUSY_TIMEOUT}")
+    return InstrumentedConnection(connection)
+
 
 async def init_db():
     global db_connection
     try:
-        db_connection = await aiosqlite.connect(Config.DB_URL)
+        db_connection = await open_connection()
         # Создаем таблицы, если они не существуют
         await db_connection.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -29,9 +46,22 @@ async def init_db():
                 winners_count INTEGER NOT NULL,
                 announcement_date TEXT NOT NULL,
                 channel_id INTEGER NOT NULL,
-                winners_ids TEXT DEFAULT '[]'
+                winners_ids TEXT DEFAULT '[]',  -- устарело, победители в giveaway_winners
+                announced_at TEXT DEFAULT NULL,
+                message_id INTEGER DEFAULT NULL,  -- пост розыгрыша в канале
+                participants_count INTEGER NOT NULL DEFAULT 0,
+                announce_lease_until REAL DEFAULT NULL  -- до какого времени розыгрыш объявляет воркер
             )
         ''')
+        await _add_column_if_missing("giveaways", "announced_at", "TEXT DEFAULT NULL")
+        await _add_column_if_missing("giveaways", "message_id", "INTEGER DEFAULT NULL")
+        await _add_column_if_missing("giveaways", "announce_lease_until", "REAL DEFAULT NULL")
+        await _normalize_announcement_dates()
+        # Активные розыгрыши: еще не объявленные, по дате окончания
+        await db_connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_giveaways_active ON giveaways(announcement_date, id) "
+            "WHERE announced_at IS NULL"
+        )
         await db_connection.execute('''
             CREATE TABLE IF NOT EXISTS participants (
                 giveaway_id INTEGER,
@@ -41,6 +71,27 @@ async def init_db():
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
         ''')
+        await db_connection.execute('''
+            CREATE TABLE IF NOT EXISTS giveaway_winners (
+                giveaway_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                source TEXT NOT NULL DEFAULT 'manual',
+                position INTEGER NOT NULL,
+                notify_status TEXT DEFAULT NULL,  -- sent / blocked / failed
+                notified_at TEXT DEFAULT NULL,
+                PRIMARY KEY (giveaway_id, user_id),
+                FOREIGN KEY (giveaway_id) REFERENCES giveaways(id),
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        ''')
+        await _add_column_if_missing("giveaway_winners", "notify_status", "TEXT DEFAULT NULL")
+        await _add_column_if_missing("giveaway_winners", "notified_at", "TEXT DEFAULT NULL")
+        await _migrate_winners_ids()
+        if await _add_column_if_missing("giveaways", "participants_count", "INTEGER NOT NULL DEFAULT 0"):
+            await db_connection.execute(
+                "UPDATE giveaways SET participants_count = "
+                "(SELECT COUNT(*) FROM participants WHERE giveaway_id = giveaways.id)"
+            )
         await db_connection.execute('''
             CREATE TABLE IF NOT EXISTS channels (
                 channel_id INTEGER PRIMARY KEY,
@@ -48,6 +99,35 @@ async def init_db():
                 added_date TEXT DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        await db_connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username COLLATE NOCASE)"
+        )
+        await _create_archive_tables()
+        await db_connection.execute('''
+            CREATE TABLE IF NOT EXISTS referrals (
+                referrer_id INTEGER NOT NULL,
+                referee_id INTEGER NOT NULL UNIQUE,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        await db_connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)"
+        )
+        # Гистограмма "сколько пользователей пригласили ровно N друзей" для ранга за O(log n);
+        # создается до миграции referrals, которая ее пересчитывает
+        await db_connection.execute('''
+            CREATE TABLE IF NOT EXISTS referral_count_histogram (
+                invited INTEGER PRIMARY KEY,
+                users INTEGER NOT NULL
+            )
+        ''')
+        await db_connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_invited ON users(invited_friends DESC, user_id)"
+        )
+        await _migrate_referrals()
+        cursor = await db_connection.execute("SELECT 1 FROM referral_count_histogram LIMIT 1")
+        if not await cursor.fetchone():
+            await _rebuild_referral_histogram()
         await db_connection.commit()
         logger.info("Database initialized successfully")
     except Exception as e:
@@ -55,42 +135,211 @@ async def init_db():
         raise
 
 
+async def connect_db():
+    """Открывает соединение без создания таблиц и миграций: схему уже подготовил init_db"""
+    global db_connection
+    db_connection = await open_connection()
+
+
+async def close_db():
+    global db_connection
+    if db_connection is not None:
+        await db_connection.close()
+        db_connection = None
+
+
+async def _add_column_if_missing(table: str, column: str, definition: str):
+    """Миграция старых баз: добавляет колонку, если ее еще нет"""
+    cursor = await db_connection.execute(f"PRAGMA table_info({table})")
+    columns = [row[1] for row in await cursor.fetchall()]
+    if column not in columns:
+        await db_connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info(f"Column {table}.{column} added")
+        return True
+    return False
+
+
+async def _normalize_announcement_dates():
+    """Приводит старые даты вида ДД.ММ.ГГГГ ЧЧ:ММ к ГГГГ-ММ-ДД ЧЧ:ММ:СС, чтобы их можно было сравнивать строками"""
+    cursor = await db_connection.execute(
+        "UPDATE giveaways SET announcement_date = "
+        "substr(announcement_date, 7, 4) || '-' || substr(announcement_date, 4, 2) || '-' || "
+        "substr(announcement_date, 1, 2) || ' ' || substr(announcement_date, 12, 5) || ':00' "
+        "WHERE announcement_date GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9] [0-9][0-9]:[0-9][0-9]'"
+    )
+    if cursor.rowcount:
+        logger.info(f"{cursor.rowcount} giveaway dates normalized")
+
+
+def _now() -> str:
+    """Текущее локальное время в формате announcement_date; планировщик тоже работает в локальном"""
+    return datetime.now().strftime(DATE_FORMAT)
+
+
+async def _create_archive_tables():
+    """Архив завершенных розыгрышей. Горячие запросы его не читают, индексы только для отчетов"""
+    await db_connection.execute('''
+        CREATE TABLE IF NOT EXISTS giveaways_archive (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            winners_count INTEGER NOT NULL,
+            announcement_date TEXT NOT NULL,
+            channel_id INTEGER NOT NULL,
+            announced_at TEXT,
+            archived_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db_connection.execute('''
+        CREATE TABLE IF NOT EXISTS participants_archive (
+            giveaway_id INTEGER,
+            user_id INTEGER,
+            PRIMARY KEY (giveaway_id, user_id)
+        )
+    ''')
+    await db_connection.execute('''
+        CREATE TABLE IF NOT EXISTS giveaway_winners_archive (
+            giveaway_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            notify_status TEXT,
+            notified_at TEXT,
+            PRIMARY KEY (giveaway_id, user_id)
+        )
+    ''')
+    await _add_column_if_missing("giveaway_winners_archive", "notify_status", "TEXT")
+    await _add_column_if_missing("giveaway_winners_archive", "notified_at", "TEXT")
+    await db_connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_giveaways_archive_date ON giveaways_archive(announcement_date)"
+    )
+    await db_connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_giveaways_archive_channel ON giveaways_archive(channel_id)"
+    )
+    await db_connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_participants_archive_user ON participants_archive(user_id)"
+    )
+    await db_connection.execute(
+        "CREATE INDEX IF NOT EXISTS idx_giveaway_winners_archive_user ON giveaway_winners_archive(user_id)"
+    )
+
+
+async def _rebuild_referral_histogram():
+    await db_connection.execute("DELETE FROM referral_count_histogram")
+    await db_connection.execute(
+        "INSERT INTO referral_count_histogram (invited, users) "
+        "SELECT invited_friends, COUNT(*) FROM users WHERE invited_friends > 0 GROUP BY invited_friends"
+    )
+    await db_connection.commit()
+
+
+async def _migrate_referrals():
+    """Заполняет журнал referrals из users.referrer_id и пересчитывает счетчики по нему"""
+    cursor = await db_connection.execute("SELECT 1 FROM referrals LIMIT 1")
+    if await cursor.fetchone():
+        return
+    cursor = await db_connection.execute(
+        "INSERT OR IGNORE INTO referrals (referrer_id, referee_id) "
+        "SELECT referrer_id, user_id FROM users WHERE referrer_id IS NOT NULL AND referrer_id != user_id"
+    )
+    if cursor.rowcount:
+        logger.info(f"Migrated {cursor.rowcount} referrals from users.referrer_id")
+        await recompute_referral_counts()
+
+
+async def _migrate_winners_ids():
+    """Переносит победителей из JSON-колонки giveaways.winners_ids в таблицу giveaway_winners"""
+    cursor = await db_connection.execute(
+        "INSERT OR IGNORE INTO giveaway_winners (giveaway_id, user_id, source, position) "
+        "SELECT g.id, j.value, 'manual', j.key FROM giveaways g, json_each(g.winners_ids) j "
+        "WHERE g.winners_ids IS NOT NULL AND g.winners_ids NOT IN ('', '[]')"
+    )
+    if cursor.rowcount:
+        await db_connection.execute(
+            "UPDATE giveaways SET winners_ids = '[]' WHERE winners_ids IS NOT NULL AND winners_ids NOT IN ('', '[]')"
+        )
+        logger.info(f"Migrated {cursor.rowcount} winners from giveaways.winners_ids")
+
+
 async def add_user(user_id: int, username: str, fullname: str, referrer_id: int = None):
-    """Добавляет пользователя с проверками"""
-    try:
-        async with db_connection.execute("BEGIN TRANSACTION"):
-            # Проверяем, есть ли уже такой пользователь
-            existing_user = await get_user_info(user_id)
-            
-            if existing_user:
-                # Если пользователь уже есть, обновляем данные, но не меняем реферера
-                await db_connection.execute(
-                    "UPDATE users SET username = ?, fullname = ? WHERE user_id = ?",
-                    (username, fullname, user_id)
+    """
+    Регистрирует или обновляет пользователя одной транзакцией.
+    Реферал засчитывается только новому пользователю, только существующему рефереру
+    и только один раз (referee_id уникален в referrals).
+    Возвращает словарь: is_new_user - пользователь создан этим вызовом,
+    referral_counted - реферал засчитан, invited_count - новое число приглашенных у реферера или None.
+    """
+    try:
+        # Реферер сохраняется, только если он уже зарегистрирован
+        cursor = await db_connection.execute(
+            "INSERT OR IGNORE INTO users (user_id, username, fullname, referrer_id) "
+            "VALUES (?, ?, ?, (SELECT user_id FROM users WHERE user_id = ? AND user_id != ?))",
+            (user_id, username, fullname, referrer_id, user_id)
+        )
+        is_new_user = cursor.rowcount == 1
+        if not is_new_user:
+            # Если пользователь уже есть, обновляем данные, но не меняем реферера
+            await db_connection.execute(
+                "UPDATE users SET username = ?, fullname = ? WHERE user_id = ?",
+                (username, fullname, user_id)
+            )
+        
+        invited_count = None
+        if is_new_user and referrer_id and referrer_id != user_id:
+            cursor = await db_connection.execute(
+                "INSERT OR IGNORE INTO referrals (referrer_id, referee_id) "
+                "SELECT ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE user_id = ?)",
+                (referrer_id, user_id, referrer_id)
+            )
+            if cursor.rowcount == 1:
+                # Счетчик меняется атомарно в SQL, без чтения в Python
+                cursor = await db_connection.execute(
+                    "UPDATE users SET invited_friends = invited_friends + 1 WHERE user_id = ? "
+                    "RETURNING invited_friends",
+                    (referrer_id,)
                 )
-            else:
-                # Нового пользователя добавляем с реферером (если он указан)
+                invited_count = (await cursor.fetchone())[0]
+                # Реферер переходит из корзины invited_count - 1 в корзину invited_count
                 await db_connection.execute(
-                    "INSERT INTO users (user_id, username, fullname, referrer_id) "
-                    "VALUES (?, ?, ?, ?)",
-                    (user_id, username, fullname, referrer_id)
+                    "UPDATE referral_count_histogram SET users = users - 1 WHERE invited = ?",
+                    (invited_count - 1,)
                 )
-            
-            # Увеличиваем счетчик приглашенных у реферера
-            if referrer_id and not await has_referral_bonus(user_id, referrer_id):
                 await db_connection.execute(
-                    "UPDATE users SET invited_friends = invited_friends + 1 "
-                    "WHERE user_id = ?",
-                    (referrer_id,)
+                    "INSERT INTO referral_count_histogram (invited, users) VALUES (?, 1) "
+                    "ON CONFLICT(invited) DO UPDATE SET users = users + 1",
+                    (invited_count,)
                 )
-            
-            await db_connection.commit()
+        
+        await db_connection.commit()
         logger.info(f"User {user_id} added/updated successfully")
+        return {
+            'is_new_user': is_new_user,
+            'referral_counted': invited_count is not None,
+            'invited_count': invited_count
+        }
     except Exception as e:
+        await db_connection.rollback()
         logger.error(f"Error in add_user for user {user_id}: {str(e)}")
         raise
 
 
+async def recompute_referral_counts():
+    """Пересчитывает invited_friends всех пользователей по журналу referrals"""
+    try:
+        cursor = await db_connection.execute(
+            "UPDATE users SET invited_friends = "
+            "(SELECT COUNT(*) FROM referrals r WHERE r.referrer_id = users.user_id) "
+            "WHERE invited_friends IS NOT "
+            "(SELECT COUNT(*) FROM referrals r WHERE r.referrer_id = users.user_id)"
+        )
+        await _rebuild_referral_histogram()
+        await db_connection.commit()
+        logger.info(f"Referral counters recomputed, {cursor.rowcount} users updated")
+        return cursor.rowcount
+    except Exception as e:
+        logger.error(f"Error in recompute_referral_counts: {str(e)}")
+        raise
+
+
 async def create_giveaway(name: str, winners_count: int, announcement_date: str, channel_id: int):
     """Создает новый розыгрыш и возвращает его ID"""
     try:
@@ -107,26 +356,73 @@ async def create_giveaway(name: str, winners_count: int, announcement_date: str,
         raise
 
 
+async def create_giveaways(name: str, winners_count: int, announcement_date: str, channel_ids: list) -> dict:
+    """Создает розыгрыш в каждом канале одной транзакцией и возвращает channel_id -> ID розыгрыша"""
+    try:
+        await db_connection.execute("BEGIN TRANSACTION")
+        giveaway_ids = {}
+        for channel_id in channel_ids:
+            cursor = await db_connection.execute(
+                "INSERT INTO giveaways (name, winners_count, announcement_date, channel_id) VALUES (?, ?, ?, ?) RETURNING id",
+                (name, winners_count, announcement_date, channel_id)
+            )
+            giveaway_ids[channel_id] = (await cursor.fetchone())[0]
+        await db_connection.commit()
+        logger.info(f"Giveaways {list(giveaway_ids.values())} created successfully")
+        return giveaway_ids
+    except Exception as e:
+        await db_connection.rollback()
+        logger.error(f"Error in create_giveaways: {str(e)}")
+        raise
+
+
 async def add_participant(giveaway_id: int, user_id: int):
+    """Записывает участника и возвращает новое число участников или None, если он уже участвует"""
     try:
-        await db_connection.execute(
+        cursor = await db_connection.execute(
             "INSERT OR IGNORE INTO participants (giveaway_id, user_id) VALUES (?, ?)",
             (giveaway_id, user_id)
         )
+        if cursor.rowcount != 1:
+            # Вставка ничего не изменила, но неявная транзакция sqlite3 уже открыта
+            # и держит блокировку записи - закрываем ее до выхода
+            await db_connection.rollback()
+            return None
+        cursor = await db_connection.execute(
+            "UPDATE giveaways SET participants_count = participants_count + 1 WHERE id = ? "
+            "RETURNING participants_count",
+            (giveaway_id,)
+        )
+        row = await cursor.fetchone()
         await db_connection.commit()
         logger.info(f"User {user_id} added to giveaway {giveaway_id}")
+        return row[0] if row else 0
     except Exception as e:
+        await db_connection.rollback()
         logger.error(f"Error in add_participant: {str(e)}")
         raise
 
 
+async def set_giveaway_messages(messages: dict):
+    """Запоминает посты розыгрышей в каналах (giveaway_id -> message_id) для счетчика участников"""
+    try:
+        await db_connection.executemany(
+            "UPDATE giveaways SET message_id = ? WHERE id = ?",
+            [(message_id, giveaway_id) for giveaway_id, message_id in messages.items()]
+        )
+        await db_connection.commit()
+    except Exception as e:
+        logger.error(f"Error in set_giveaway_messages: {str(e)}")
+
+
 async def get_active_giveaways():
     """Возвращает список активных розыгрышей (дата окончания еще не наступила)"""
     try:
         cursor = await db_connection.execute(
             "SELECT id, name, channel_id FROM giveaways "
-            "WHERE datetime(announcement_date) > datetime('now') "
-            "ORDER BY announcement_date"
+            "WHERE announced_at IS NULL AND announcement_date > ? "
+            "ORDER BY announcement_date, id",
+            (_now(),)
         )
         return await cursor.fetchall()
     except Exception as e:
@@ -134,6 +430,45 @@ async def get_active_giveaways():
         return []
 
 
+async def get_active_giveaways_page(page: int = 0, limit: int = 5):
+    """Страница активных розыгрышей для админа с числом участников и выбранных победителей"""
+    try:
+        cursor = await db_connection.execute(
+            "SELECT g.id, g.name, g.winners_count, g.announcement_date, g.participants_count, "
+            "(SELECT COUNT(*) FROM giveaway_winners w WHERE w.giveaway_id = g.id), "
+            "COUNT(*) OVER () "
+            "FROM giveaways g "
+            "WHERE g.announced_at IS NULL AND g.announcement_date > ? "
+            "ORDER BY g.announcement_date, g.id LIMIT ? OFFSET ?",
+            (_now(), limit, page * limit)
+        )
+        rows = await cursor.fetchall()
+        if not rows and page > 0:
+            # Страница опустела (розыгрыши завершились) - считаем, сколько их осталось
+            cursor = await db_connection.execute(
+                "SELECT COUNT(*) FROM giveaways WHERE announced_at IS NULL AND announcement_date > ?",
+                (_now(),)
+            )
+            return {'total': (await cursor.fetchone())[0], 'giveaways': []}
+        return {
+            'total': rows[0][6] if rows else 0,
+            'giveaways': [
+                {
+                    'id': row[0],
+                    'name': row[1],
+                    'winners_count': row[2],
+                    'announcement_date': row[3],
+                    'participants_count': row[4],
+                    'winners_selected': row[5]
+                }
+                for row in rows
+            ]
+        }
+    except Exception as e:
+        logger.error(f"Error in get_active_giveaways_page: {str(e)}")
+        return {'total': 0, 'giveaways': []}
+
+
 async def get_giveaway_details(giveaway_id: int):
     try:
         cursor = await db_connection.execute(
@@ -147,6 +482,66 @@ async def get_giveaway_details(giveaway_id: int):
         return None
 
 
+async def get_participants_count(giveaway_id: int):
+    try:
+        cursor = await db_connection.execute(
+            "SELECT participants_count FROM giveaways WHERE id = ?", (giveaway_id,)
+        )
+        result = await cursor.fetchone()
+        return result[0] if result else None
+    except Exception as e:
+        logger.error(f"Error in get_participants_count for giveaway {giveaway_id}: {str(e)}")
+        return None
+
+
+async def claim_giveaway_announcement(giveaway_id: int, lease_ttl: float = None) -> bool:
+    """
+    Атомарно берет аренду на объявление розыгрыша. False - розыгрыш уже объявлен
+    или его объявляет другой воркер. Если объявляющий упал, не сняв аренду,
+    розыгрыш можно забрать после ее истечения
+    """
+    try:
+        now = time.time()
+        cursor = await db_connection.execute(
+            "UPDATE giveaways SET announce_lease_until = ? "
+            "WHERE id = ? AND announced_at IS NULL "
+            "AND (announce_lease_until IS NULL OR announce_lease_until < ?)",
+            (now + (lease_ttl or Config.ANNOUNCE_LEASE_TTL), giveaway_id, now)
+        )
+        await db_connection.commit()
+        return cursor.rowcount == 1
+    except Exception as e:
+        logger.error(f"Error in claim_giveaway_announcement for giveaway {giveaway_id}: {str(e)}")
+        return False
+
+
+async def finish_giveaway_announcement(giveaway_id: int) -> bool:
+    """Отмечает розыгрыш объявленным; после этого его больше не объявляют повторно"""
+    try:
+        cursor = await db_connection.execute(
+            "UPDATE giveaways SET announced_at = CURRENT_TIMESTAMP, announce_lease_until = NULL "
+            "WHERE id = ? AND announced_at IS NULL",
+            (giveaway_id,)
+        )
+        await db_connection.commit()
+        return cursor.rowcount == 1
+    except Exception as e:
+        logger.error(f"Error in finish_giveaway_announcement for giveaway {giveaway_id}: {str(e)}")
+        return False
+
+
+async def release_giveaway_announcement(giveaway_id: int):
+    """Снимает аренду после неудачного объявления, чтобы ближайшая синхронизация лидера повторила его"""
+    try:
+        await db_connection.execute(
+            "UPDATE giveaways SET announce_lease_until = NULL WHERE id = ? AND announced_at IS NULL",
+            (giveaway_id,)
+        )
+        await db_connection.commit()
+    except Exception as e:
+        logger.error(f"Error in release_giveaway_announcement for giveaway {giveaway_id}: {str(e)}")
+
+
 async def get_participants(giveaway_id: int):
     try:
         cursor = await db_connection.execute(
@@ -158,19 +553,204 @@ async def get_participants(giveaway_id: int):
         return []
 
 
-async def set_winners(giveaway_id: int, winners_ids: list):
+async def get_participants_page(giveaway_id: int, after_user_id: int = 0, before_user_id: int = None,
+                                limit: int = 10, search: str = None):
+    """
+    Страница участников для выбора победителей одним запросом.
+    Keyset-пагинация по user_id: after_user_id - следующая страница, before_user_id - предыдущая.
+    Вместе со страницей возвращает лимит победителей, число выбранных и общее число участников.
+    """
     try:
-        await db_connection.execute(
-            "UPDATE giveaways SET winners_ids = ? WHERE id = ?",
-            (json.dumps(winners_ids), giveaway_id)
+        filters = ["p.giveaway_id = :giveaway_id"]
+        params = {"giveaway_id": giveaway_id, "limit": limit + 1}
+        if search:
+            escaped = search.lstrip("@").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            filters.append("u.username LIKE :search ESCAPE '\\'")
+            params["search"] = f"{escaped}%"
+        if before_user_id is not None:
+            cursor_condition = "p.user_id < :before"
+            params["before"] = before_user_id
+            order = "DESC"
+            # Назад листают только со следующей страницы, поэтому она точно есть
+            has_prev_sql = "0"
+        else:
+            cursor_condition = "p.user_id > :after"
+            params["after"] = after_user_id
+            order = "ASC"
+            # Курсор не обязан быть id участника (после отметки победителя это первый id - 1),
+            # поэтому наличие предыдущей страницы проверяется по самим участникам
+            has_prev_sql = (
+                "EXISTS (SELECT 1 FROM participants p JOIN users u ON u.user_id = p.user_id "
+                f"WHERE {' AND '.join(filters)} AND p.user_id <= :after)"
+            )
+
+        cursor = await db_connection.execute(
+            f"""
+            WITH page AS (
+                SELECT p.user_id, u.username, u.fullname
+                FROM participants p JOIN users u ON u.user_id = p.user_id
+                WHERE {' AND '.join(filters + [cursor_condition])}
+                ORDER BY p.user_id {order}
+                LIMIT :limit
+            )
+            SELECT g.winners_count,
+                   (SELECT COUNT(*) FROM giveaway_winners WHERE giveaway_id = g.id),
+                   g.participants_count,
+                   page.user_id, page.username, page.fullname,
+                   EXISTS (SELECT 1 FROM giveaway_winners w WHERE w.giveaway_id = g.id AND w.user_id = page.user_id),
+                   {has_prev_sql}
+            FROM giveaways g LEFT JOIN page
+            WHERE g.id = :giveaway_id
+            ORDER BY page.user_id
+            """,
+            params
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            return None
+
+        participants = [{
+            'user_id': row[3],
+            'username': row[4],
+            'fullname': row[5],
+            'is_winner': bool(row[6])
+        } for row in rows if row[3] is not None]
+        has_more = len(participants) > limit
+        if has_more:
+            # Лишняя строка нужна только чтобы узнать, есть ли страница дальше
+            participants = participants[1:] if before_user_id is not None else participants[:limit]
+
+        return {
+            'winners_count': rows[0][0],
+            'winners_selected': rows[0][1],
+            'total': rows[0][2],
+            'participants': participants,
+            'has_next': has_more if before_user_id is None else True,
+            'has_prev': has_more if before_user_id is not None else bool(rows[0][7])
+        }
+    except Exception as e:
+        logger.error(f"Error in get_participants_page for giveaway {giveaway_id}: {str(e)}")
+        return None
+
+
+async def get_participant_page_cursor(giveaway_id: int, page: int, limit: int = 10) -> int:
+    """Курсор (after_user_id) для перехода сразу на страницу page"""
+    if page <= 0:
+        return 0
+    try:
+        cursor = await db_connection.execute(
+            "SELECT user_id FROM participants WHERE giveaway_id = ? ORDER BY user_id LIMIT 1 OFFSET ?",
+            (giveaway_id, page * limit - 1)
+        )
+        result = await cursor.fetchone()
+        return result[0] if result else None
+    except Exception as e:
+        logger.error(f"Error in get_participant_page_cursor for giveaway {giveaway_id}: {str(e)}")
+        return None
+
+
+async def get_winners(giveaway_id: int):
+    """Победители розыгрыша в порядке выбора"""
+    try:
+        cursor = await db_connection.execute(
+            "SELECT user_id FROM giveaway_winners WHERE giveaway_id = ? ORDER BY position",
+            (giveaway_id,)
+        )
+        return [row[0] for row in await cursor.fetchall()]
+    except Exception as e:
+        logger.error(f"Error in get_winners for giveaway {giveaway_id}: {str(e)}")
+        return []
+
+
+async def count_winners(giveaway_id: int) -> int:
+    try:
+        cursor = await db_connection.execute(
+            "SELECT COUNT(*) FROM giveaway_winners WHERE giveaway_id = ?", (giveaway_id,)
+        )
+        return (await cursor.fetchone())[0]
+    except Exception as e:
+        logger.error(f"Error in count_winners for giveaway {giveaway_id}: {str(e)}")
+        return 0
+
+
+async def is_winner(giveaway_id: int, user_id: int) -> bool:
+    try:
+        cursor = await db_connection.execute(
+            "SELECT 1 FROM giveaway_winners WHERE giveaway_id = ? AND user_id = ?",
+            (giveaway_id, user_id)
+        )
+        return await cursor.fetchone() is not None
+    except Exception as e:
+        logger.error(f"Error in is_winner for user {user_id} in giveaway {giveaway_id}: {str(e)}")
+        return False
+
+
+async def toggle_winner(giveaway_id: int, user_id: int):
+    """
+    Отмечает/снимает победителя одним индексированным INSERT или DELETE.
+    Возвращает 'added', 'removed', 'limit' (лимит победителей достигнут) или None, если розыгрыша нет.
+    """
+    try:
+        cursor = await db_connection.execute(
+            "DELETE FROM giveaway_winners WHERE giveaway_id = ? AND user_id = ?",
+            (giveaway_id, user_id)
+        )
+        if cursor.rowcount:
+            await db_connection.commit()
+            return 'removed'
+
+        # Проверка лимита и вставка в одном запросе, чтобы параллельные нажатия не превысили лимит
+        cursor = await db_connection.execute(
+            "INSERT INTO giveaway_winners (giveaway_id, user_id, source, position) "
+            "SELECT g.id, ?, 'manual', "
+            "COALESCE((SELECT MAX(position) FROM giveaway_winners WHERE giveaway_id = g.id), -1) + 1 "
+            "FROM giveaways g WHERE g.id = ? "
+            "AND (SELECT COUNT(*) FROM giveaway_winners WHERE giveaway_id = g.id) < g.winners_count",
+            (user_id, giveaway_id)
+        )
+        await db_connection.commit()
+        if cursor.rowcount:
+            return 'added'
+
+        cursor = await db_connection.execute("SELECT 1 FROM giveaways WHERE id = ?", (giveaway_id,))
+        return 'limit' if await cursor.fetchone() else None
+    except Exception as e:
+        logger.error(f"Error in toggle_winner for user {user_id} in giveaway {giveaway_id}: {str(e)}")
+        raise
+
+
+async def add_winners(giveaway_id: int, winners_ids: list, source: str = 'auto'):
+    """Добавляет победителей в конец списка розыгрыша"""
+    try:
+        cursor = await db_connection.execute(
+            "SELECT COALESCE(MAX(position), -1) + 1 FROM giveaway_winners WHERE giveaway_id = ?",
+            (giveaway_id,)
+        )
+        next_position = (await cursor.fetchone())[0]
+        await db_connection.executemany(
+            "INSERT OR IGNORE INTO giveaway_winners (giveaway_id, user_id, source, position) VALUES (?, ?, ?, ?)",
+            [(giveaway_id, user_id, source, next_position + i) for i, user_id in enumerate(winners_ids)]
         )
         await db_connection.commit()
-        logger.info(f"Winners set for giveaway {giveaway_id}")
+        logger.info(f"{len(winners_ids)} {source} winners added to giveaway {giveaway_id}")
     except Exception as e:
-        logger.error(f"Error in set_winners for giveaway {giveaway_id}: {str(e)}")
+        logger.error(f"Error in add_winners for giveaway {giveaway_id}: {str(e)}")
         raise
 
 
+async def set_winners_notify_status(giveaway_id: int, statuses: dict):
+    """Сохраняет итог уведомления победителей: user_id -> sent / blocked / failed"""
+    try:
+        await db_connection.executemany(
+            "UPDATE giveaway_winners SET notify_status = ?, notified_at = CURRENT_TIMESTAMP "
+            "WHERE giveaway_id = ? AND user_id = ?",
+            [(status, giveaway_id, user_id) for user_id, status in statuses.items()]
+        )
+        await db_connection.commit()
+    except Exception as e:
+        logger.error(f"Error in set_winners_notify_status for giveaway {giveaway_id}: {str(e)}")
+
+
 async def get_invited_count(user_id: int):
     try:
         cursor = await db_connection.execute(
@@ -201,6 +781,10 @@ async def delete_giveaway(giveaway_id: int):
             "DELETE FROM participants WHERE giveaway_id = ?",
             (giveaway_id,)
         )
+        await db_connection.execute(
+            "DELETE FROM giveaway_winners WHERE giveaway_id = ?",
+            (giveaway_id,)
+        )
         await db_connection.execute(
             "DELETE FROM giveaways WHERE id = ?",
             (giveaway_id,)
@@ -214,6 +798,70 @@ async def delete_giveaway(giveaway_id: int):
         return False
 
 
+async def archive_giveaway(giveaway_id: int):
+    """Переносит завершенный розыгрыш, его участников и победителей в архив одной транзакцией"""
+    try:
+        await db_connection.execute("BEGIN TRANSACTION")
+        await db_connection.execute(
+            "INSERT OR REPLACE INTO giveaways_archive "
+            "(id, name, winners_count, announcement_date, channel_id, announced_at) "
+            "SELECT id, name, winners_count, announcement_date, channel_id, announced_at "
+            "FROM giveaways WHERE id = ?",
+            (giveaway_id,)
+        )
+        await db_connection.execute(
+            "INSERT OR IGNORE INTO participants_archive (giveaway_id, user_id) "
+            "SELECT giveaway_id, user_id FROM participants WHERE giveaway_id = ?",
+            (giveaway_id,)
+        )
+        await db_connection.execute(
+            "INSERT OR IGNORE INTO giveaway_winners_archive "
+            "(giveaway_id, user_id, source, position, notify_status, notified_at) "
+            "SELECT giveaway_id, user_id, source, position, notify_status, notified_at "
+            "FROM giveaway_winners WHERE giveaway_id = ?",
+            (giveaway_id,)
+        )
+        await db_connection.execute("DELETE FROM participants WHERE giveaway_id = ?", (giveaway_id,))
+        await db_connection.execute("DELETE FROM giveaway_winners WHERE giveaway_id = ?", (giveaway_id,))
+        await db_connection.execute("DELETE FROM giveaways WHERE id = ?", (giveaway_id,))
+        await db_connection.commit()
+        logger.info(f"Giveaway {giveaway_id} archived successfully")
+        return True
+    except Exception as e:
+        await db_connection.rollback()
+        logger.error(f"Error in archive_giveaway for giveaway {giveaway_id}: {str(e)}")
+        return False
+
+
+async def iter_archived_giveaways(batch_size: int = 500):
+    """Выгрузка архива пачками (keyset по id): розыгрыш, число участников и победители по порядку"""
+    last_id = 0
+    while True:
+        cursor = await db_connection.execute(
+            "SELECT g.id, g.name, g.winners_count, g.announcement_date, g.channel_id, g.announced_at, "
+            "(SELECT COUNT(*) FROM participants_archive WHERE giveaway_id = g.id), "
+            "(SELECT group_concat(user_id) FROM "
+            "(SELECT user_id FROM giveaway_winners_archive WHERE giveaway_id = g.id ORDER BY position)) "
+            "FROM giveaways_archive g WHERE g.id > ? ORDER BY g.id LIMIT ?",
+            (last_id, batch_size)
+        )
+        rows = await cursor.fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield {
+                'id': row[0],
+                'name': row[1],
+                'winners_count': row[2],
+                'announcement_date': row[3],
+                'channel_id': row[4],
+                'announced_at': row[5],
+                'participants_count': row[6],
+                'winners_ids': [int(user_id) for user_id in row[7].split(',')] if row[7] else []
+            }
+        last_id = rows[-1][0]
+
+
 async def get_user_info(user_id: int):
     try:
         cursor = await db_connection.execute(
@@ -234,6 +882,28 @@ async def get_user_info(user_id: int):
         return None
 
 
+async def get_users_info(user_ids: list) -> dict:
+    """Пользователи одним запросом: user_id -> то же, что возвращает get_user_info"""
+    try:
+        cursor = await db_connection.execute(
+            "SELECT user_id, username, fullname, invited_friends FROM users "
+            "WHERE user_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(user_ids)),)
+        )
+        return {
+            row[0]: {
+                'user_id': row[0],
+                'username': row[1],
+                'fullname': row[2],
+                'invited_friends': row[3] or 0
+            }
+            for row in await cursor.fetchall()
+        }
+    except Exception as e:
+        logger.error(f"Error in get_users_info: {str(e)}")
+        return {}
+
+
 async def get_all_users():
     try:
         cursor = await db_connection.execute("SELECT * FROM users")
@@ -309,16 +979,29 @@ async def get_channel(channel_id: int):
         return None
 
 
+async def get_channels(channel_ids: list) -> dict:
+    """Названия каналов одним запросом: channel_id -> title"""
+    try:
+        cursor = await db_connection.execute(
+            "SELECT channel_id, title FROM channels WHERE channel_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(channel_ids)),)
+        )
+        return {row[0]: row[1] for row in await cursor.fetchall()}
+    except Exception as e:
+        logger.error(f"Error in get_channels: {str(e)}")
+        return {}
+
+
 async def get_giveaway_status(giveaway_id: int):
     try:
         cursor = await db_connection.execute(
-            "SELECT winners_ids, announcement_date FROM giveaways WHERE id = ?", 
+            "SELECT announcement_date FROM giveaways WHERE id = ?", 
             (giveaway_id,)
         )
         result = await cursor.fetchone()
         return {
-            'winners_ids': json.loads(result[0]) if result[0] else [],
-            'announcement_date': result[1]
+            'winners_ids': await get_winners(giveaway_id),
+            'announcement_date': result[0]
         } if result else None
     except Exception as e:
         logger.error(f"Error in get_giveaway_status for giveaway {giveaway_id}: {str(e)}")
@@ -350,35 +1033,61 @@ async def get_user_referral_status(user_id: int):
         return None
 
 
-async def has_referral_bonus(user_id: int, referrer_id: int) -> bool:
+async def get_referral_stats(user_id: int):
+    """Число приглашенных и место в рейтинге одним запросом. None - пользователь не зарегистрирован"""
     try:
         cursor = await db_connection.execute(
-            "SELECT 1 FROM users WHERE user_id = ? AND referrer_id = ?",
-            (user_id, referrer_id)
+            "SELECT u.invited_friends, "
+            "(SELECT COALESCE(SUM(h.users), 0) + 1 FROM referral_count_histogram h "
+            "WHERE h.invited > u.invited_friends) "
+            "FROM users u WHERE u.user_id = ?",
+            (user_id,)
         )
-        return await cursor.fetchone() is not None
+        result = await cursor.fetchone()
+        return {
+            'invited_friends': result[0] or 0,
+            'rank': result[1]
+        } if result else None
     except Exception as e:
-        logger.error(f"Error in has_referral_bonus for user {user_id} and referrer {referrer_id}: {str(e)}")
-        return False
+        logger.error(f"Error in get_referral_stats for user {user_id}: {str(e)}")
+        return None
 
 
-async def update_user_invited_count(user_id: int, new_count: int):
+async def get_referral_leaderboard(limit: int = 10):
+    """Топ пользователей по числу приглашенных (по индексу idx_users_invited)"""
     try:
-        await db_connection.execute(
-            "UPDATE users SET invited_friends = ? WHERE user_id = ?",
-            (new_count, user_id)
+        cursor = await db_connection.execute(
+            "SELECT user_id, username, fullname, invited_friends FROM users "
+            "WHERE invited_friends > 0 ORDER BY invited_friends DESC, user_id LIMIT ?",
+            (limit,)
         )
-        await db_connection.commit()
-        logger.info(f"Updated invited count for user {user_id} to {new_count}")
+        return [{
+            'user_id': row[0],
+            'username': row[1],
+            'fullname': row[2],
+            'invited_friends': row[3]
+        } for row in await cursor.fetchall()]
     except Exception as e:
-        logger.error(f"Error in update_user_invited_count for user {user_id}: {str(e)}")
-        raise
+        logger.error(f"Error in get_referral_leaderboard: {str(e)}")
+        return []
+
+
+async def has_referral_bonus(user_id: int, referrer_id: int) -> bool:
+    try:
+        cursor = await db_connection.execute(
+            "SELECT 1 FROM referrals WHERE referee_id = ? AND referrer_id = ?",
+            (user_id, referrer_id)
+        )
+        return await cursor.fetchone() is not None
+    except Exception as e:
+        logger.error(f"Error in has_referral_bonus for user {user_id} and referrer {referrer_id}: {str(e)}")
+        return False
 
 
 async def get_user_referrals(user_id: int):
     try:
         cursor = await db_connection.execute(
-            "SELECT user_id FROM users WHERE referrer_id = ?",
+            "SELECT referee_id FROM referrals WHERE referrer_id = ?",
             (user_id,)
         )
         return [row[0] for row in await cursor.fetchall()]
@@ -391,4 +1100,8 @@ async def get_connected_channels():
     cursor = await db_connection.execute(
         "SELECT channel_id, title FROM channels"  # Теперь возвращаем и ID, и название
     )
-    return await cursor.fetchall()  # Возвращаем список кортежей (channel_id, title)
\ No newline at end of file
+    return await cursor.fetchall()  # Возвращаем список кортежей (channel_id, title)
+
+
+# Время и ошибки каждой функции доступа к БД для /metrics
+instrument(globals(), "db")
@@ -9,16 +9,31 @@ import bot.keyboards as kb
 import bot.db as db
 from bot.states import *
 from bot.config import Config, is_admin
-import json
+import csv
+from datetime import datetime
+import io
 import bot.services.google_api_service as google_api_service
-from bot.scheduler import scheduler, announce_giveaway_results
-from apscheduler.triggers.date import DateTrigger
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
-from asyncio import sleep
+from bot.scheduler import scheduler, schedule_new_giveaways, split_message
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, BufferedInputFile
+import asyncio
 from bot.logger import logger
+from bot.middlewares import ThrottlingMiddleware, AdmissionMiddleware
+from bot.metrics import MetricsMiddleware
+from bot.callbacks import *
+from bot.outbound import use_lane, ANNOUNCEMENT, BROADCAST
+from bot.live_counter import live_counter
+from bot.query_log import query_stats, is_full_scan, OTHER
+from bot.profiling import profile_cpu, profile_memory, ProfilerBusy
 
 
 router = Router()
+callbacks = CallbackDispatcher()
+router.callback_query.outer_middleware(ThrottlingMiddleware())
+router.callback_query.outer_middleware(AdmissionMiddleware())
+router.callback_query.outer_middleware(callbacks)
+router.message.outer_middleware(AdmissionMiddleware())
+router.message.middleware(MetricsMiddleware())
+router.callback_query.middleware(MetricsMiddleware())
 
 
 @router.message(Command("start"), F.chat.type.in_({"group", "supergroup", "channel"}))
@@ -45,6 +60,7 @@ async def add_channel_handler(message: Message, bot: Bot):
         # Добавляем канал в БД
         try:
             await db.add_channel(chat_id, chat_title)
+            kb.invalidate_channels_keyboards()
             
             # Отправляем сообщение в канал
             try:
@@ -56,7 +72,7 @@ async def add_channel_handler(message: Message, bot: Bot):
             except Exception as e:
                 logger.error(f"Error sending welcome message to channel {chat_id}: {str(e)}")
             
-            await google_api_service.update_giveaway_stats()
+            # Google Sheets обновит плановая синхронизация лидера
             logger.info(f"Channel {chat_id} added successfully")
         except Exception as e:
             logger.error(f"Error adding channel {chat_id}: {str(e)}")
@@ -77,55 +93,44 @@ async def start_handler(message: Message, state: FSMContext, bot: Bot):
             try:
                 referrer_id = int(message.text.split()[1].strip())
                 
-                # Проверка 1: пользователь не перешел по своей же ссылке
+                # Пользователь не перешел по своей же ссылке
                 if referrer_id == user_id:
                     logger.warning(f"User {user_id} tried to use own referral link")
                     await message.answer("Нельзя использовать свою же реферальную ссылку!")
                     referrer_id = None
-                
-                # Проверка 2: реферер существует
-                elif not await db.get_user_info(referrer_id):
-                    logger.warning(f"Invalid referral link for user {user_id}")
-                    await message.answer("Недействительная реферальная ссылка")
-                    referrer_id = None
-                    
-                # Проверка 3: пользователь еще не был зарегистрирован
-                elif await db.get_user_info(user_id):
-                    logger.warning(f"User {user_id} already registered")
-                    await message.answer("Вы уже зарегистрированы в боте")
-                    referrer_id = None
                     
             except ValueError:
                 logger.warning(f"Invalid referral format for user {user_id}")
                 referrer_id = None
         
-        # Регистрируем/обновляем пользователя
-        await db.add_user(
+        # Регистрируем/обновляем пользователя; существование реферера и повторная
+        # регистрация проверяются в той же транзакции, что и засчитывание реферала
+        registration = await db.add_user(
             user_id=user_id,
             username=message.from_user.username,
             fullname=message.from_user.full_name,
             referrer_id=referrer_id
         )
+        invited_count = registration['invited_count']
+        
+        if referrer_id and not registration['is_new_user']:
+            logger.warning(f"User {user_id} already registered")
+            await message.answer("Вы уже зарегистрированы в боте")
+        elif referrer_id and not registration['referral_counted']:
+            logger.warning(f"Invalid referral link for user {user_id}")
+            await message.answer("Недействительная реферальная ссылка")
         
-        if referrer_id and referrer_id != user_id:
+        if invited_count:
+            # Отправляем уведомление рефереру
             try:
-                current_count = await db.get_invited_count(referrer_id)
-                new_count = current_count + 1
-                await db.update_user_invited_count(referrer_id, new_count)
-                await google_api_service.update_giveaway_stats()
-                
-                # Отправляем уведомление рефереру
-                try:
-                    await bot.send_message(
-                        referrer_id,
-                        f"🎉 По вашей ссылке зарегистрировался новый пользователь: "
-                        f"@{message.from_user.username or message.from_user.full_name}\n"
-                        f"Теперь у вас {current_count + 1} приглашенных друзей!"
-                    )
-                except Exception as e:
-                    logger.error(f"Error sending referral notification to {referrer_id}: {str(e)}")
+                await bot.send_message(
+                    referrer_id,
+                    f"🎉 По вашей ссылке зарегистрировался новый пользователь: "
+                    f"@{message.from_user.username or message.from_user.full_name}\n"
+                    f"Теперь у вас {invited_count} приглашенных друзей!"
+                )
             except Exception as e:
-                logger.error(f"Error updating referral count for {referrer_id}: {str(e)}")
+                logger.error(f"Error sending referral notification to {referrer_id}: {str(e)}")
         
         await message.answer(
             "Добро пожаловать в бота для розыгрышей!",
@@ -136,6 +141,46 @@ async def start_handler(message: Message, state: FSMContext, bot: Bot):
         await message.answer("Произошла ошибка при обработке запроса.")
 
 
+@router.message(Command("export_archive"))
+async def export_archive_handler(message: Message):
+    """Выгрузка архива завершенных розыгрышей в CSV"""
+    try:
+        if not is_admin(message.from_user.id):
+            logger.warning(f"Non-admin user {message.from_user.id} tried to export archive")
+            return await message.answer("Доступ запрещен")
+        
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow([
+            "ID", "Название", "Кол-во победителей", "Дата окончания", "ID канала",
+            "Объявлен", "Кол-во участников", "Победители"
+        ])
+        count = 0
+        async for giveaway in db.iter_archived_giveaways():
+            writer.writerow([
+                giveaway['id'],
+                giveaway['name'],
+                giveaway['winners_count'],
+                giveaway['announcement_date'],
+                giveaway['channel_id'],
+                giveaway['announced_at'],
+                giveaway['participants_count'],
+                " ".join(str(user_id) for user_id in giveaway['winners_ids'])
+            ])
+            count += 1
+        
+        if not count:
+            return await message.answer("Архив пуст")
+        
+        await message.answer_document(
+            BufferedInputFile(output.getvalue().encode("utf-8-sig"), filename="giveaways_archive.csv"),
+            caption=f"Завершенных розыгрышей: {count}")
+        logger.info(f"Archive with {count} giveaways exported to admin {message.from_user.id}")
+    except Exception as e:
+        logger.error(f"Error in export_archive_handler: {str(e)}")
+        await message.answer("Произошла ошибка при выгрузке архива")
+
+
 @router.message(F.text == "Список активных розыгрышей")
 async def show_active_giveaways(message: Message):
     try:
@@ -159,18 +204,17 @@ async def show_active_giveaways(message: Message):
 async def show_referral_info(message: Message):
     try:
         user_id = message.from_user.id
-        user = await db.get_user_info(user_id)
+        stats = await db.get_referral_stats(user_id)
         
-        if not user:
+        if not stats:
             logger.warning(f"Unregistered user {user_id} tried to access referral info")
             return await message.answer("Сначала зарегистрируйтесь с помощью /start")
         
-        referrals = await db.get_user_referrals(user_id)
-        invited_count = len(referrals)
-        
+        rank_text = f"Ваше место в рейтинге: #{stats['rank']}\n" if stats['invited_friends'] else ""
         await message.answer(
             f"Ваша реферальная ссылка: t.me/{Config.BOT_USERNAME}?start={user_id}\n"
-            f"Приглашено друзей: {invited_count}\n",
+            f"Приглашено друзей: {stats['invited_friends']}\n"
+            f"{rank_text}",
             reply_markup=await kb.get_referral_keyboard(user_id))
         logger.info(f"Referral info shown to user {user_id}")
     except Exception as e:
@@ -178,10 +222,135 @@ async def show_referral_info(message: Message):
         await message.answer("Произошла ошибка при получении реферальной информации.")
 
 
-@router.callback_query(F.data.startswith("participate_"))
-async def participate_handler(callback: CallbackQuery):
+@router.message(Command("top"))
+async def show_referral_leaderboard(message: Message):
+    """Топ пользователей по приглашенным друзьям: /top [N]"""
     try:
-        giveaway_id = int(callback.data.split("_")[1])
+        if not is_admin(message.from_user.id):
+            logger.warning(f"Non-admin user {message.from_user.id} tried to view referral leaderboard")
+            return await message.answer("Доступ запрещен")
+        
+        args = message.text.split()
+        limit = min(int(args[1]), 100) if len(args) > 1 and args[1].isdigit() else 10
+        leaders = await db.get_referral_leaderboard(limit)
+        if not leaders:
+            return await message.answer("Пока никто никого не пригласил")
+        
+        lines = [
+            f"{i + 1}. {'@' + user['username'] if user['username'] else user['fullname']} — {user['invited_friends']}"
+            for i, user in enumerate(leaders)
+        ]
+        await message.answer("🏆 Топ по приглашенным друзьям:\n\n" + "\n".join(lines))
+        logger.info(f"Referral leaderboard shown to admin {message.from_user.id}")
+    except Exception as e:
+        logger.error(f"Error in show_referral_leaderboard: {str(e)}")
+        await message.answer("Произошла ошибка при получении рейтинга")
+
+
+@router.message(Command("slow_queries"))
+async def show_slow_queries(message: Message):
+    """Медленные запросы к БД с планами: /slow_queries [N] или /slow_queries reset"""
+    try:
+        if not is_admin(message.from_user.id):
+            logger.warning(f"Non-admin user {message.from_user.id} tried to view slow queries")
+            return await message.answer("Доступ запрещен")
+
+        args = message.text.split()
+        if len(args) > 1 and args[1] == "reset":
+            query_stats.reset()
+            return await message.answer("Статистика запросов сброшена")
+
+        limit = min(int(args[1]), 50) if len(args) > 1 and args[1].isdigit() else 10
+        entries = query_stats.top(limit)
+        if not entries:
+            return await message.answer(
+                f"Запросов дольше {query_stats.slow_seconds * 1000:.0f} мс пока не было"
+            )
+
+        lines = []
+        for entry in entries:
+            if entry["fingerprint"] == OTHER:
+                # Сводная запись разных запросов: общего плана у нее нет
+                scan_mark, plan = "", "(прочие запросы сверх лимита статистики)"
+            else:
+                scan_mark = "⚠️ полный скан\n" if is_full_scan(entry["plan"]) else ""
+                plan = "\n".join(entry["plan"] or [])
+            lines.append(
+                f"{scan_mark}{entry['count']} вызовов, {entry['slow']} медленных, "
+                f"среднее {entry['total'] / entry['count'] * 1000:.1f} мс, "
+                f"макс. {entry['max'] * 1000:.1f} мс\n"
+                f"{entry['fingerprint'][:300]}\n{plan}\n"
+            )
+        header = f"🐢 Медленные запросы (порог {query_stats.slow_seconds * 1000:.0f} мс):\n\n"
+        for chunk in split_message(header, lines):
+            await message.answer(chunk)
+        logger.info(f"Slow queries shown to admin {message.from_user.id}")
+    except Exception as e:
+        logger.error(f"Error in show_slow_queries: {str(e)}")
+        await message.answer("Произошла ошибка при получении статистики запросов")
+
+
+def parse_profile_args(text: str, default_top: int) -> tuple:
+    """Аргументы /profile и /memprofile: [секунды] [число строк]"""
+    args = text.split()
+    seconds = int(args[1]) if len(args) > 1 and args[1].isdigit() else 30
+    top = int(args[2]) if len(args) > 2 and args[2].isdigit() else default_top
+    return max(1, min(seconds, Config.PROFILE_MAX_SECONDS)), max(1, min(top, 200))
+
+
+@router.message(Command("profile"))
+async def profile_handler(message: Message):
+    """Профилирование CPU работающего бота: /profile [секунды] [число функций]"""
+    try:
+        if not is_admin(message.from_user.id):
+            logger.warning(f"Non-admin user {message.from_user.id} tried to run profiler")
+            return await message.answer("Доступ запрещен")
+
+        seconds, top = parse_profile_args(message.text, 30)
+        await message.answer(f"⏱ Профилирую {seconds} с...")
+        report, data = await profile_cpu(seconds, top)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        await message.answer_document(
+            BufferedInputFile(report.encode("utf-8"), filename=f"profile_{stamp}.txt"),
+            caption=f"Топ-{top} функций по суммарному времени за {seconds} с")
+        await message.answer_document(
+            BufferedInputFile(data, filename=f"profile_{stamp}.prof"),
+            caption="Профиль для pstats или snakeviz")
+        logger.info(f"CPU profile for {seconds}s sent to admin {message.from_user.id}")
+    except ProfilerBusy:
+        await message.answer("Профилировщик уже запущен, дождитесь результата")
+    except Exception as e:
+        logger.error(f"Error in profile_handler: {str(e)}")
+        await message.answer("Произошла ошибка при профилировании")
+
+
+@router.message(Command("memprofile"))
+async def memprofile_handler(message: Message):
+    """Снимки выделения памяти через tracemalloc: /memprofile [секунды] [число строк]"""
+    try:
+        if not is_admin(message.from_user.id):
+            logger.warning(f"Non-admin user {message.from_user.id} tried to run memory profiler")
+            return await message.answer("Доступ запрещен")
+
+        seconds, top = parse_profile_args(message.text, 20)
+        await message.answer(f"🧠 Отслеживаю выделения памяти {seconds} с...")
+        report = await profile_memory(seconds, top)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        await message.answer_document(
+            BufferedInputFile(report.encode("utf-8"), filename=f"memprofile_{stamp}.txt"),
+            caption=f"Выделения памяти за {seconds} с")
+        logger.info(f"Memory profile for {seconds}s sent to admin {message.from_user.id}")
+    except ProfilerBusy:
+        await message.answer("Профилировщик уже запущен, дождитесь результата")
+    except Exception as e:
+        logger.error(f"Error in memprofile_handler: {str(e)}")
+        await message.answer("Произошла ошибка при профилировании памяти")
+
+
+@callbacks.register(Participate)
+async def participate_handler(callback: CallbackQuery, callback_data: Participate, bot: Bot):
+    try:
+        giveaway_id = callback_data.giveaway_id
         user_id = callback.from_user.id
         
         # Проверяем что пользователь зарегистрирован в боте
@@ -215,14 +384,15 @@ async def participate_handler(callback: CallbackQuery):
             logger.warning(f"Bot {user_id} tried to participate in giveaway {giveaway_id}")
             return await callback.answer("Боты не могут участвовать в розыгрышах.")
         
-        # Проверяем, не участвует ли уже пользователь
-        participants = await db.get_participants(giveaway_id)
-        if user_id in participants:
+        # Вставка сама проверяет, не участвует ли уже пользователь
+        participants_count = await db.add_participant(giveaway_id, user_id)
+        if participants_count is None:
             logger.info(f"User {user_id} already participates in giveaway {giveaway_id}")
             return await callback.answer("Вы уже участвуете в этом розыгрыше!")
         
-        await db.add_participant(giveaway_id, user_id)
         await callback.answer("Вы успешно записаны на розыгрыш!")
+        if giveaway.get('message_id'):
+            live_counter.update(bot, giveaway_id, giveaway['channel_id'], giveaway['message_id'])
         logger.info(f"User {user_id} added to giveaway {giveaway_id}")
     except Exception as e:
         logger.error(f"Error in participate_handler for user {callback.from_user.id}: {str(e)}")
@@ -258,6 +428,27 @@ async def set_giveaway_name(message: Message, state: FSMContext):
         await message.answer("Произошла ошибка при обработке названия")
 
 
+async def render_giveaways_page(page: int = 0):
+    """Текст и клавиатура страницы активных розыгрышей для админа"""
+    page_data = await db.get_active_giveaways_page(page, kb.GIVEAWAYS_PAGE_SIZE)
+    if not page_data['giveaways'] and page > 0:
+        page = max(0, -(-page_data['total'] // kb.GIVEAWAYS_PAGE_SIZE) - 1)
+        page_data = await db.get_active_giveaways_page(page, kb.GIVEAWAYS_PAGE_SIZE)
+    if not page_data['giveaways']:
+        return None, None
+    
+    lines = [f"Активные розыгрыши ({page_data['total']}):\n"]
+    for number, giveaway in enumerate(page_data['giveaways'], start=page * kb.GIVEAWAYS_PAGE_SIZE + 1):
+        display_date = datetime.strptime(giveaway['announcement_date'], db.DATE_FORMAT).strftime("%d.%m.%Y %H:%M")
+        lines.append(
+            f"{number}. {giveaway['name']}\n"
+            f"   Дата окончания: {display_date}\n"
+            f"   Участников: {giveaway['participants_count']}, "
+            f"победителей выбрано: {giveaway['winners_selected']}/{giveaway['winners_count']}"
+        )
+    return "\n".join(lines), await kb.get_giveaways_admin_keyboard(page_data, page)
+
+
 @router.message(F.text == "Все розыгрыши")
 async def show_all_giveaways(message: Message):
     try:
@@ -265,45 +456,35 @@ async def show_all_giveaways(message: Message):
             logger.warning(f"Non-admin user {message.from_user.id} tried to view all giveaways")
             return await message.answer("Доступ запрещен")
         
-        giveaways = await db.get_all_giveaways()
-        active_giveaways = []
-        from datetime import datetime
-        
-        for giveaway in giveaways:
-            try:
-                try:
-                    end_date = datetime.strptime(giveaway['announcement_date'], "%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    end_date = datetime.strptime(giveaway['announcement_date'], "%d.%m.%Y %H:%M")
-                
-                if datetime.now() < end_date:
-                    active_giveaways.append(giveaway)
-            except ValueError as e:
-                logger.warning(f"Invalid date format in giveaway {giveaway.get('id')}: {giveaway.get('announcement_date')}")
-                continue
-        
-        if not active_giveaways:
+        text, keyboard = await render_giveaways_page()
+        if not text:
             logger.info("No active giveaways found")
             return await message.answer("Нет активных розыгрышей!")
         
-        for giveaway in active_giveaways:
-            try:
-                display_date = datetime.strptime(giveaway['announcement_date'], "%Y-%m-%d %H:%M:%S")
-                display_date = display_date.strftime("%d.%m.%Y %H:%M")
-            except ValueError:
-                display_date = giveaway['announcement_date']
-            
-            await message.answer(
-                f"Розыгрыш: {giveaway['name']}\n"
-                f"Победителей: {giveaway['winners_count']}\n"
-                f"Дата окончания: {display_date}",
-                reply_markup=await kb.get_giveaway_management_keyboard(giveaway['id']))
+        await message.answer(text, reply_markup=keyboard)
         logger.info(f"Active giveaways shown to admin {message.from_user.id}")
     except Exception as e:
         logger.error(f"Error in show_all_giveaways: {str(e)}")
         await message.answer("Произошла ошибка при получении списка розыгрышей")
 
 
+@callbacks.register(GiveawaysPage)
+async def handle_giveaways_pagination(callback: CallbackQuery, callback_data: GiveawaysPage):
+    try:
+        if not is_admin(callback.from_user.id):
+            return await callback.answer("Доступ запрещен")
+        
+        text, keyboard = await render_giveaways_page(callback_data.page)
+        if not text:
+            await callback.message.edit_text("Нет активных розыгрышей!")
+        elif text != callback.message.text:
+            await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Error in handle_giveaways_pagination: {str(e)}")
+        await callback.answer("Произошла ошибка при переключении страницы")
+
+
 @router.message(GiveawayStates.winners_count)
 async def set_giveaway_winners_count(message: Message, state: FSMContext):
     try:
@@ -352,10 +533,10 @@ async def set_giveaway_announcement_date(message: Message, state: FSMContext):
         await message.answer("Произошла ошибка при обработке даты")
 
 
-@router.callback_query(F.data.startswith("toggle_channel_"), GiveawayStates.channel_selection)
-async def toggle_channel_selection(callback: CallbackQuery, state: FSMContext):
+@callbacks.register(ToggleChannel, GiveawayStates.channel_selection)
+async def toggle_channel_selection(callback: CallbackQuery, callback_data: ToggleChannel, state: FSMContext):
     try:
-        channel_id = int(callback.data.split("_")[2])
+        channel_id = callback_data.channel_id
         data = await state.get_data()
         
         selected_channels = data.get("selected_channels", [])
@@ -377,7 +558,7 @@ async def toggle_channel_selection(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Произошла ошибка при выборе канала")
 
 
-@router.callback_query(F.data == "save_channels", GiveawayStates.channel_selection)
+@callbacks.register(SaveChannels, GiveawayStates.channel_selection)
 async def save_channels_selection(callback: CallbackQuery, state: FSMContext):
     try:
         data = await state.get_data()
@@ -391,10 +572,8 @@ async def save_channels_selection(callback: CallbackQuery, state: FSMContext):
         await state.set_state(GiveawayStates.confirmation)
         
         # Формируем список названий каналов
-        channel_names = []
-        for channel_id in selected_channels:
-            channel = await db.get_channel(channel_id)
-            channel_names.append(channel[1] if channel else f"Канал {channel_id}")
+        titles = await db.get_channels(selected_channels)
+        channel_names = [titles.get(channel_id, f"Канал {channel_id}") for channel_id in selected_channels]
         
         await callback.message.edit_text(
             f"Подтвердите создание розыгрыша:\n\n"
@@ -404,8 +583,8 @@ async def save_channels_selection(callback: CallbackQuery, state: FSMContext):
             f"Каналы: {', '.join(channel_names)}\n\n"
             f"Продолжить?",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_giveaway")],
-                [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_giveaway")]
+                [InlineKeyboardButton(text="✅ Подтвердить", callback_data=ConfirmGiveaway().pack())],
+                [InlineKeyboardButton(text="❌ Отменить", callback_data=CancelGiveaway().pack())]
             ]))
         await callback.answer()
         logger.info("Channels selection saved, confirmation requested")
@@ -414,7 +593,12 @@ async def save_channels_selection(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Произошла ошибка при сохранении выбора каналов")
 
 
-@router.callback_query(F.data == "confirm_giveaway", GiveawayStates.confirmation)
+@callbacks.register(NoChannelsSelected, GiveawayStates.channel_selection)
+async def no_channels_selected(callback: CallbackQuery):
+    await callback.answer("Выберите хотя бы один канал!", show_alert=True)
+
+
+@callbacks.register(ConfirmGiveaway, GiveawayStates.confirmation)
 async def confirm_giveaway(callback: CallbackQuery, state: FSMContext, bot: Bot):
     try:
         data = await state.get_data()
@@ -429,40 +613,54 @@ async def confirm_giveaway(callback: CallbackQuery, state: FSMContext, bot: Bot)
         announcement_date = datetime.strptime(data['announcement_date'], "%d.%m.%Y %H:%M")
         sql_date = announcement_date.strftime("%Y-%m-%d %H:%M:%S")
         
-        giveaway_id = None
-        for channel_id in selected_channels:
-            giveaway_id = await db.create_giveaway(
-                name=data['name'],
-                winners_count=data['winners_count'],
-                announcement_date=sql_date,
-                channel_id=channel_id
-            )
-            
-            # Добавляем задачу в планировщик
-            scheduler.add_job(
-                announce_giveaway_results,
-                trigger=DateTrigger(announcement_date),
-                args=[bot, giveaway_id],
-                id=f"giveaway_{giveaway_id}"
-            )
-            
-            # Публикуем сообщение в канале
+        # Все розыгрыши создаются одной транзакцией
+        giveaway_ids = await db.create_giveaways(
+            name=data['name'],
+            winners_count=data['winners_count'],
+            announcement_date=sql_date,
+            channel_ids=selected_channels
+        )
+        
+        # Задачи ставит планировщик лидера по данным БД
+        await schedule_new_giveaways(bot)
+        
+        post_text = (
+            f"🎉 Новый розыгрыш!\n\n"
+            f"🏆 Название: {data['name']}\n"
+            f"👑 Количество победителей: {data['winners_count']}\n"
+            f"⏰ Дата окончания: {data['announcement_date']}\n\n"
+            f"Для участия нажмите кнопку ниже!"
+        )
+        
+        async def publish(channel_id: int, giveaway_id: int):
             try:
-                await bot.send_message(
+                post = await bot.send_message(
                     chat_id=channel_id,
-                    text=(
-                        f"🎉 Новый розыгрыш!\n\n"
-                        f"🏆 Название: {data['name']}\n"
-                        f"👑 Количество победителей: {data['winners_count']}\n"
-                        f"⏰ Дата окончания: {data['announcement_date']}\n\n"
-                        f"Для участия нажмите кнопку ниже!"
-                    ),
+                    text=post_text,
                     reply_markup=await kb.get_participate_keyboard(giveaway_id)
                 )
+                return post.message_id, None
             except Exception as e:
                 logger.error(f"Error posting giveaway to channel {channel_id}: {str(e)}")
-        
-        await callback.message.edit_text("Розыгрыш создан!")
+                return None, str(e)
+        
+        # Публикуем во все каналы параллельно, темп задает outbound
+        with use_lane(ANNOUNCEMENT):
+            results = await asyncio.gather(*(
+                publish(channel_id, giveaway_id) for channel_id, giveaway_id in giveaway_ids.items()
+            ))
+        await db.set_giveaway_messages({
+            giveaway_id: message_id
+            for giveaway_id, (message_id, _) in zip(giveaway_ids.values(), results) if message_id
+        })
+        
+        titles = await db.get_channels(selected_channels)
+        summary = []
+        for channel_id, (message_id, error) in zip(giveaway_ids, results):
+            title = titles.get(channel_id, f"Канал {channel_id}")
+            summary.append(f"✅ {title}" if message_id else f"❌ {title}: {error}")
+        
+        await callback.message.edit_text("Розыгрыш создан!\n\n" + "\n".join(summary))
         await callback.message.answer(
             f"🎉 Новый розыгрыш!\n\n"
             f"🏆 Название: {data['name']}\n"
@@ -470,32 +668,47 @@ async def confirm_giveaway(callback: CallbackQuery, state: FSMContext, bot: Bot)
             f"⏰ Дата окончания: {data['announcement_date']}\n\n",
             reply_markup= await kb.get_main_menu_keyboard(is_admin(callback.from_user.id)))
         await state.clear()
-        logger.info(f"Giveaway {giveaway_id} created successfully in channels {selected_channels}")
+        logger.info(f"Giveaways {list(giveaway_ids.values())} created successfully in channels {selected_channels}")
     except Exception as e:
         logger.error(f"Error in confirm_giveaway: {str(e)}")
         await callback.message.answer("Произошла ошибка при создании розыгрыша")
         await state.clear()
 
 
-@router.callback_query(F.data.startswith("select_winners_"))
-async def select_winners_start(callback: CallbackQuery):
+async def get_winners_search(state: FSMContext, giveaway_id: int):
+    """Текущий поисковый запрос в списке участников розыгрыша"""
+    data = await state.get_data()
+    return data.get("winners_search", {}).get(str(giveaway_id))
+
+
+async def set_winners_search(state: FSMContext, giveaway_id: int, search: str = None):
+    data = await state.get_data()
+    winners_search = data.get("winners_search", {})
+    if search:
+        winners_search[str(giveaway_id)] = search
+    else:
+        winners_search.pop(str(giveaway_id), None)
+    await state.update_data(winners_search=winners_search)
+
+
+@callbacks.register(SelectWinners)
+async def select_winners_start(callback: CallbackQuery, callback_data: SelectWinners, state: FSMContext):
     try:
-        giveaway_id = int(callback.data.split("_")[2])
+        giveaway_id = callback_data.giveaway_id
+        await set_winners_search(state, giveaway_id)
         
-        giveaway = await db.get_giveaway_details(giveaway_id)
-        if not giveaway:
+        page_data = await db.get_participants_page(giveaway_id, limit=kb.WINNERS_PAGE_SIZE)
+        if not page_data:
             logger.warning(f"Giveaway {giveaway_id} not found")
             return await callback.answer("Этот розыгрыш уже завершен", show_alert=True)
         
-        participants = await db.get_participants(giveaway_id)
-        
-        if not participants:
+        if not page_data['total']:
             logger.warning(f"No participants in giveaway {giveaway_id}")
             return await callback.answer("Нет участников для этого розыгрыша", show_alert=True)
         
         await callback.message.edit_text(
-            f"Выберите победителей (страница 1):",
-            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, participants, 0))
+            "Выберите победителей (страница 1):",
+            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, page_data, 0))
         await callback.answer()
         logger.info(f"Winner selection started for giveaway {giveaway_id}")
     except Exception as e:
@@ -503,38 +716,33 @@ async def select_winners_start(callback: CallbackQuery):
         await callback.answer("Произошла ошибка при выборе победителей")
 
 
-@router.callback_query(F.data.startswith("winner_"))
-async def toggle_winner(callback: CallbackQuery):
+@callbacks.register(ToggleWinner)
+async def toggle_winner(callback: CallbackQuery, callback_data: ToggleWinner, state: FSMContext):
     try:
-        parts = callback.data.split('_')
-        giveaway_id = int(parts[1])
-        user_id = int(parts[2])
-        page = int(parts[3])
+        giveaway_id = callback_data.giveaway_id
+        user_id = callback_data.user_id
+        page = callback_data.page
+        page_after = callback_data.after
         
-        giveaway = await db.get_giveaway_details(giveaway_id)
-        if not giveaway:
+        result = await db.toggle_winner(giveaway_id, user_id)
+        if result is None:
             logger.warning(f"Giveaway {giveaway_id} not found in toggle_winner")
             return await callback.answer("Розыгрыш не найден", show_alert=True)
         
-        current_winners = json.loads(giveaway['winners_ids']) if giveaway['winners_ids'] else []
-        
-        if user_id in current_winners:
-            current_winners.remove(user_id)
-        else:
-            if len(current_winners) >= giveaway['winners_count']:
-                logger.info(f"Winner limit reached for giveaway {giveaway_id}")
-                return await callback.answer(
-                    f"Достигнут лимит в {giveaway['winners_count']} победителей", 
-                    show_alert=True
-                )
-            current_winners.append(user_id)
-        
-        await db.set_winners(giveaway_id, current_winners)
+        if result == 'limit':
+            giveaway = await db.get_giveaway_details(giveaway_id)
+            logger.info(f"Winner limit reached for giveaway {giveaway_id}")
+            return await callback.answer(
+                f"Достигнут лимит в {giveaway['winners_count']} победителей", 
+                show_alert=True
+            )
         
-        # Обновляем клавиатуру
-        participants = await db.get_participants(giveaway_id)
+        # Обновляем клавиатуру той же страницы
+        search = await get_winners_search(state, giveaway_id)
+        page_data = await db.get_participants_page(
+            giveaway_id, after_user_id=page_after, limit=kb.WINNERS_PAGE_SIZE, search=search)
         await callback.message.edit_reply_markup(
-            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, participants, page))
+            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, page_data, page, search))
         await callback.answer()
         logger.info(f"Winner {user_id} toggled for giveaway {giveaway_id}")
     except Exception as e:
@@ -542,10 +750,10 @@ async def toggle_winner(callback: CallbackQuery):
         await callback.answer("Произошла ошибка при выборе победителя")
 
 
-@router.callback_query(F.data.startswith("delete_giveaway_"))
-async def delete_giveaway_handler(callback: CallbackQuery):
+@callbacks.register(DeleteGiveaway)
+async def delete_giveaway_handler(callback: CallbackQuery, callback_data: DeleteGiveaway):
     try:
-        giveaway_id = int(callback.data.split("_")[2])
+        giveaway_id = callback_data.giveaway_id
         
         # Удаляем задачу из планировщика, если она есть
         try:
@@ -567,10 +775,10 @@ async def delete_giveaway_handler(callback: CallbackQuery):
         await callback.answer("Произошла ошибка при удалении розыгрыша")
 
 
-@router.callback_query(F.data.startswith("copy_ref_"))
-async def copy_referral_link(callback: CallbackQuery):
+@callbacks.register(CopyReferral)
+async def copy_referral_link(callback: CallbackQuery, callback_data: CopyReferral):
     try:
-        user_id = int(callback.data.split("_")[2])
+        user_id = callback_data.user_id
         referral_link = f"t.me/{Config.BOT_USERNAME}?start={user_id}"
         await callback.answer(f"Ссылка скопирована: {referral_link}", show_alert=True)
         logger.info(f"Referral link copied for user {user_id}")
@@ -579,16 +787,24 @@ async def copy_referral_link(callback: CallbackQuery):
         await callback.answer("Произошла ошибка при копировании ссылки")
 
 
-@router.callback_query(F.data.startswith("winners_page_"))
-async def handle_winners_pagination(callback: CallbackQuery):
+@callbacks.register(WinnersPage)
+async def handle_winners_pagination(callback: CallbackQuery, callback_data: WinnersPage, state: FSMContext):
     try:
-        _, _, giveaway_id, page = callback.data.split('_')
-        giveaway_id = int(giveaway_id)
-        page = int(page)
+        giveaway_id = callback_data.giveaway_id
+        page = callback_data.page
+        
+        search = await get_winners_search(state, giveaway_id)
+        if callback_data.before is not None:
+            page_data = await db.get_participants_page(
+                giveaway_id, before_user_id=callback_data.before, limit=kb.WINNERS_PAGE_SIZE, search=search)
+        else:
+            page_data = await db.get_participants_page(
+                giveaway_id, after_user_id=callback_data.after or 0, limit=kb.WINNERS_PAGE_SIZE, search=search)
+        if not page_data:
+            return await callback.answer("Розыгрыш не найден", show_alert=True)
         
-        participants = await db.get_participants(giveaway_id)
         await callback.message.edit_reply_markup(
-            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, participants, page))
+            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, page_data, page, search))
         await callback.answer()
         logger.info(f"Winners page changed to {page} for giveaway {giveaway_id}")
     except Exception as e:
@@ -596,17 +812,121 @@ async def handle_winners_pagination(callback: CallbackQuery):
         await callback.answer("Произошла ошибка при переключении страницы")
 
 
-@router.callback_query(F.data.startswith("save_winners_"))
-async def save_winners_handler(callback: CallbackQuery):
+@callbacks.register(WinnersJump)
+async def winners_jump_start(callback: CallbackQuery, callback_data: WinnersJump, state: FSMContext):
+    try:
+        giveaway_id = callback_data.giveaway_id
+        await state.update_data(winners_giveaway_id=giveaway_id)
+        await state.set_state(WinnerPickerStates.page_number)
+        await callback.message.answer("Введите номер страницы:")
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Error in winners_jump_start: {str(e)}")
+        await callback.answer("Произошла ошибка при переходе на страницу")
+
+
+@router.message(WinnerPickerStates.page_number)
+async def process_winners_page_number(message: Message, state: FSMContext):
+    try:
+        if not message.text or not message.text.isdigit() or int(message.text) < 1:
+            return await message.answer("Пожалуйста, введите номер страницы числом")
+        
+        data = await state.get_data()
+        giveaway_id = data['winners_giveaway_id']
+        page = int(message.text) - 1
+        
+        page_after = await db.get_participant_page_cursor(giveaway_id, page, kb.WINNERS_PAGE_SIZE)
+        if page_after is None:
+            return await message.answer("Такой страницы нет, введите другой номер")
+        
+        await set_winners_search(state, giveaway_id)
+        page_data = await db.get_participants_page(
+            giveaway_id, after_user_id=page_after, limit=kb.WINNERS_PAGE_SIZE)
+        if not page_data:
+            await state.set_state(None)
+            return await message.answer("Этот розыгрыш уже завершен")
+        if not page_data['participants']:
+            return await message.answer("Такой страницы нет, введите другой номер")
+        
+        await state.set_state(None)
+        await message.answer(
+            f"Выберите победителей (страница {page + 1}):",
+            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, page_data, page))
+        logger.info(f"Winners page jumped to {page} for giveaway {giveaway_id}")
+    except Exception as e:
+        logger.error(f"Error in process_winners_page_number: {str(e)}")
+        await message.answer("Произошла ошибка при переходе на страницу")
+
+
+@callbacks.register(WinnersSearch)
+async def winners_search_start(callback: CallbackQuery, callback_data: WinnersSearch, state: FSMContext):
     try:
-        giveaway_id = int(callback.data.split("_")[2])
+        giveaway_id = callback_data.giveaway_id
+        await state.update_data(winners_giveaway_id=giveaway_id)
+        await state.set_state(WinnerPickerStates.search)
+        await callback.message.answer("Введите username участника или его начало:")
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Error in winners_search_start: {str(e)}")
+        await callback.answer("Произошла ошибка при поиске")
+
+
+@router.message(WinnerPickerStates.search)
+async def process_winners_search(message: Message, state: FSMContext):
+    try:
+        search = (message.text or "").strip().lstrip("@")
+        if not search:
+            return await message.answer("Введите username участника")
+        
+        data = await state.get_data()
+        giveaway_id = data['winners_giveaway_id']
+        await set_winners_search(state, giveaway_id, search)
+        await state.set_state(None)
+        
+        page_data = await db.get_participants_page(giveaway_id, limit=kb.WINNERS_PAGE_SIZE, search=search)
+        if not page_data:
+            return await message.answer("Этот розыгрыш уже завершен")
+        
+        text = "Результаты поиска:" if page_data['participants'] else "Никого не найдено"
+        await message.answer(
+            text,
+            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, page_data, 0, search))
+        logger.info(f"Winners search '{search}' in giveaway {giveaway_id}")
+    except Exception as e:
+        logger.error(f"Error in process_winners_search: {str(e)}")
+        await message.answer("Произошла ошибка при поиске")
+
+
+@callbacks.register(WinnersClear)
+async def winners_search_clear(callback: CallbackQuery, callback_data: WinnersClear, state: FSMContext):
+    try:
+        giveaway_id = callback_data.giveaway_id
+        await set_winners_search(state, giveaway_id)
+        
+        page_data = await db.get_participants_page(giveaway_id, limit=kb.WINNERS_PAGE_SIZE)
+        if not page_data:
+            return await callback.answer("Розыгрыш не найден", show_alert=True)
+        
+        await callback.message.edit_text(
+            "Выберите победителей (страница 1):",
+            reply_markup=await kb.get_winners_selection_keyboard(giveaway_id, page_data, 0))
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Error in winners_search_clear: {str(e)}")
+        await callback.answer("Произошла ошибка при сбросе поиска")
+
+
+@callbacks.register(SaveWinners)
+async def save_winners_handler(callback: CallbackQuery, callback_data: SaveWinners):
+    try:
+        giveaway_id = callback_data.giveaway_id
         giveaway = await db.get_giveaway_details(giveaway_id)
         
         if not giveaway:
             logger.warning(f"Giveaway {giveaway_id} not found in save_winners_handler")
             return await callback.answer("Розыгрыш не найден")
         
-        current_winners = json.loads(giveaway['winners_ids']) if giveaway['winners_ids'] else []
+        current_winners = await db.get_winners(giveaway_id)
         
         if not current_winners:
             logger.info(f"No winners selected for giveaway {giveaway_id}")
@@ -622,6 +942,17 @@ async def save_winners_handler(callback: CallbackQuery):
         await callback.answer("Произошла ошибка при сохранении победителей")
 
 
+@callbacks.register(CancelWinners)
+async def cancel_winners_handler(callback: CallbackQuery, callback_data: CancelWinners, state: FSMContext):
+    try:
+        await set_winners_search(state, callback_data.giveaway_id)
+        await callback.message.delete()
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Error in cancel_winners_handler: {str(e)}")
+        await callback.answer()
+
+
 @router.message(F.text == "Подключенные каналы")
 async def show_connected_channels(message: Message, state: FSMContext):
     try:
@@ -632,7 +963,7 @@ async def show_connected_channels(message: Message, state: FSMContext):
         # Кнопка для добавления нового канала
         add_button = InlineKeyboardButton(
             text="➕ Добавить канал", 
-            callback_data="add_channel"
+            callback_data=AddChannel().pack()
         )
         
         channels = await db.get_connected_channels()
@@ -654,7 +985,7 @@ async def show_connected_channels(message: Message, state: FSMContext):
         await message.answer("Произошла ошибка при получении списка каналов")
 
 
-@router.callback_query(F.data == "add_channel")
+@callbacks.register(AddChannel)
 async def start_add_channel(callback: CallbackQuery, state: FSMContext):
     try:
         await callback.message.answer(
@@ -704,8 +1035,8 @@ async def process_channel_input(message: Message, state: FSMContext, bot: Bot):
         
         confirm_keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
-                InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_channel"),
-                InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_channel")
+                InlineKeyboardButton(text="✅ Подтвердить", callback_data=ConfirmChannel().pack()),
+                InlineKeyboardButton(text="❌ Отменить", callback_data=CancelChannel().pack())
             ]
         ])
         
@@ -721,7 +1052,7 @@ async def process_channel_input(message: Message, state: FSMContext, bot: Bot):
         await message.answer("Проверьте правильность ввода и попробуйте снова.")
 
 
-@router.callback_query(F.data == "confirm_channel", ChannelStates.confirm_channel)
+@callbacks.register(ConfirmChannel, ChannelStates.confirm_channel)
 async def confirm_add_channel(callback: CallbackQuery, state: FSMContext, bot: Bot):
     try:
         data = await state.get_data()
@@ -730,6 +1061,7 @@ async def confirm_add_channel(callback: CallbackQuery, state: FSMContext, bot: B
         
         # Добавляем канал в БД
         await db.add_channel(channel_id, channel_title)
+        kb.invalidate_channels_keyboards()
         
         # Отправляем сообщение в канал
         try:
@@ -756,7 +1088,7 @@ async def confirm_add_channel(callback: CallbackQuery, state: FSMContext, bot: B
         await callback.answer()
 
 
-@router.callback_query(F.data == "cancel_channel", ChannelStates.confirm_channel)
+@callbacks.register(CancelChannel, ChannelStates.confirm_channel)
 async def cancel_add_channel(callback: CallbackQuery, state: FSMContext):
     try:
         await callback.message.answer(
@@ -865,25 +1197,31 @@ async def approve_broadcast(message: Message, state: FSMContext, bot: Bot):
         all_users = await db.get_all_users()
         users = [user for user in all_users if not is_admin(user['user_id'])]
         
-        success = 0
-        
-        for user in users:
+        async def send(user_id: int):
             try:
                 if data.get("photos"):
                     media = [InputMediaPhoto(media=photo) for photo in data["photos"]]
                     media[0].caption = data["text"]
                     media[0].parse_mode = "HTML"
-                    await bot.send_media_group(chat_id=user["user_id"], media=media)
+                    await bot.send_media_group(chat_id=user_id, media=media)
                 else:
                     await bot.send_message(
-                        chat_id=user["user_id"],
+                        chat_id=user_id,
                         text=data["text"],
                         parse_mode="HTML"
                     )
-                success += 1
-                await sleep(0.1)
+                return True
             except Exception as e:
-                logger.warning(f"Error sending broadcast to user {user['user_id']}: {str(e)}")
+                logger.warning(f"Error sending broadcast to user {user_id}: {str(e)}")
+                return False
+        
+        # Темп задает outbound: рассылка получает только свободную от ответов и анонсов емкость
+        success = 0
+        with use_lane(BROADCAST):
+            for i in range(0, len(users), Config.BROADCAST_CHUNK_SIZE):
+                chunk = users[i:i + Config.BROADCAST_CHUNK_SIZE]
+                results = await asyncio.gather(*(send(user["user_id"]) for user in chunk))
+                success += sum(results)
         
         await message.answer(f"Сообщения успешно отправлены {success} пользователям", 
                            reply_markup= await kb.get_main_menu_keyboard(is_admin(message.from_user.id)))
@@ -907,7 +1245,7 @@ async def cancel_broadcast(message: Message, state: FSMContext):
         await message.answer("Произошла ошибка при отмене рассылки")
 
 
-@router.callback_query(F.data == "check_subscriptions")
+@callbacks.register(CheckSubscriptions)
 async def check_subscriptions_handler(callback: CallbackQuery, bot: Bot):
     try:
         user_id = callback.from_user.id
@@ -922,7 +1260,7 @@ async def check_subscriptions_handler(callback: CallbackQuery, bot: Bot):
         
         if unsubscribed:
             # Создаем новую клавиатуру
-            new_keyboard = await get_subscription_check_keyboard(unsubscribed)
+            new_keyboard = await kb.get_subscription_check_keyboard(unsubscribed)
             
             # Проверяем, изменились ли каналы для подписки
             current_text = callback.message.text
@@ -945,7 +1283,7 @@ async def check_subscriptions_handler(callback: CallbackQuery, bot: Bot):
         await callback.answer("Произошла ошибка при проверке подписки", show_alert=True)
 
 
-@router.callback_query(F.data == "cancel_giveaway", GiveawayStates.confirmation)
+@callbacks.register(CancelGiveaway, GiveawayStates.confirmation)
 async def cancel_giveaway_creation(callback: CallbackQuery, state: FSMContext):
     try:
         await state.clear()
@@ -959,7 +1297,7 @@ async def cancel_giveaway_creation(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 
-@router.callback_query(F.data == "cancel_giveaway")
+@callbacks.register(CancelGiveaway)
 async def cancel_giveaway_global(callback: CallbackQuery, state: FSMContext):
     try:
         current_state = await state.get_state()
@@ -981,6 +1319,13 @@ async def cancel_giveaway_global(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
 
 
+@router.callback_query()
+async def unknown_callback_handler(callback: CallbackQuery):
+    """Кнопки устаревших форматов и действия вне нужного состояния"""
+    logger.info(f"Unhandled callback '{callback.data}' from user {callback.from_user.id}")
+    await callback.answer("Кнопка устарела, откройте меню заново")
+
+
 async def check_user_subscriptions(bot: Bot, user_id: int):
     """Проверяет подписку пользователя на обязательные каналы"""
     try:
@@ -1020,26 +1365,3 @@ async def check_user_subscriptions(bot: Bot, user_id: int):
         logger.error(f"Error in check_user_subscriptions: {str(e)}")
         return None
 
-
-async def get_subscription_check_keyboard(channels):
-    """Создает кнопки для подписки с приоритетом: ссылка из таблицы -> fallback к ID"""
-    buttons = []
-    for channel in channels:
-        # Используем ссылку из таблицы или создаем из ID
-        url = channel.get('link') or f"https://t.me/c/{str(abs(channel['channel_id']))}"
-        
-        buttons.append([
-            InlineKeyboardButton(
-                text=f"Подписаться на {channel['title']}", 
-                url=url
-            )
-        ])
-    
-    buttons.append([
-        InlineKeyboardButton(
-            text="✅ Я подписался", 
-            callback_data="check_subscriptions"
-        )
-    ])
-    
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
\ No newline at end of file
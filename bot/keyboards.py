@@ -1,63 +1,110 @@
+from collections import OrderedDict
+from functools import lru_cache
 from aiogram.types import KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
-import bot.db as db
-import json
+from bot.config import Config
+from bot.callbacks import *
+
+
+# Клавиатуры неизменяемы после создания, поэтому одни и те же объекты отдаются всем обработчикам.
+# Статические собираются при импорте, зависящие от id - через LRU,
+# список каналов - по версии, которую сбрасывает invalidate_channels_keyboards()
+
+_MAIN_MENU_ADMIN = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text="Создать розыгрыш")],
+    [KeyboardButton(text="Все розыгрыши")],
+    [KeyboardButton(text="Подключенные каналы")],
+    [KeyboardButton(text="Сделать рассылку")]
+], resize_keyboard=True)
+
+_MAIN_MENU_USER = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text="Список активных розыгрышей")],
+    [KeyboardButton(text="Приведи друга")]
+], resize_keyboard=True)
+
+_BROADCAST_MEDIA = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Прикрепить указанные фото", callback_data=ConfirmPhotos().pack())],
+    [InlineKeyboardButton(text="Не прикреплять фото", callback_data=NoPhotos().pack())],
+    [InlineKeyboardButton(text="Отменить рассылку", callback_data=CancelBroadcast().pack())]
+])
+
+_BROADCAST = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text="Прикрепить фото")],
+    [KeyboardButton(text="Пропустить прикрепление фото")],
+    [KeyboardButton(text="Отменить рассылку")]
+], resize_keyboard=True)
+
+_BROADCAST_CONFIRMATION = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text="Подтвердить рассылку")],
+    [KeyboardButton(text="Отменить рассылку")]
+], resize_keyboard=True)
+
+_GIVEAWAY_CONFIRMATION = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Подтвердить", callback_data=ConfirmGiveaway().pack()),
+        InlineKeyboardButton(text="❌ Отменить", callback_data=CancelGiveaway().pack())
+    ]
+])
+
+_REMOVE_KEYBOARD = ReplyKeyboardRemove()
 
 
 async def get_main_menu_keyboard(is_admin: bool = False):
-    if is_admin:
-        buttons = [
-            [KeyboardButton(text="Создать розыгрыш")],
-            [KeyboardButton(text="Все розыгрыши")],
-            [KeyboardButton(text="Подключенные каналы")],
-            [KeyboardButton(text="Сделать рассылку")]  
-        ]
-    else:
-        buttons = [
-            [KeyboardButton(text="Список активных розыгрышей")],
-            [KeyboardButton(text="Приведи друга")]
-        ]
-    return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
+    return _MAIN_MENU_ADMIN if is_admin else _MAIN_MENU_USER
 
 
-async def get_giveaways_list_keyboard(giveaways):
-    if not giveaways:
-        return None
-    
+@lru_cache(maxsize=64)
+def _build_giveaways_list_keyboard(giveaways: tuple):
     inline_keyboard = []
     for giveaway in giveaways:
         inline_keyboard.append([
             InlineKeyboardButton(
                 text=f"{giveaway[1]}",
-                callback_data=f"participate_{giveaway[0]}"
+                callback_data=Participate(giveaway_id=giveaway[0]).pack()
             )
         ])
     return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
 
-async def get_referral_keyboard(user_id: int):
+async def get_giveaways_list_keyboard(giveaways):
+    if not giveaways:
+        return None
+    return _build_giveaways_list_keyboard(tuple((giveaway[0], giveaway[1]) for giveaway in giveaways))
+
+
+@lru_cache(maxsize=Config.KEYBOARD_CACHE_SIZE)
+def _build_referral_keyboard(user_id: int):
     return InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(
             text="Скопировать ссылку",
-            callback_data=f"copy_ref_{user_id}"
+            callback_data=CopyReferral(user_id=user_id).pack()
         )
     ]])
 
 
-async def get_giveaway_management_keyboard(giveaway_id: int):
+async def get_referral_keyboard(user_id: int):
+    return _build_referral_keyboard(user_id)
+
+
+@lru_cache(maxsize=Config.KEYBOARD_CACHE_SIZE)
+def _build_giveaway_management_keyboard(giveaway_id: int):
     return InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(
                 text="Определить победителей",
-                callback_data=f"select_winners_{giveaway_id}"
+                callback_data=SelectWinners(giveaway_id=giveaway_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="Удалить розыгрыш",
-                callback_data=f"delete_giveaway_{giveaway_id}"
+                callback_data=DeleteGiveaway(giveaway_id=giveaway_id).pack()
             )
         ]
     ])
+
+
+async def get_giveaway_management_keyboard(giveaway_id: int):
+    return _build_giveaway_management_keyboard(giveaway_id)
     
 
 async def get_channels_list_keyboard(channels):
@@ -72,21 +119,27 @@ async def get_channels_list_keyboard(channels):
     return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
 
-async def get_channels_selection_keyboard(channels, selected_channels=None):
-    """Клавиатура для выбора каналов с отметкой выбранных"""
-    if selected_channels is None:
-        selected_channels = []
-    
+_channels_version = 0
+_channels_selection_cache = OrderedDict()
+
+
+def invalidate_channels_keyboards():
+    """Сбрасывает клавиатуры выбора каналов после изменения списка каналов"""
+    global _channels_version
+    _channels_version += 1
+    _channels_selection_cache.clear()
+
+
+def _build_channels_selection_keyboard(channels: tuple, selected_channels: frozenset):
     inline_keyboard = []
-    for channel in channels:
-        channel_id, title = channel[0], channel[1]
+    for channel_id, title in channels:
         is_selected = channel_id in selected_channels
         prefix = "✅ " if is_selected else ""
         
         inline_keyboard.append([
             InlineKeyboardButton(
                 text=f"{prefix}{title}",
-                callback_data=f"toggle_channel_{channel_id}"
+                callback_data=ToggleChannel(channel_id=channel_id).pack()
             )
         ])
     
@@ -95,105 +148,195 @@ async def get_channels_selection_keyboard(channels, selected_channels=None):
         inline_keyboard.append([
             InlineKeyboardButton(
                 text="💾 Сохранить выбор",
-                callback_data="save_channels"
+                callback_data=SaveChannels().pack()
             )
         ])
     else:
         inline_keyboard.append([
             InlineKeyboardButton(
                 text="❌ Выберите хотя бы один канал",
-                callback_data="no_channels_selected"
+                callback_data=NoChannelsSelected().pack()
             )
         ])
     
     return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
 
-async def get_winners_selection_keyboard(giveaway_id, participants, page=0):
-    items_per_page = 10
-    start_idx = page * items_per_page
-    end_idx = start_idx + items_per_page
-    paginated_participants = participants[start_idx:end_idx]
-    
-    giveaway = await db.get_giveaway_details(giveaway_id)
-    if not giveaway:
-        return InlineKeyboardMarkup(inline_keyboard=[])
+async def get_channels_selection_keyboard(channels, selected_channels=None):
+    """Клавиатура для выбора каналов с отметкой выбранных"""
+    channels = tuple((channel[0], channel[1]) for channel in channels)
+    selected_channels = frozenset(selected_channels or ())
+    key = (_channels_version, selected_channels)
     
-    current_winners = json.loads(giveaway['winners_ids']) if giveaway['winners_ids'] else []
+    cached = _channels_selection_cache.get(key)
+    # Список каналов сверяется на случай, если его изменил другой воркер
+    if cached and cached[0] == channels:
+        _channels_selection_cache.move_to_end(key)
+        return cached[1]
     
+    keyboard = _build_channels_selection_keyboard(channels, selected_channels)
+    _channels_selection_cache[key] = (channels, keyboard)
+    while len(_channels_selection_cache) > Config.KEYBOARD_CACHE_SIZE:
+        _channels_selection_cache.popitem(last=False)
+    return keyboard
+
+
+GIVEAWAYS_PAGE_SIZE = 5
+
+
+async def get_giveaways_admin_keyboard(page_data, page=0):
+    """Управление розыгрышами страницы из db.get_active_giveaways_page"""
     inline_keyboard = []
-    for user_id in paginated_participants:
-        user = await db.get_user_info(user_id)
-        if not user:
-            continue
-            
+    for number, giveaway in enumerate(page_data['giveaways'], start=page * GIVEAWAYS_PAGE_SIZE + 1):
+        inline_keyboard.append([
+            InlineKeyboardButton(
+                text=f"🏆 {number}. Победители",
+                callback_data=SelectWinners(giveaway_id=giveaway['id']).pack()
+            ),
+            InlineKeyboardButton(
+                text=f"🗑 {number}. Удалить",
+                callback_data=DeleteGiveaway(giveaway_id=giveaway['id']).pack()
+            )
+        ])
+
+    pages_count = max(1, -(-page_data['total'] // GIVEAWAYS_PAGE_SIZE))
+    if pages_count > 1:
+        navigation_buttons = []
+        if page > 0:
+            navigation_buttons.append(
+                InlineKeyboardButton(text="⬅️", callback_data=GiveawaysPage(page=page - 1).pack())
+            )
+        navigation_buttons.append(
+            InlineKeyboardButton(text=f"📄 {page + 1}/{pages_count}", callback_data=GiveawaysPage(page=page).pack())
+        )
+        if page + 1 < pages_count:
+            navigation_buttons.append(
+                InlineKeyboardButton(text="➡️", callback_data=GiveawaysPage(page=page + 1).pack())
+            )
+        inline_keyboard.append(navigation_buttons)
+
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+
+WINNERS_PAGE_SIZE = 10
+
+
+async def get_winners_selection_keyboard(giveaway_id, page_data, page=0, search=None):
+    """Клавиатура выбора победителей по странице из db.get_participants_page"""
+    participants = page_data['participants']
+    # Курсор текущей страницы, чтобы после отметки победителя перерисовать ее же
+    page_after = participants[0]['user_id'] - 1 if participants else 0
+
+    inline_keyboard = []
+    for user in participants:
         display_name = f"@{user['username']}" if user['username'] else user['fullname']
-        if user_id in current_winners:
+        if user['is_winner']:
             display_name = "✅ " + display_name
-            
+
         inline_keyboard.append([
             InlineKeyboardButton(
                 text=display_name,
-                callback_data=f"winner_{giveaway_id}_{user_id}_{page}"
+                callback_data=ToggleWinner(
+                    giveaway_id=giveaway_id, user_id=user['user_id'], page=page, after=page_after
+                ).pack()
             )
         ])
-    
+
     # Добавляем пагинацию если нужно
     navigation_buttons = []
-    if page > 0:
+    if page_data['has_prev'] and participants:
         navigation_buttons.append(
             InlineKeyboardButton(
                 text="⬅️ Назад",
-                callback_data=f"winners_page_{giveaway_id}_{page-1}"
+                callback_data=WinnersPage(
+                    giveaway_id=giveaway_id, page=page - 1, before=participants[0]['user_id']
+                ).pack()
             )
         )
-    
-    if end_idx < len(participants):
+
+    if not search:
+        pages_count = max(1, -(-page_data['total'] // WINNERS_PAGE_SIZE))
+        navigation_buttons.append(
+            InlineKeyboardButton(
+                text=f"📄 {page + 1}/{pages_count}",
+                callback_data=WinnersJump(giveaway_id=giveaway_id).pack()
+            )
+        )
+
+    if page_data['has_next'] and participants:
         navigation_buttons.append(
             InlineKeyboardButton(
                 text="Вперёд ➡️",
-                callback_data=f"winners_page_{giveaway_id}_{page+1}"
+                callback_data=WinnersPage(
+                    giveaway_id=giveaway_id, page=page + 1, after=participants[-1]['user_id']
+                ).pack()
             )
         )
-    
+
     if navigation_buttons:
         inline_keyboard.append(navigation_buttons)
-    
+
+    if search:
+        inline_keyboard.append([
+            InlineKeyboardButton(
+                text=f"✖️ Сбросить поиск: {search}",
+                callback_data=WinnersClear(giveaway_id=giveaway_id).pack()
+            )
+        ])
+    else:
+        inline_keyboard.append([
+            InlineKeyboardButton(
+                text="🔍 Поиск по username",
+                callback_data=WinnersSearch(giveaway_id=giveaway_id).pack()
+            )
+        ])
+
     # Кнопки сохранения и отмены
     inline_keyboard.append([
         InlineKeyboardButton(
-            text=f"Сохранить ({len(current_winners)}/{giveaway['winners_count']})",
-            callback_data=f"save_winners_{giveaway_id}"
+            text=f"Сохранить ({page_data['winners_selected']}/{page_data['winners_count']})",
+            callback_data=SaveWinners(giveaway_id=giveaway_id).pack()
         ),
         InlineKeyboardButton(
             text="Назад",
-            callback_data=f"cancel_winners_{giveaway_id}"
+            callback_data=CancelWinners(giveaway_id=giveaway_id).pack()
         )
     ])
-    
+
     return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
 
-async def get_participate_keyboard(giveaway_id):
-    participate_button = InlineKeyboardMarkup(inline_keyboard=[
+def _participate_keyboard(giveaway_id: int, text: str):
+    return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
-            text="Участвовать",
-            callback_data=f"participate_{giveaway_id}"
+            text=text,
+            callback_data=Participate(giveaway_id=giveaway_id).pack()
         )]
     ])
-    return participate_button
 
 
-async def get_subscription_check_keyboard(channels):
-    """Создает кнопки для подписки с приоритетом: ссылка из таблицы -> fallback к ID"""
+@lru_cache(maxsize=Config.KEYBOARD_CACHE_SIZE)
+def _build_participate_keyboard(giveaway_id: int):
+    return _participate_keyboard(giveaway_id, "Участвовать")
+
+
+async def get_participate_keyboard(giveaway_id, participants_count: int = 0):
+    # Клавиатуры со счетчиком не кэшируются: каждое число встречается один раз
+    if participants_count:
+        return _participate_keyboard(giveaway_id, f"Участвовать ({participants_count})")
+    return _build_participate_keyboard(giveaway_id)
+
+
+@lru_cache(maxsize=64)
+def _build_subscription_check_keyboard(channels: tuple):
     buttons = []
-    for channel in channels:
+    for channel_id, title, link in channels:
         # Используем ссылку из таблицы или создаем из ID
-        url = channel.get('link') or f"https://t.me/c/{str(abs(channel['channel_id']))}"
+        url = link or f"https://t.me/c/{str(abs(channel_id))}"
         
         buttons.append([
             InlineKeyboardButton(
-                text=f"Подписаться на {channel['title']}", 
+                text=f"Подписаться на {title}", 
                 url=url
             )
         ])
@@ -201,57 +344,35 @@ async def get_subscription_check_keyboard(channels):
     buttons.append([
         InlineKeyboardButton(
             text="✅ Я подписался", 
-            callback_data="check_subscriptions"
+            callback_data=CheckSubscriptions().pack()
         )
     ])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-async def get_broadcast_media_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Прикрепить указанные фото", callback_data="confirm_photos")],
-        [InlineKeyboardButton(text="Не прикреплять фото", callback_data="no_photos")],
-        [InlineKeyboardButton(text="Отменить рассылку", callback_data="cancel_broadcast")]
-    ])
+async def get_subscription_check_keyboard(channels):
+    """Создает кнопки для подписки с приоритетом: ссылка из таблицы -> fallback к ID"""
+    return _build_subscription_check_keyboard(
+        tuple((channel['channel_id'], channel['title'], channel.get('link')) for channel in channels)
+    )
 
 
-async def get_broadcast_confirmation_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Подтвердить рассылку", callback_data="approve_broadcast")],
-        [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_broadcast")]
-    ])
+async def get_broadcast_media_keyboard():
+    return _BROADCAST_MEDIA
 
 
 async def get_broadcast_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Прикрепить фото")],
-            [KeyboardButton(text="Пропустить прикрепление фото")],
-            [KeyboardButton(text="Отменить рассылку")]
-        ],
-        resize_keyboard=True
-    )
+    return _BROADCAST
 
 
 async def get_broadcast_confirmation_keyboard():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Подтвердить рассылку")],
-            [KeyboardButton(text="Отменить рассылку")]
-        ],
-        resize_keyboard=True
-    )
+    return _BROADCAST_CONFIRMATION
 
 
 async def get_giveaway_confirmation_keyboard():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Подтвердить", callback_data="confirm_giveaway"),
-            InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_giveaway")
-        ]
-    ])
+    return _GIVEAWAY_CONFIRMATION
 
 
 async def remove_keyboard():
-    return ReplyKeyboardRemove()
\ No newline at end of file
+    return _REMOVE_KEYBOARD
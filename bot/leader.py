@@ -0,0 +1,112 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+import bot.db as db
+from bot.config import Config
+from bot.logger import logger
+
+
+class LeaderElector:
+    """
+    Выбор лидера между воркерами через строку-аренду в общей БД.
+    Лидер продлевает аренду каждые heartbeat секунд; если он пропадает,
+    аренду забирает другой воркер после истечения lease_ttl.
+    """
+
+    def __init__(self, name: str, on_elected=None, on_demoted=None, lease_ttl: float = None, heartbeat: float = None):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.lease_ttl = lease_ttl or Config.LEADER_LEASE_TTL
+        self.heartbeat = heartbeat or Config.LEADER_HEARTBEAT
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._lease_expires_at = 0.0
+        self._connection = None
+        self._stopped = asyncio.Event()
+
+    async def _get_connection(self):
+        if self._connection is None:
+            self._connection = await db.open_connection()
+            await self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS leader_lease (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            await self._connection.commit()
+        return self._connection
+
+    async def _try_acquire(self) -> bool:
+        """Захватывает или продлевает аренду одним UPSERT"""
+        connection = await self._get_connection()
+        now = time.time()
+        cursor = await connection.execute(
+            "INSERT INTO leader_lease (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leader_lease.holder = excluded.holder OR leader_lease.expires_at < ?",
+            (self.name, self.holder_id, now + self.lease_ttl, now)
+        )
+        await connection.commit()
+        if cursor.rowcount == 1:
+            self._lease_expires_at = now + self.lease_ttl
+            return True
+        return False
+
+    async def _set_leader(self, is_leader: bool):
+        if is_leader == self.is_leader:
+            return
+        self.is_leader = is_leader
+        callback = self.on_elected if is_leader else self.on_demoted
+        logger.info(f"Worker {self.holder_id} {'became' if is_leader else 'is no longer'} leader of '{self.name}'")
+        if callback:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Error in leader callback for '{self.name}': {str(e)}")
+
+    async def run(self):
+        """Цикл heartbeat: продление аренды и переключение роли; при остановке освобождает аренду"""
+        try:
+            while not self._stopped.is_set():
+                try:
+                    acquired = await self._try_acquire()
+                except Exception as e:
+                    logger.error(f"Error renewing leader lease '{self.name}': {str(e)}")
+                    # Без связи с БД лидер остается лидером только до конца оплаченной аренды
+                    acquired = self.is_leader and time.time() < self._lease_expires_at - self.heartbeat
+                # Остановка могла начаться, пока шел захват: не становимся лидером заново
+                if self._stopped.is_set():
+                    break
+                await self._set_leader(acquired)
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self._release()
+
+    async def stop(self):
+        """
+        Останавливает heartbeat. Аренду освобождает сам run после выхода из цикла,
+        поэтому после stop нужно дождаться задачи run
+        """
+        self._stopped.set()
+
+    async def _release(self):
+        """Снимает роль и удаляет аренду, чтобы failover прошел сразу"""
+        await self._set_leader(False)
+        if self._connection is not None:
+            try:
+                await self._connection.execute(
+                    "DELETE FROM leader_lease WHERE name = ? AND holder = ?",
+                    (self.name, self.holder_id)
+                )
+                await self._connection.commit()
+            except Exception as e:
+                logger.error(f"Error releasing leader lease '{self.name}': {str(e)}")
+            await self._connection.close()
+            self._connection = None
@@ -0,0 +1,56 @@
+import asyncio
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+import bot.db as db
+import bot.keyboards as kb
+from bot.config import Config
+from bot.logger import logger
+from bot.outbound import use_lane, ANNOUNCEMENT
+
+
+class LiveCounter:
+    """
+    Счетчик участников на кнопке поста розыгрыша.
+    Нажатия только отмечают пост как устаревший; пост редактируется не чаще раза
+    в interval секунд числом, прочитанным из базы в момент правки, так что шторм
+    нажатий дает ограниченное число правок, а воркеры не затирают чужие нажатия.
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or Config.LIVE_COUNTER_INTERVAL
+        # giveaway_id -> (chat_id, message_id) постов, ожидающих правки
+        self.pending = {}
+        self._tasks = {}
+
+    def update(self, bot: Bot, giveaway_id: int, chat_id: int, message_id: int):
+        self.pending[giveaway_id] = (chat_id, message_id)
+        if giveaway_id not in self._tasks:
+            self._tasks[giveaway_id] = asyncio.create_task(self._flush_later(bot, giveaway_id))
+
+    async def _flush_later(self, bot: Bot, giveaway_id: int):
+        try:
+            while giveaway_id in self.pending:
+                await asyncio.sleep(self.interval)
+                chat_id, message_id = self.pending.pop(giveaway_id)
+                try:
+                    count = await db.get_participants_count(giveaway_id)
+                    if count is None:
+                        continue
+                    with use_lane(ANNOUNCEMENT):
+                        await bot.edit_message_reply_markup(
+                            chat_id=chat_id,
+                            message_id=message_id,
+                            reply_markup=await kb.get_participate_keyboard(giveaway_id, count)
+                        )
+                except TelegramBadRequest as e:
+                    if "message is not modified" not in str(e):
+                        logger.warning(f"Failed to update counter of giveaway {giveaway_id}: {str(e)}")
+                except Exception as e:
+                    logger.error(f"Error updating counter of giveaway {giveaway_id}: {str(e)}")
+        finally:
+            # Между последней проверкой pending и удалением задачи нет await,
+            # поэтому новое нажатие либо попадет в цикл, либо запустит новую задачу
+            self._tasks.pop(giveaway_id, None)
+
+
+live_counter = LiveCounter()
@@ -1,25 +1,95 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
 from datetime import datetime
-from functools import wraps
-from aiogram import Bot
-from aiogram.types import Message
+from bot.config import Config
 
 
-# Создаем директорию для логов, если она не существует
-if not os.path.exists("logs"):
-    os.makedirs("logs")
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,  # Уровень логирования (INFO, DEBUG, WARNING, ERROR, CRITICAL)
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",  # Формат сообщений
-    handlers=[
-        logging.FileHandler(f"logs/bot_{datetime.now().strftime('%Y-%m-%d')}.log"),  # Логирование в файл с датой
-        logging.StreamHandler()  # Логирование в консоль
-    ]
-)
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись для сборщиков логов"""
 
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
 
+
+class RotatingLogFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Ротация по времени и, если задан max_bytes, по размеру; хранится backup_count файлов"""
+
+    def __init__(self, filename: str, when: str, backup_count: int, max_bytes: int = 0):
+        super().__init__(filename, when=when, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    def rotation_filename(self, default_name: str) -> str:
+        # Несколько ротаций по размеру за один интервал получают номер: bot.log.2025-01-01.1
+        name, index = default_name, 0
+        while os.path.exists(name):
+            index += 1
+            name = f"{default_name}.{index}"
+        return name
+
+
+def setup_logging():
+    """
+    Записи из обработчиков только кладутся в очередь, а форматирование,
+    запись в файл с ротацией и в консоль выполняет фоновый поток QueueListener
+    """
+    os.makedirs(Config.LOG_DIR, exist_ok=True)
+    # У каждого процесса-воркера свой файл, чтобы процессы не ротировали один и тот же
+    process_name = multiprocessing.current_process().name
+    file_name = "bot.log" if process_name == "MainProcess" else f"{process_name}.log"
+
+    formatter = JsonFormatter() if Config.LOG_FORMAT == "json" else logging.Formatter(LOG_FORMAT)
+    handlers = [RotatingLogFileHandler(
+        os.path.join(Config.LOG_DIR, file_name),
+        when=Config.LOG_ROTATE_WHEN,
+        backup_count=Config.LOG_RETENTION,
+        max_bytes=Config.LOG_MAX_BYTES
+    )]
+    if Config.LOG_CONSOLE:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(Config.LOG_LEVEL)
+    for name, level in Config.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    listener.start()
+    # Дописываем очередь при завершении процесса
+    atexit.register(listener.stop)
+    return listener
+
+
+listener = setup_logging()
 logger = logging.getLogger(__name__)
@@ -0,0 +1,241 @@
+import bisect
+import inspect
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+from bot.config import Config
+from bot.logger import logger
+from bot.middlewares import admission
+from bot.outbound import outbound
+
+
+# Границы гистограмм в секундах: от быстрых запросов к SQLite до долгих джобов
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Значения задаются вручную или вычисляются collect() в момент чтения /metrics"""
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), collect: Callable[[], dict] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values: Dict[tuple, Any] = {}
+        self.collect = collect
+        REGISTRY.append(self)
+
+    def samples(self):
+        if self.collect is not None:
+            try:
+                self.values = {tuple(labels): value for labels, value in self.collect().items()}
+            except Exception as e:
+                logger.error(f"Error collecting metric {self.name}: {str(e)}")
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            # [счетчики по корзинам (последняя - +Inf), сумма, количество]
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.label_names + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {total}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+REGISTRY: list = []
+
+handler_duration = Histogram("bot_handler_duration_seconds", "Время выполнения обработчика", ("handler",))
+handler_errors = Counter("bot_handler_errors_total", "Исключения, вышедшие из обработчика", ("handler",))
+handlers_in_flight = Gauge("bot_handlers_in_flight", "Выполняющиеся обработчики", ("handler",))
+call_duration = Histogram("bot_call_duration_seconds", "Время вызова функций БД, Google Sheets и джобов", ("kind", "name"))
+call_errors = Counter("bot_call_errors_total", "Ошибки вызовов БД, Google Sheets и джобов", ("kind", "name"))
+bot_api_duration = Histogram("bot_api_request_duration_seconds", "Время запроса к Bot API", ("method",))
+bot_api_errors = Counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+admission_running = Gauge(
+    "bot_admission_running", "Обработчики, получившие слот PriorityAdmission",
+    collect=lambda: {(): admission.stats()["running"]}
+)
+admission_queued = Gauge(
+    "bot_admission_queued", "События в очереди PriorityAdmission", ("priority",),
+    collect=lambda: {(name,): depth for name, depth in admission.stats()["queued"].items()}
+)
+admission_shed = Counter(
+    "bot_admission_shed_total", "События, отброшенные из-за перегрузки", ("priority",),
+    collect=lambda: {(name,): count for name, count in admission.stats()["shed"].items()}
+)
+outbound_queued = Gauge(
+    "bot_outbound_queued", "Исходящие запросы, ожидающие лимита", ("lane",),
+    collect=lambda: {(name,): depth for name, depth in outbound.stats()["queued"].items()}
+)
+outbound_sent = Counter(
+    "bot_outbound_sent_total", "Исходящие запросы, прошедшие лимит", ("lane",),
+    collect=lambda: {(name,): count for name, count in outbound.stats()["sent"].items()}
+)
+outbound_paused = Gauge(
+    "bot_outbound_paused_seconds", "Оставшаяся пауза после 429",
+    collect=lambda: {(): outbound.stats()["paused_for"]}
+)
+
+
+@contextmanager
+def track_handler(name: str):
+    handlers_in_flight.inc(name)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        handler_errors.inc(name)
+        raise
+    finally:
+        handler_duration.observe(time.perf_counter() - started, name)
+        handlers_in_flight.dec(name)
+
+
+def timed(kind: str, name: str = None):
+    """Декоратор замера времени корутины: kind - db / sheets / job"""
+    def decorator(func):
+        label = name or func.__name__
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                call_errors.inc(kind, label)
+                raise
+            finally:
+                call_duration.observe(time.perf_counter() - started, kind, label)
+        return wrapper
+    return decorator
+
+
+def instrument(namespace: dict, kind: str):
+    """Оборачивает timed все публичные корутины модуля; вызывается в конце модуля с globals()"""
+    module = namespace["__name__"]
+    for attr, value in list(namespace.items()):
+        if (
+            not attr.startswith("_")
+            and inspect.iscoroutinefunction(value)
+            and value.__module__ == module
+        ):
+            namespace[attr] = timed(kind)(value)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware роутера: время, ошибки и число выполняющихся обработчиков"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else type(event).__name__
+        with track_handler(name):
+            return await handler(event, data)
+
+
+class BotAPIMetrics(BaseRequestMiddleware):
+    """Middleware сессии: задержка запросов к Bot API по методам"""
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            bot_api_errors.inc(api_method, type(e).__name__)
+            raise
+        finally:
+            bot_api_duration.observe(time.perf_counter() - started, api_method)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(port: int = None, host: str = None):
+    """Отдает метрики в текстовом формате Prometheus на http://host:port/metrics"""
+    port = Config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+
+    async def handle(request: web.Request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host or Config.METRICS_HOST, port).start()
+    logger.info(f"Metrics available on http://{host or Config.METRICS_HOST}:{port}/metrics")
+    return runner
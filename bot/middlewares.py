@@ -0,0 +1,197 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from cachetools import TTLCache
+from bot.config import Config, is_admin
+from bot.logger import logger
+
+
+THROTTLED_TEXT = "Слишком много нажатий, попробуйте через несколько секунд"
+OVERLOADED_TEXT = "Бот сейчас перегружен, попробуйте чуть позже"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Защита горячих callback-ов: скользящее окно на пользователя для каждого префикса
+    и общий лимит одновременно выполняемых обработчиков.
+    Лишние нажатия получают мгновенный ответ с cache_time, без обращения к БД и Bot API.
+    """
+
+    def __init__(self, rules: dict = None, max_concurrent: int = None, max_users: int = None):
+        rules = rules if rules is not None else Config.THROTTLE_RULES
+        # Длинные префиксы проверяются первыми, чтобы общий префикс не перехватывал частный
+        self.rules = sorted(
+            ((prefix, int(limit), float(period)) for prefix, (limit, period) in rules.items()),
+            key=lambda rule: len(rule[0]),
+            reverse=True
+        )
+        max_users = max_users or Config.THROTTLE_MAX_USERS
+        self.windows = {prefix: TTLCache(maxsize=max_users, ttl=period) for prefix, _, period in self.rules}
+        self.max_concurrent = max_concurrent or Config.THROTTLE_MAX_CONCURRENT
+        self.in_flight = 0
+
+    def _match(self, callback_data: str):
+        for rule in self.rules:
+            if callback_data.startswith(rule[0]):
+                return rule
+        return None
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        rule = self._match(event.data or "")
+        if rule is None:
+            return await handler(event, data)
+
+        prefix, limit, period = rule
+        user_id = event.from_user.id
+        if not is_admin(user_id):
+            now = time.monotonic()
+            window = self.windows[prefix].get(user_id) or deque()
+            while window and window[0] <= now - period:
+                window.popleft()
+            if len(window) >= limit:
+                logger.debug(f"User {user_id} throttled on {prefix}")
+                return await event.answer(THROTTLED_TEXT, cache_time=int(window[0] + period - now) + 1)
+            window.append(now)
+            # Повторная запись продлевает TTL активного пользователя
+            self.windows[prefix][user_id] = window
+
+        if self.in_flight >= self.max_concurrent:
+            logger.warning(f"Callback {prefix} from user {user_id} rejected: {self.in_flight} handlers in flight")
+            return await event.answer(OVERLOADED_TEXT, cache_time=1)
+
+        self.in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.in_flight -= 1
+
+
+TRY_AGAIN_TEXT = "Бот сейчас перегружен, попробуйте еще раз через пару секунд"
+
+
+class Overloaded(Exception):
+    """Очередь нужного приоритета заполнена"""
+
+
+class PriorityAdmission:
+    """
+    Ограничение числа одновременно выполняемых обработчиков с очередями по приоритетам.
+    Освободившийся слот всегда получает самый приоритетный ожидающий: админ,
+    затем интерактивные действия пользователей, затем фоновая работа.
+    """
+
+    ADMIN, INTERACTIVE, BACKGROUND = 0, 1, 2
+    NAMES = {ADMIN: "admin", INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+    def __init__(self, concurrency: int = None, queue_limits: dict = None):
+        self.concurrency = concurrency or Config.HANDLER_CONCURRENCY
+        queue_limits = queue_limits or Config.HANDLER_QUEUE_LIMITS
+        self.queue_limits = {priority: queue_limits[name] for priority, name in self.NAMES.items()}
+        self.queues = {priority: deque() for priority in self.NAMES}
+        self.shed = {priority: 0 for priority in self.NAMES}
+        self.running = 0
+        self._background_tasks = set()
+
+    def stats(self) -> dict:
+        """Глубина очередей, число выполняемых обработчиков и отброшенных событий"""
+        return {
+            "running": self.running,
+            "queued": {self.NAMES[p]: len(queue) for p, queue in self.queues.items()},
+            "shed": {self.NAMES[p]: count for p, count in self.shed.items()}
+        }
+
+    async def _acquire(self, priority: int):
+        if self.running < self.concurrency and not any(self.queues.values()):
+            self.running += 1
+            return
+        queue = self.queues[priority]
+        if len(queue) >= self.queue_limits[priority]:
+            self.shed[priority] += 1
+            raise Overloaded()
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in queue:
+                queue.remove(waiter)
+            elif not waiter.cancelled():
+                # Слот уже выдан, но ожидающий отменен - отдаем слот следующему
+                self._release()
+            raise
+
+    def _release(self):
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.running -= 1
+
+    async def run(self, func: Callable[[], Awaitable[Any]], priority: int) -> Any:
+        await self._acquire(priority)
+        try:
+            return await func()
+        finally:
+            self._release()
+
+    def submit(self, func: Callable[..., Awaitable[Any]], *args) -> None:
+        """Запускает фоновую работу с низшим приоритетом, не дожидаясь результата"""
+        async def job():
+            try:
+                await self.run(lambda: func(*args), self.BACKGROUND)
+            except Overloaded:
+                logger.warning(f"Background job {func.__name__} shed due to load")
+            except Exception as e:
+                logger.error(f"Error in background job {func.__name__}: {str(e)}")
+
+        task = asyncio.create_task(job())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+
+admission = PriorityAdmission()
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    """Пропускает обработчики сообщений и callback-ов через PriorityAdmission"""
+
+    def __init__(self, priority_admission: PriorityAdmission = None):
+        self.admission = priority_admission or admission
+
+    @staticmethod
+    def classify(event: TelegramObject) -> int:
+        user = getattr(event, "from_user", None)
+        if user and is_admin(user.id):
+            return PriorityAdmission.ADMIN
+        if isinstance(event, CallbackQuery):
+            return PriorityAdmission.INTERACTIVE
+        if isinstance(event, Message) and event.chat.type == "private":
+            return PriorityAdmission.INTERACTIVE
+        return PriorityAdmission.BACKGROUND
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        priority = self.classify(event)
+        try:
+            return await self.admission.run(lambda: handler(event, data), priority)
+        except Overloaded:
+            logger.warning(f"{PriorityAdmission.NAMES[priority]} event shed: {self.admission.stats()['queued']}")
+            if isinstance(event, CallbackQuery):
+                return await event.answer(TRY_AGAIN_TEXT, cache_time=2)
+            if isinstance(event, Message) and event.chat.type == "private":
+                return await event.answer(TRY_AGAIN_TEXT)
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from cachetools import TTLCache
+from bot.config import Config
+from bot.logger import logger
+
+
+INTERACTIVE, ANNOUNCEMENT, BROADCAST = 0, 1, 2
+LANE_NAMES = {INTERACTIVE: "interactive", ANNOUNCEMENT: "announcement", BROADCAST: "broadcast"}
+
+# Полоса текущей задачи; все, что не помечено явно, считается ответом пользователю
+current_lane: ContextVar[int] = ContextVar("outbound_lane", default=INTERACTIVE)
+
+# Методы, которые Telegram считает сообщениями и ограничивает по частоте
+SEND_METHODS = frozenset({
+    "sendMessage", "sendPhoto", "sendMediaGroup", "sendDocument", "sendVideo",
+    "sendAnimation", "sendAudio", "sendVoice", "sendSticker", "copyMessage", "forwardMessage"
+})
+EDIT_METHODS = frozenset({
+    "editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup"
+})
+
+
+@contextmanager
+def use_lane(lane: int):
+    """Помечает исходящие запросы блока полосой lane"""
+    token = current_lane.set(lane)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """
+    Middleware сессии Bot API: общий лимит сообщений бота, лимиты на чат и повтор после 429.
+    Свободный слот общего лимита получает самая приоритетная ожидающая полоса,
+    поэтому рассылка забирает только то, что осталось после ответов пользователям и анонсов.
+    """
+
+    def __init__(
+        self,
+        rate: float = None,
+        private_interval: float = None,
+        group_limit: tuple = None,
+        max_retries: int = None,
+        max_chats: int = 100000
+    ):
+        # Лимит Telegram общий на бота, поэтому делится между процессами-воркерами
+        self.rate = rate or Config.OUTBOUND_RATE / max(1, Config.WORKERS)
+        self.private_interval = private_interval or Config.OUTBOUND_PRIVATE_INTERVAL
+        self.group_limit, self.group_period = group_limit or Config.OUTBOUND_GROUP_LIMIT
+        self.max_retries = Config.OUTBOUND_MAX_RETRIES if max_retries is None else max_retries
+        self.queues = {lane: deque() for lane in LANE_NAMES}
+        self.sent = {lane: 0 for lane in LANE_NAMES}
+        self.retries = 0
+        self._tokens = self.rate
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._pump = None
+        # chat_id -> время следующего сообщения (личные) или очередь отправок (группы)
+        self._chats = TTLCache(maxsize=max_chats, ttl=max(self.private_interval, self.group_period))
+
+    def stats(self) -> dict:
+        """Глубина очередей, отправленные запросы по полосам и число повторов после 429"""
+        return {
+            "queued": {LANE_NAMES[lane]: len(queue) for lane, queue in self.queues.items()},
+            "sent": {LANE_NAMES[lane]: count for lane, count in self.sent.items()},
+            "retries": self.retries,
+            "paused_for": max(0.0, self._paused_until - time.monotonic())
+        }
+
+    def _reserve_chat(self, chat_id) -> float:
+        """Резервирует место в лимите чата и возвращает, сколько ждать до отправки"""
+        now = time.monotonic()
+        if isinstance(chat_id, int) and chat_id > 0:
+            slot = max(now, self._chats.get(chat_id, 0.0))
+            self._chats[chat_id] = slot + self.private_interval
+            return slot - now
+
+        window = self._chats.get(chat_id) or deque()
+        while window and window[0] <= now - self.group_period:
+            window.popleft()
+        slot = now
+        if len(window) >= self.group_limit:
+            slot = max(now, window[-self.group_limit] + self.group_period)
+        window.append(slot)
+        self._chats[chat_id] = window
+        return slot - now
+
+    def _take_token(self) -> float:
+        """Забирает токен общего лимита или возвращает, сколько до него ждать"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def _next_waiter(self):
+        for lane in sorted(self.queues):
+            queue = self.queues[lane]
+            while queue and queue[0].done():
+                queue.popleft()
+            if queue:
+                return queue
+        return None
+
+    async def _run_pump(self):
+        while True:
+            queue = self._next_waiter()
+            if queue is None:
+                return
+            delay = self._take_token()
+            if delay > 0:
+                # После ожидания очередь выбирается заново: мог прийти более срочный запрос
+                await asyncio.sleep(delay)
+                continue
+            queue.popleft().set_result(None)
+
+    async def _acquire(self, lane: int):
+        waiter = asyncio.get_running_loop().create_future()
+        self.queues[lane].append(waiter)
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in self.queues[lane]:
+                self.queues[lane].remove(waiter)
+            raise
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        is_send = api_method in SEND_METHODS
+        if not is_send and api_method not in EDIT_METHODS:
+            return await make_request(bot, method)
+
+        lane = current_lane.get()
+        chat_id = getattr(method, "chat_id", None)
+        for attempt in range(self.max_retries + 1):
+            if is_send and chat_id is not None:
+                delay = self._reserve_chat(chat_id)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self._acquire(lane)
+            try:
+                response = await make_request(bot, method)
+                self.sent[lane] += 1
+                return response
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                # Flood control действует на весь бот: приостанавливаются все полосы
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logger.warning(
+                    f"Bot API flood control on {api_method} ({LANE_NAMES[lane]}), "
+                    f"retry in {e.retry_after}s (attempt {attempt + 1})"
+                )
+
+
+outbound = OutboundDispatcher()
@@ -0,0 +1,78 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import tracemalloc
+from bot.config import Config
+from bot.logger import logger
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+# Одновременно работает только один профилировщик: cProfile не вкладывается
+_lock = asyncio.Lock()
+
+
+async def profile_cpu(seconds: float, top: int = 30) -> tuple:
+    """
+    Профилирует цикл событий seconds секунд через cProfile.
+    Возвращает (отчет top функций по cumulative, содержимое .prof для snakeviz/pstats)
+    """
+    if _lock.locked():
+        raise ProfilerBusy()
+    async with _lock:
+        profiler = cProfile.Profile()
+        logger.info(f"CPU profiling started for {seconds}s")
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+
+        report = io.StringIO()
+        stats = pstats.Stats(profiler, stream=report)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
+        handle, path = tempfile.mkstemp(suffix=".prof")
+        os.close(handle)
+        try:
+            profiler.dump_stats(path)
+            with open(path, "rb") as file:
+                data = file.read()
+        finally:
+            os.remove(path)
+        logger.info("CPU profiling finished")
+        return report.getvalue(), data
+
+
+async def profile_memory(seconds: float, top: int = 20) -> str:
+    """
+    Снимки tracemalloc в начале и в конце интервала.
+    Возвращает отчет: где выросло потребление памяти и крупнейшие места выделения
+    """
+    if _lock.locked():
+        raise ProfilerBusy()
+    async with _lock:
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(Config.PROFILE_TRACEMALLOC_FRAMES)
+        logger.info(f"Memory profiling started for {seconds}s")
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+
+        lines = [f"Отслежено сейчас: {current / 1024 / 1024:.1f} МБ, пик: {peak / 1024 / 1024:.1f} МБ", "", "Рост за интервал:"]
+        lines.extend(str(stat) for stat in after.compare_to(before, "lineno")[:top])
+        lines.extend(["", "Крупнейшие места выделения:"])
+        lines.extend(str(stat) for stat in after.statistics("lineno")[:top])
+        logger.info("Memory profiling finished")
+        return "\n".join(lines)
@@ -0,0 +1,144 @@
+import re
+import time
+from bot.config import Config
+from bot.logger import logger
+
+
+# Операторы, для которых SQLite умеет строить план запроса
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+OTHER = "<other>"
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql: str) -> str:
+    """Текст запроса без литералов и лишних пробелов: одинаковые запросы с разными значениями совпадают"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _PLACEHOLDER_LIST.sub("(?, ...)", sql)
+
+
+def redact(parameters) -> str:
+    """Вместо значений параметров - только их типы и длины строк"""
+    if not parameters:
+        return "()"
+    values = parameters.values() if isinstance(parameters, dict) else parameters
+    described = []
+    for value in values:
+        if isinstance(value, (str, bytes)):
+            described.append(f"{type(value).__name__}[{len(value)}]")
+        else:
+            described.append(type(value).__name__)
+    return "(" + ", ".join(described) + ")"
+
+
+class QueryStats:
+    """
+    Агрегаты по отпечаткам запросов: число выполнений, суммарное и максимальное время,
+    число медленных выполнений и EXPLAIN QUERY PLAN первого медленного выполнения.
+    Сверх max_fingerprints запросы копятся в общей записи OTHER, у которой плана нет:
+    в ней смешаны разные запросы
+    """
+
+    def __init__(self, slow_ms: float = None, max_fingerprints: int = None):
+        self.slow_seconds = (Config.DB_SLOW_QUERY_MS if slow_ms is None else slow_ms) / 1000
+        self.max_fingerprints = max_fingerprints or Config.DB_QUERY_STATS_SIZE
+        self.queries = {}
+
+    def record(self, sql: str, elapsed: float) -> dict:
+        key = fingerprint(sql)
+        entry = self.queries.get(key)
+        if entry is None:
+            if len(self.queries) >= self.max_fingerprints:
+                # Запросы с литералами в тексте не должны вытеснять остальные
+                key = OTHER
+                entry = self.queries.get(key)
+            if entry is None:
+                entry = self.queries[key] = {
+                    "fingerprint": key, "count": 0, "total": 0.0, "max": 0.0, "slow": 0, "plan": None
+                }
+        entry["count"] += 1
+        entry["total"] += elapsed
+        entry["max"] = max(entry["max"], elapsed)
+        if elapsed >= self.slow_seconds:
+            entry["slow"] += 1
+        return entry
+
+    def top(self, limit: int = 10, slow_only: bool = True) -> list:
+        entries = [entry for entry in self.queries.values() if entry["slow"] or not slow_only]
+        return sorted(entries, key=lambda entry: entry["total"], reverse=True)[:limit]
+
+    def reset(self):
+        self.queries.clear()
+
+
+query_stats = QueryStats()
+
+
+def is_full_scan(plan: list) -> bool:
+    """В плане есть SCAN таблицы без индекса"""
+    return any(line.strip().startswith("SCAN") and "INDEX" not in line for line in plan or [])
+
+
+class InstrumentedConnection:
+    """
+    Обертка соединения aiosqlite: замеряет каждый запрос, пишет в лог медленные
+    (с параметрами без значений) и сохраняет план первого медленного выполнения
+    каждого отпечатка. Остальные методы передаются соединению как есть.
+    """
+
+    def __init__(self, connection, stats: QueryStats = None):
+        self._connection = connection
+        self._stats = stats or query_stats
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    async def execute(self, sql: str, parameters=None):
+        started = time.perf_counter()
+        try:
+            return await self._connection.execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            entry = self._stats.record(sql, elapsed)
+            if elapsed >= self._stats.slow_seconds:
+                logger.warning(
+                    f"Slow query {elapsed * 1000:.1f}ms: {fingerprint(sql)[:500]} params={redact(parameters)}"
+                )
+                if entry["plan"] is None and entry["fingerprint"] != OTHER:
+                    entry["plan"] = await self._explain(sql, parameters)
+
+    async def executemany(self, sql: str, parameters):
+        parameters = list(parameters)
+        started = time.perf_counter()
+        try:
+            return await self._connection.executemany(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            entry = self._stats.record(sql, elapsed)
+            if elapsed >= self._stats.slow_seconds:
+                logger.warning(
+                    f"Slow query {elapsed * 1000:.1f}ms: {fingerprint(sql)[:500]} rows={len(parameters)}"
+                )
+                if entry["plan"] is None and entry["fingerprint"] != OTHER and parameters:
+                    entry["plan"] = await self._explain(sql, parameters[0])
+
+    async def _explain(self, sql: str, parameters) -> list:
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        try:
+            cursor = await self._connection.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+            # Строки плана: (id, parent, notused, detail); отступ по глубине вложенности
+            depth = {0: -1}
+            plan = []
+            for node_id, parent, _, detail in await cursor.fetchall():
+                depth[node_id] = depth.get(parent, -1) + 1
+                plan.append("  " * depth[node_id] + detail)
+            return plan
+        except Exception as e:
+            logger.error(f"Error in explain for slow query: {str(e)}")
+            return [f"EXPLAIN failed: {str(e)}"]
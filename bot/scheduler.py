@@ -5,73 +5,109 @@ import bot.db as db
 import bot.services.google_api_service as google_api
 from aiogram import Bot
 import random
-import json
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.schedulers.base import STATE_RUNNING
+from bot.config import Config
 from bot.logger import logger
+from bot.metrics import timed
+from bot.outbound import use_lane, ANNOUNCEMENT
+from aiogram.exceptions import TelegramForbiddenError
 
 
 scheduler = AsyncIOScheduler()
 
+MESSAGE_LIMIT = 4096  # максимальная длина сообщения Telegram
 
+
+@timed("job")
 async def announce_giveaway_results(bot: Bot, giveaway_id: int):
+    claimed = False
     try:
         giveaway = await db.get_giveaway_details(giveaway_id)
         if not giveaway:
             logger.warning(f"Giveaway {giveaway_id} not found for announcement")
             return
 
+        # Защита от повторного розыгрыша при смене лидера
+        if not await db.claim_giveaway_announcement(giveaway_id):
+            logger.warning(f"Giveaway {giveaway_id} is already being announced, skipping")
+            return
+        claimed = True
+
         # Получаем текущих победителей (если есть)
-        current_winners = json.loads(giveaway['winners_ids']) if giveaway['winners_ids'] else []
-        
-        # Получаем всех участников
-        participants = await db.get_participants(giveaway_id)
+        current_winners = await db.get_winners(giveaway_id)
         
         # Если нужно добавить еще победителей
         if len(current_winners) < giveaway['winners_count']:
+            # Получаем всех участников
+            participants = await db.get_participants(giveaway_id)
             remaining_winners_count = giveaway['winners_count'] - len(current_winners)
-            remaining_participants = [p for p in participants if p not in current_winners]
+            selected = set(current_winners)
+            remaining_participants = [p for p in participants if p not in selected]
             
             # Выбираем дополнительных победителей
             new_winners = await select_winners(remaining_participants, remaining_winners_count)
             current_winners.extend(new_winners)
             
-            # Сохраняем обновленный список победителей
-            await db.set_winners(giveaway_id, current_winners)
+            # Сохраняем новых победителей
+            await db.add_winners(giveaway_id, new_winners, source='auto')
         
-        # Формируем и отправляем сообщение с победителями
-        await send_winners_announcement(bot, giveaway, current_winners)
+        # Формируем и отправляем сообщение с победителями, затем уведомляем их в личных сообщениях
+        winners_info = await db.get_users_info(current_winners)
+        await send_winners_announcement(bot, giveaway, current_winners, winners_info)
+        await notify_winners(bot, giveaway, current_winners)
+        await db.finish_giveaway_announcement(giveaway_id)
+        claimed = False
         
         # Обновляем данные в Google Sheets
         await google_api.update_giveaway_stats()
         
-        # Удаляем розыгрыш после завершения
-        await db.delete_giveaway(giveaway_id)
+        # Переносим розыгрыш в архив, чтобы не терять историю участников и победителей
+        await db.archive_giveaway(giveaway_id)
         logger.info(f"Giveaway {giveaway_id} results announced successfully")
     except Exception as e:
         logger.error(f"Error in announce_giveaway_results for giveaway {giveaway_id}: {str(e)}")
+        if claimed:
+            # Объявление не завершено: аренда снимается, и его повторит ближайшая синхронизация лидера
+            await db.release_giveaway_announcement(giveaway_id)
 
 
+@timed("job")
 async def restore_scheduled_giveaways(bot: Bot):
-    """Восстановление запланированных розыгрышей при перезапуске бота"""
+    """
+    Восстановление запланированных розыгрышей при перезапуске бота и смене лидера.
+    Розыгрыши, срок которых прошел, пока лидера не было или планировщик стоял на паузе,
+    объявляются сразу; повторное объявление исключает аренда claim_giveaway_announcement,
+    а прерванное объявление повторяется после ее снятия или истечения.
+    """
     try:
-        from datetime import datetime
-        now = datetime.now().strftime("%Y-%m-%d %H:%M")
+        now = datetime.now()
 
         cursor = await db.db_connection.execute(
-            "SELECT id, announcement_date FROM giveaways "
-            "WHERE datetime(announcement_date) > datetime(?)",
-            (now,)
+            "SELECT id, announcement_date FROM giveaways WHERE announced_at IS NULL"
         )
         active_giveaways = await cursor.fetchall()
 
         for giveaway_id, announcement_date in active_giveaways:
+            if scheduler.get_job(f"giveaway_{giveaway_id}"):
+                continue
             try:
-                announcement_datetime = datetime.strptime(announcement_date, "%Y-%m-%d %H:%M:%S")
+                announcement_datetime = datetime.strptime(announcement_date, db.DATE_FORMAT)
+                if announcement_datetime <= now:
+                    # Без триггера APScheduler запускает задачу немедленно
+                    scheduler.add_job(
+                        announce_giveaway_results,
+                        args=[bot, giveaway_id],
+                        id=f"giveaway_{giveaway_id}"
+                    )
+                    logger.info(f"Announcing overdue giveaway {giveaway_id}")
+                    continue
                 scheduler.add_job(
                     announce_giveaway_results,
                     trigger=DateTrigger(announcement_datetime),
                     args=[bot, giveaway_id],
-                    id=f"giveaway_{giveaway_id}"
+                    id=f"giveaway_{giveaway_id}",
+                    misfire_grace_time=None
                 )
                 logger.info(f"Restored scheduled giveaway {giveaway_id}")
             except Exception as e:
@@ -80,11 +116,32 @@ async def restore_scheduled_giveaways(bot: Bot):
         logger.error(f"Error in restore_scheduled_giveaways: {str(e)}")
 
 
+async def schedule_new_giveaways(bot: Bot):
+    """
+    Планирование только что созданных розыгрышей. Задачи ставит лишь работающий планировщик
+    лидера тем же путем, что и при восстановлении; на остальных экземплярах планировщик
+    остановлен или на паузе, и розыгрыш подхватит ближайшая синхронизация лидера.
+    """
+    if scheduler.state == STATE_RUNNING:
+        await restore_scheduled_giveaways(bot)
+
+
 async def setup_scheduler(bot: Bot):
-    """Настройка планировщика"""
+    """Запуск планировщика. Вызывается, когда воркер становится лидером"""
     try:
-        scheduler.add_job(hourly_update, 'interval', hours=1)
-        scheduler.start()
+        scheduler.add_job(hourly_update, 'interval', hours=1, id="hourly_update", replace_existing=True)
+        # Подхватываем розыгрыши, созданные другими воркерами
+        scheduler.add_job(
+            restore_scheduled_giveaways, 'interval',
+            seconds=Config.SCHEDULER_SYNC_INTERVAL,
+            args=[bot],
+            id="sync_giveaways",
+            replace_existing=True
+        )
+        if scheduler.running:
+            scheduler.resume()
+        else:
+            scheduler.start()
         await restore_scheduled_giveaways(bot)
         logger.info("Scheduler setup completed successfully")
     except Exception as e:
@@ -92,6 +149,14 @@ async def setup_scheduler(bot: Bot):
         raise
 
 
+async def pause_scheduler():
+    """Приостанавливает планировщик, когда воркер перестает быть лидером"""
+    if scheduler.running:
+        scheduler.pause()
+        logger.info("Scheduler paused")
+
+
+@timed("job")
 async def hourly_update():
     """Ежечасное обновление данных в Google Sheets"""
     try:
@@ -120,8 +185,9 @@ async def select_winners(participants: list, winners_count: int) -> list:
         
         # Создаем взвешенный список участников
         weighted_participants = []
+        users = await db.get_users_info(participants)
         for user_id in participants:
-            user = await db.get_user_info(user_id)
+            user = users.get(user_id)
             if not user:
                 continue
             
@@ -157,24 +223,72 @@ async def select_winners(participants: list, winners_count: int) -> list:
         return random.sample(participants, min(winners_count, len(participants)))
 
 
-async def send_winners_announcement(bot: Bot, giveaway: dict, winners: list):
-    """Отправляет сообщение с победителями"""
+def split_message(header: str, lines: list, footer: str = "", limit: int = MESSAGE_LIMIT) -> list:
+    """Делит текст на сообщения не длиннее limit, не разрывая строки"""
+    chunks = []
+    current = header
+    for line in lines:
+        line = line[:limit - 1]
+        if len(current) + len(line) + 1 > limit:
+            chunks.append(current.rstrip("\n"))
+            current = ""
+        current += line + "\n"
+    if footer and len(current) + len(footer) > limit:
+        chunks.append(current.rstrip("\n"))
+        current = ""
+    current += footer
+    chunks.append(current.rstrip("\n"))
+    return chunks
+
+
+async def send_winners_announcement(bot: Bot, giveaway: dict, winners: list, winners_info: dict = None):
+    """Отправляет сообщение с победителями, при необходимости несколькими частями"""
     try:
         if not winners:
-            message = f"🏆 Розыгрыш '{giveaway['name']}' завершен!\n\nК сожалению, не было участников."
+            chunks = [f"🏆 Розыгрыш '{giveaway['name']}' завершен!\n\nК сожалению, не было участников."]
         else:
-            winners_info = []
+            if winners_info is None:
+                winners_info = await db.get_users_info(winners)
+            names = []
             for winner_id in winners:
-                user = await db.get_user_info(winner_id)
-                name = f"@{user['username']}" if user and user.get('username') else f"ID:{winner_id}"
-                winners_info.append(name)
+                user = winners_info.get(winner_id)
+                names.append(f"@{user['username']}" if user and user.get('username') else f"ID:{winner_id}")
             
-            message = (
-                f"🏆 Розыгрыш '{giveaway['name']}' завершен!\n\n"
-                f"Победители:\n" + "\n".join(winners_info) + "\n\nПоздравляем!"
+            chunks = split_message(
+                f"🏆 Розыгрыш '{giveaway['name']}' завершен!\n\nПобедители:\n",
+                names,
+                "\nПоздравляем!"
             )
         
-        await bot.send_message(giveaway['channel_id'], message)
-        logger.info(f"Winners announcement sent to channel {giveaway['channel_id']}")
+        with use_lane(ANNOUNCEMENT):
+            for chunk in chunks:
+                await bot.send_message(giveaway['channel_id'], chunk)
+        logger.info(f"Winners announcement sent to channel {giveaway['channel_id']} in {len(chunks)} messages")
     except Exception as e:
-        logger.error(f"Error in send_winners_announcement: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error in send_winners_announcement: {str(e)}")
+
+
+async def notify_winners(bot: Bot, giveaway: dict, winners: list):
+    """Личные уведомления победителям; темп задает outbound, итог сохраняется по каждому"""
+    text = f"🎉 Поздравляем! Вы стали победителем розыгрыша '{giveaway['name']}'!"
+
+    async def notify(user_id: int):
+        try:
+            await bot.send_message(user_id, text)
+            return 'sent'
+        except TelegramForbiddenError:
+            return 'blocked'
+        except Exception as e:
+            logger.warning(f"Error notifying winner {user_id} of giveaway {giveaway['id']}: {str(e)}")
+            return 'failed'
+
+    if not winners:
+        return
+    with use_lane(ANNOUNCEMENT):
+        statuses = await asyncio.gather(*(notify(user_id) for user_id in winners))
+    results = dict(zip(winners, statuses))
+    await db.set_winners_notify_status(giveaway['id'], results)
+    logger.info(
+        f"Winners of giveaway {giveaway['id']} notified: "
+        f"{statuses.count('sent')} sent, {statuses.count('blocked')} blocked, {statuses.count('failed')} failed"
+    )
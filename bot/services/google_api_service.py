@@ -4,8 +4,8 @@ from oauth2client.service_account import ServiceAccountCredentials
 from bot.config import Config
 import httplib2
 from bot.logger import logger
+from bot.metrics import instrument
 import bot.db as db
-import json
 
 
 
@@ -167,7 +167,7 @@ async def update_giveaways_sheet(giveaways_data):
             continue
             
         participants = await db.get_participants(giveaway['id'])
-        winners = json.loads(giveaway['winners_ids']) if giveaway['winners_ids'] else []
+        winners = await db.get_winners(giveaway['id'])
         
         channel_info = await db.get_channel(giveaway['channel_id'])
         channel_name = channel_info[1] if channel_info else f"Канал {giveaway['channel_id']}"
@@ -217,4 +217,8 @@ async def update_giveaway_stats():
         await update_giveaways_sheet(giveaways)
     except Exception as e:
         logger.error(f"Error in update_giveaway_stats: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+# Время и ошибки вызовов Google Sheets для /metrics
+instrument(globals(), "sheets")
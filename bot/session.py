@@ -0,0 +1,101 @@
+import ssl
+import certifi
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from aiogram.__meta__ import __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer, PRODUCTION
+from bot.config import Config
+from bot.logger import logger
+from bot.metrics import BotAPIMetrics
+from bot.outbound import outbound as outbound_dispatcher
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _orjson_dumps(obj) -> str:
+    return orjson.dumps(obj).decode()
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """AiohttpSession, собирающая TCPConnector с лимитом на хост, keep-alive и TTL кэша DNS"""
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 15,
+        ttl_dns_cache: int = 3600,
+        **kwargs
+    ):
+        super().__init__(limit=limit, **kwargs)
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+
+    def create_connector(self) -> TCPConnector:
+        return TCPConnector(
+            ssl=ssl.create_default_context(cafile=certifi.where()),
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache
+        )
+
+    async def create_session(self) -> ClientSession:
+        # Прокси требует своего коннектора, его собирает aiogram
+        if self.proxy is not None:
+            return await super().create_session()
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self.create_connector(),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"}
+            )
+        return self._session
+
+
+def create_session(
+    api_url: str = None,
+    pool_size: int = None,
+    pool_per_host: int = None,
+    keepalive: float = None,
+    dns_ttl: int = None,
+    timeout: float = None,
+    fast_json: bool = None,
+    outbound: bool = True
+) -> AiohttpSession:
+    """
+    Сессия Bot API с настраиваемым пулом соединений.
+    Все запросы идут на один хост, поэтому пул держит соединения открытыми
+    между рассылкой и интерактивными ответами, а не переподключается на каждый пакет.
+    С настройками по умолчанию пул такой же, как у aiogram; выигрыш дает только
+    пул больше числа одновременных запросов при заметной задержке API (см. benchmarks/bench_session.py).
+    При outbound запросы проходят через полосы приоритетов bot.outbound;
+    метрики снимаются внутри лимитов и показывают время самого запроса к API.
+    """
+    fast_json = Config.BOT_API_FAST_JSON if fast_json is None else fast_json
+    api_url = api_url or Config.BOT_API_URL
+    json_options = {}
+    if fast_json and orjson is not None:
+        json_options = {"json_loads": orjson.loads, "json_dumps": _orjson_dumps}
+    elif fast_json:
+        logger.warning("BOT_API_FAST_JSON is enabled but orjson is not installed, using json")
+
+    session = TunedAiohttpSession(
+        api=TelegramAPIServer.from_base(api_url) if api_url else PRODUCTION,
+        limit=pool_size or Config.BOT_API_POOL_SIZE,
+        limit_per_host=Config.BOT_API_POOL_PER_HOST if pool_per_host is None else pool_per_host,
+        keepalive_timeout=keepalive or Config.BOT_API_KEEPALIVE,
+        ttl_dns_cache=dns_ttl or Config.BOT_API_DNS_TTL,
+        timeout=timeout or Config.BOT_API_TIMEOUT,
+        **json_options
+    )
+    if outbound:
+        session.middleware(outbound_dispatcher)
+    session.middleware(BotAPIMetrics())
+    return session
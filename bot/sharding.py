@@ -0,0 +1,238 @@
+import asyncio
+import multiprocessing
+import queue
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from bot.config import Config
+from bot.session import create_session
+from bot.logger import logger
+from bot.metrics import Gauge, start_metrics_server
+from bot.watchdog import watchdog
+
+
+# Ключ шардирования: пользователь, иначе чат. Все апдейты одного пользователя
+# попадают в один воркер, поэтому FSM-сценарии обрабатываются по порядку
+def get_shard_key(update: dict) -> int:
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if user and "id" in user:
+            return user["id"]
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+def get_shard(update: dict, workers: int) -> int:
+    return get_shard_key(update) % workers
+
+
+class UpdateSharder:
+    """Фронт-процесс: принимает апдейты и раскладывает их по очередям воркеров"""
+
+    def __init__(self, workers: int, queue_size: int = None):
+        self.workers = workers
+        self.context = multiprocessing.get_context("spawn")
+        self.queues = [self.context.Queue(maxsize=queue_size or Config.WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self.processes = []
+
+    def start_workers(self):
+        for index, worker_queue in enumerate(self.queues):
+            process = self.context.Process(target=worker_main, args=(index, worker_queue), name=f"bot-worker-{index}")
+            process.start()
+            self.processes.append(process)
+        logger.info(f"Started {self.workers} bot workers")
+
+    def queue_depths(self) -> list:
+        """Глубина очереди каждого воркера"""
+        return [worker_queue.qsize() for worker_queue in self.queues]
+
+    async def dispatch(self, update: dict):
+        worker_queue = self.queues[get_shard(update, self.workers)]
+        try:
+            worker_queue.put_nowait(update)
+        except queue.Full:
+            # Очередь воркера заполнена - ждем, не блокируя цикл событий
+            await asyncio.get_running_loop().run_in_executor(None, worker_queue.put, update)
+
+    async def log_queue_depths(self, interval: float = 60):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"Worker queue depths: {self.queue_depths()}")
+
+    def stop_workers(self, timeout: float = 30):
+        for worker_queue in self.queues:
+            worker_queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in time, terminating")
+                process.terminate()
+        for worker_queue in self.queues:
+            worker_queue.close()
+        logger.info("All bot workers stopped")
+
+
+async def poll_updates(bot: Bot, sharder: UpdateSharder, allowed_updates: list, polling_timeout: int = 30):
+    """Long polling без разбора апдейтов в модели: фронт только читает JSON и шардирует"""
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    offset = None
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                params = {"timeout": polling_timeout, "allowed_updates": allowed_updates}
+                if offset is not None:
+                    params["offset"] = offset
+                async with session.post(url, json=params, timeout=aiohttp.ClientTimeout(total=polling_timeout + 10)) as response:
+                    result = await response.json()
+                if not result.get("ok"):
+                    logger.error(f"getUpdates failed: {result.get('description')}")
+                    await asyncio.sleep(result.get("parameters", {}).get("retry_after", 1))
+                    continue
+                for update in result["result"]:
+                    offset = update["update_id"] + 1
+                    await sharder.dispatch(update)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in poll_updates: {str(e)}")
+                await asyncio.sleep(1)
+
+
+async def run_webhook(bot: Bot, sharder: UpdateSharder, allowed_updates: list):
+    """Прием апдейтов через webhook с тем же шардированием"""
+    async def handle(request: web.Request):
+        if Config.WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != Config.WEBHOOK_SECRET:
+            return web.Response(status=401)
+        await sharder.dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(Config.WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, Config.WEBHOOK_HOST, Config.WEBHOOK_PORT).start()
+    await bot.set_webhook(
+        Config.WEBHOOK_URL,
+        allowed_updates=allowed_updates,
+        secret_token=Config.WEBHOOK_SECRET or None
+    )
+    logger.info(f"Webhook set to {Config.WEBHOOK_URL}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_front(workers: int):
+    """Точка входа фронт-процесса"""
+    from bot.db import init_db, close_db
+    from bot.handlers import router
+
+    # Схема и миграции выполняются один раз здесь, до запуска воркеров
+    await init_db()
+    await close_db()
+
+    bot = Bot(token=Config.BOT_TOKEN, session=create_session(outbound=False))
+    dp = Dispatcher()
+    dp.include_router(router)
+    allowed_updates = dp.resolve_used_update_types()
+
+    sharder = UpdateSharder(workers)
+    sharder.start_workers()
+    depth_task = asyncio.create_task(sharder.log_queue_depths())
+    Gauge(
+        "bot_worker_queue_depth", "Апдейты в очереди воркера", ("worker",),
+        collect=lambda: {(str(index),): depth for index, depth in enumerate(sharder.queue_depths())}
+    )
+    metrics_server = await start_metrics_server()
+    if Config.LOOP_WATCHDOG:
+        watchdog.start()
+    try:
+        if Config.WEBHOOK_URL:
+            await run_webhook(bot, sharder, allowed_updates)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            logger.info("Webhook deleted. Starting sharded polling...")
+            await poll_updates(bot, sharder, allowed_updates)
+    finally:
+        depth_task.cancel()
+        await watchdog.stop()
+        if metrics_server:
+            await metrics_server.cleanup()
+        await asyncio.get_running_loop().run_in_executor(None, sharder.stop_workers)
+        await bot.session.close()
+
+
+def worker_main(index: int, worker_queue):
+    """Точка входа процесса-воркера"""
+    try:
+        asyncio.run(run_worker(index, worker_queue))
+    except KeyboardInterrupt:
+        pass
+
+
+async def run_worker(index: int, worker_queue):
+    from functools import partial
+    from bot.db import connect_db, close_db
+    from bot.handlers import router
+    from bot.leader import LeaderElector
+    from bot.scheduler import setup_scheduler, pause_scheduler
+    from bot.storage import SQLiteStorage
+
+    bot = Bot(token=Config.BOT_TOKEN, session=create_session())
+    # Все апдейты пользователя приходят в один воркер (get_shard_key), поэтому его FSM-ключи
+    # пишет только этот процесс и кэш не расходится с базой
+    dp = Dispatcher(bot=bot, storage=SQLiteStorage(exclusive=True))
+    dp.include_router(router)
+    await connect_db()
+    # Каждый воркер отдает свои метрики на следующем за фронтом порту
+    metrics_server = await start_metrics_server(Config.METRICS_PORT + 1 + index if Config.METRICS_PORT else 0)
+    if Config.LOOP_WATCHDOG:
+        watchdog.start()
+
+    elector = LeaderElector("scheduler", on_elected=partial(setup_scheduler, bot), on_demoted=pause_scheduler)
+    elector_task = asyncio.create_task(elector.run())
+    logger.info(f"Worker {index} started")
+
+    # Последняя задача каждого ключа: апдейты одного пользователя выполняются
+    # по очереди, разных пользователей - параллельно
+    tails = {}
+
+    async def process(update: dict, previous: asyncio.Task):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            logger.error(f"Worker {index} failed to process update {update.get('update_id')}: {str(e)}")
+
+    def release(key: int, task: asyncio.Task):
+        if tails.get(key) is task:
+            del tails[key]
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            update = await loop.run_in_executor(None, worker_queue.get)
+            if update is None:
+                break
+            key = get_shard_key(update)
+            task = asyncio.create_task(process(update, tails.get(key)))
+            tails[key] = task
+            task.add_done_callback(partial(release, key))
+        if tails:
+            await asyncio.gather(*tails.values(), return_exceptions=True)
+    finally:
+        await elector.stop()
+        await elector_task
+        await watchdog.stop()
+        if metrics_server:
+            await metrics_server.cleanup()
+        await dp.storage.close()
+        await close_db()
+        await bot.session.close()
+        logger.info(f"Worker {index} stopped")
@@ -17,4 +17,9 @@ class ChannelStates(StatesGroup):
 class BroadcastStates(StatesGroup):
     waiting_for_text = State()
     waiting_for_photos = State()
-    confirmation = State()
\ No newline at end of file
+    confirmation = State()
+
+
+class WinnerPickerStates(StatesGroup):
+    page_number = State()
+    search = State()
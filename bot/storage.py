@@ -0,0 +1,158 @@
+import asyncio
+import copy
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+import bot.db as db
+from bot.config import Config
+from bot.logger import logger
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в базе бота.
+    Записи пишутся сразу в SQLite, брошенные сессии удаляются по TTL.
+    LRU-кэш процесса включается только при exclusive=True: кэш не видит записей других
+    процессов, поэтому он допустим, лишь когда FSM-ключи пользователя пишет один процесс -
+    единственный процесс бота или воркер, которому шардинг по пользователю отдает все его апдейты.
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        cache_size: int = None,
+        ttl: int = None,
+        key_builder: Optional[KeyBuilder] = None,
+        cleanup_interval: int = 600,
+        exclusive: bool = False
+    ):
+        self.db_path = db_path or Config.DB_URL
+        self.cache_size = (cache_size or Config.FSM_CACHE_SIZE) if exclusive else 0
+        self.ttl = ttl or Config.FSM_TTL
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cleanup_interval = cleanup_interval
+        # key -> (state, data, expires_at); пустые записи тоже кэшируются,
+        # так как get_state вызывается на каждый апдейт
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._connection = None
+        self._connect_lock = asyncio.Lock()
+        self._last_cleanup = time.time()
+
+    async def _get_connection(self):
+        if self._connection is None:
+            async with self._connect_lock:
+                if self._connection is None:
+                    connection = await db.open_connection(self.db_path)
+                    await connection.execute('''
+                        CREATE TABLE IF NOT EXISTS fsm_storage (
+                            key TEXT PRIMARY KEY,
+                            state TEXT,
+                            data TEXT NOT NULL DEFAULT '{}',
+                            updated_at REAL NOT NULL
+                        )
+                    ''')
+                    await connection.execute(
+                        "CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage(updated_at)"
+                    )
+                    await connection.commit()
+                    self._connection = connection
+        return self._connection
+
+    def _cache_get(self, key: str):
+        record = self._cache.get(key)
+        if record is None:
+            return None
+        if record[2] < time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return record
+
+    def _cache_put(self, key: str, state: Optional[str], data: Dict[str, Any], updated_at: float):
+        if not self.cache_size:
+            return
+        self._cache[key] = (state, data, updated_at + self.ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, key: str):
+        record = self._cache_get(key)
+        if record is not None:
+            return record[0], record[1]
+
+        connection = await self._get_connection()
+        now = time.time()
+        cursor = await connection.execute(
+            "SELECT state, data, updated_at FROM fsm_storage WHERE key = ? AND updated_at > ?",
+            (key, now - self.ttl)
+        )
+        row = await cursor.fetchone()
+        if row:
+            state, data, updated_at = row[0], json.loads(row[1]), row[2]
+        else:
+            state, data, updated_at = None, {}, now
+        self._cache_put(key, state, data, updated_at)
+        return state, data
+
+    async def _save(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        connection = await self._get_connection()
+        now = time.time()
+        if state is None and not data:
+            await connection.execute("DELETE FROM fsm_storage WHERE key = ?", (key,))
+        else:
+            await connection.execute(
+                "INSERT INTO fsm_storage (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                "updated_at = excluded.updated_at",
+                (key, state, json.dumps(data, ensure_ascii=False), now)
+            )
+        await connection.commit()
+        self._cache_put(key, state, data, now)
+
+        if now - self._last_cleanup > self.cleanup_interval:
+            await self.cleanup()
+
+    async def cleanup(self):
+        """Удаляет брошенные сессии старше TTL из базы и кэша"""
+        try:
+            connection = await self._get_connection()
+            now = time.time()
+            self._last_cleanup = now
+            cursor = await connection.execute(
+                "DELETE FROM fsm_storage WHERE updated_at <= ?", (now - self.ttl,)
+            )
+            await connection.commit()
+            for key in [key for key, record in self._cache.items() if record[2] < now]:
+                del self._cache[key]
+            if cursor.rowcount:
+                logger.info(f"FSM storage cleanup: {cursor.rowcount} expired sessions removed")
+        except Exception as e:
+            logger.error(f"Error in FSM storage cleanup: {str(e)}")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        _, data = await self._load(storage_key)
+        await self._save(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        state, _ = await self._load(storage_key)
+        await self._save(storage_key, state, copy.deepcopy(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+        self._cache.clear()
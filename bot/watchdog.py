@@ -0,0 +1,104 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from bot.config import Config
+from bot.logger import logger
+from bot.metrics import Counter, Gauge, Histogram
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+loop_lag = Histogram(
+    "bot_loop_lag_seconds", "Задержка пробуждения цикла событий",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+loop_stalls = Counter("bot_loop_stalls_total", "Блокировки цикла событий дольше порога")
+
+
+class LoopWatchdog:
+    """
+    Сторож цикла событий. Задача в цикле каждые interval секунд засыпает и замеряет,
+    насколько позже запланированного проснулась. Отдельный поток следит за ее пульсом:
+    если цикл не отвечает дольше threshold, в лог пишется стек кода, который его занял.
+    """
+
+    def __init__(self, interval: float = None, threshold: float = None, debug: bool = None, window: int = 1000):
+        self.interval = interval or Config.LOOP_WATCHDOG_INTERVAL
+        self.threshold = threshold or Config.LOOP_LAG_THRESHOLD
+        self.debug = Config.LOOP_DEBUG if debug is None else debug
+        # Последние замеры для перцентилей
+        self.samples = deque(maxlen=window)
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def quantiles(self) -> dict:
+        if not self.samples:
+            return {}
+        ordered = sorted(self.samples)
+        return {
+            (str(q),): ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+            for q in QUANTILES
+        }
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self.debug:
+            # asyncio сам пишет в лог колбэки, выполнявшиеся дольше порога
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._probe())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Loop watchdog started (interval {self.interval}s, threshold {self.threshold}s)")
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            self._thread.join(timeout=self.interval + self.threshold)
+
+    async def _probe(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            lag = max(0.0, self._beat - started - self.interval)
+            self.samples.append(lag)
+            loop_lag.observe(lag)
+            if lag >= self.threshold:
+                loop_stalls.inc()
+                logger.warning(f"Event loop lag {lag * 1000:.0f}ms")
+
+    def _monitor(self):
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            stalled_for = time.monotonic() - beat - self.interval
+            # Об одной блокировке пишем один раз, пока цикл не проснется
+            if stalled_for < self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<no frame>"
+            logger.warning(f"Event loop blocked for {stalled_for * 1000:.0f}ms, current stack:\n{stack}")
+
+
+watchdog = LoopWatchdog()
+loop_lag_quantiles = Gauge(
+    "bot_loop_lag_quantile_seconds", "Перцентили задержки цикла событий по последним замерам",
+    ("quantile",), collect=watchdog.quantiles
+)
@@ -1,27 +1,45 @@
 import asyncio
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from bot.handlers import router
 from bot.config import Config
 from bot.db import init_db
+from bot.storage import SQLiteStorage
 from bot.logger import logger
-from bot.scheduler import setup_scheduler, restore_scheduled_giveaways
+from bot.scheduler import setup_scheduler, pause_scheduler
+from bot.leader import LeaderElector
+from bot.sharding import run_front
+from bot.session import create_session
+from bot.metrics import start_metrics_server
+from bot.watchdog import watchdog
+from functools import partial
 
 
 async def main():
+    elector = None
+    metrics_server = None
     try:
         # Инициализация бота и диспетчера
-        bot = Bot(token=Config.BOT_TOKEN)
-        dp = Dispatcher(bot=bot, storage=MemoryStorage())
+        bot = Bot(token=Config.BOT_TOKEN, session=create_session())
+        # Единственный процесс, обрабатывающий апдейты, может кэшировать FSM
+        dp = Dispatcher(bot=bot, storage=SQLiteStorage(exclusive=True))
 
         # Инициализация базы данных
         await init_db()
         logger.info("Database initialized successfully.")
 
-        # Инициализация планировщика задач
-        await setup_scheduler(bot)
-        await restore_scheduled_giveaways(bot)
-        logger.info("Scheduler started successfully.")
+        # Метрики обработчиков, БД и Bot API на локальном порту
+        metrics_server = await start_metrics_server()
+        if Config.LOOP_WATCHDOG:
+            watchdog.start()
+
+        # Планировщик и синхронизация с Google Sheets работают только на воркере-лидере
+        elector = LeaderElector(
+            "scheduler",
+            on_elected=partial(setup_scheduler, bot),
+            on_demoted=pause_scheduler
+        )
+        elector_task = asyncio.create_task(elector.run())
+        logger.info("Leader election started.")
 
         # Подключение роутера
         dp.include_router(router)
@@ -39,16 +57,25 @@ async def main():
     finally:
         # Корректное завершение работы
         logger.info("Shutting down the bot...")
+        if elector:
+            await elector.stop()
+            await elector_task
+            logger.info("Leader lease released.")
+        await watchdog.stop()
+        if metrics_server:
+            await metrics_server.cleanup()
         if hasattr(dp, '_polling') and dp._polling:
             await dp.stop_polling()
             logger.info("Polling stopped successfully.")
+        await dp.storage.close()
         await bot.session.close()
         logger.info("Bot session closed.")
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        # При WORKERS > 1 апдейты раскладываются по процессам-воркерам по пользователю
+        asyncio.run(run_front(Config.WORKERS) if Config.WORKERS > 1 else main())
     except KeyboardInterrupt:
         logger.info("Bot stopped by user.")
     except Exception as error:
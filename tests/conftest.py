@@ -0,0 +1,31 @@
+import asyncio
+import os
+import sys
+import tempfile
+import pytest
+
+# Конфигурация читается при импорте bot.*, поэтому окружение задается до него
+os.environ["LOG_DIR"] = tempfile.mkdtemp(prefix="bot_tests_logs_")
+os.environ["LOG_CONSOLE"] = "0"
+os.environ["GOOGLE_SHEET_LINK"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def run_db(tmp_path, monkeypatch):
+    """Выполняет корутину на чистой базе: init_db перед ней и закрытие соединения после"""
+    import bot.db as db
+    from bot.config import Config
+
+    monkeypatch.setattr(Config, "DB_URL", str(tmp_path / "bot.db"))
+
+    def run(make_coroutine):
+        async def scenario():
+            await db.init_db()
+            try:
+                return await make_coroutine()
+            finally:
+                await db.close_db()
+        return asyncio.run(scenario())
+
+    return run
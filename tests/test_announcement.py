@@ -0,0 +1,61 @@
+import bot.db as db
+import bot.scheduler as scheduler
+
+
+async def create_overdue_giveaway() -> int:
+    ids = await db.create_giveaways("Розыгрыш", 1, "2000-01-01 00:00:00", [-100])
+    giveaway_id = ids[-100]
+    await db.add_user(1, "user1", "User 1")
+    await db.add_participant(giveaway_id, 1)
+    return giveaway_id
+
+
+def test_claim_is_exclusive_until_lease_expires(run_db):
+    async def scenario():
+        giveaway_id = await create_overdue_giveaway()
+        assert await db.claim_giveaway_announcement(giveaway_id, lease_ttl=60)
+        assert not await db.claim_giveaway_announcement(giveaway_id, lease_ttl=60)
+        # Объявляющий упал, не сняв аренду: после истечения розыгрыш забирает другой
+        await db.db_connection.execute(
+            "UPDATE giveaways SET announce_lease_until = 0 WHERE id = ?", (giveaway_id,))
+        await db.db_connection.commit()
+        assert await db.claim_giveaway_announcement(giveaway_id, lease_ttl=60)
+        assert await db.finish_giveaway_announcement(giveaway_id)
+        assert not await db.claim_giveaway_announcement(giveaway_id, lease_ttl=60)
+
+    run_db(scenario)
+
+
+def test_failed_announcement_is_retried(run_db, monkeypatch):
+    sent = []
+
+    async def failing_announcement(bot, giveaway, winners, winners_info):
+        raise RuntimeError("Bot API is down")
+
+    async def announcement(bot, giveaway, winners, winners_info):
+        sent.append((giveaway["id"], winners))
+
+    async def no_notifications(bot, giveaway, winners):
+        pass
+
+    async def no_sheets():
+        pass
+
+    monkeypatch.setattr(scheduler, "notify_winners", no_notifications)
+    monkeypatch.setattr(scheduler.google_api, "update_giveaway_stats", no_sheets)
+
+    async def scenario():
+        giveaway_id = await create_overdue_giveaway()
+        monkeypatch.setattr(scheduler, "send_winners_announcement", failing_announcement)
+        await scheduler.announce_giveaway_results(None, giveaway_id)
+        details = await db.get_giveaway_details(giveaway_id)
+        assert details["announced_at"] is None and details["announce_lease_until"] is None
+
+        monkeypatch.setattr(scheduler, "send_winners_announcement", announcement)
+        await scheduler.announce_giveaway_results(None, giveaway_id)
+        assert sent == [(giveaway_id, [1])]
+        assert await db.get_giveaway_details(giveaway_id) is None
+        archived = [giveaway async for giveaway in db.iter_archived_giveaways()]
+        assert archived[0]["id"] == giveaway_id and archived[0]["announced_at"]
+
+    run_db(scenario)
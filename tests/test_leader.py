@@ -0,0 +1,66 @@
+import asyncio
+from bot.leader import LeaderElector
+
+
+async def wait_for(condition, timeout: float = 5):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition was not met in time"
+        await asyncio.sleep(0.02)
+
+
+def make_elector(events: list, name: str) -> LeaderElector:
+    async def elected():
+        events.append((name, "up"))
+
+    async def demoted():
+        events.append((name, "down"))
+
+    return LeaderElector("test", on_elected=elected, on_demoted=demoted, lease_ttl=0.6, heartbeat=0.1)
+
+
+def test_single_leader_and_takeover_after_stop(run_db):
+    async def scenario():
+        events = []
+        first, second = make_elector(events, "first"), make_elector(events, "second")
+        first_task = asyncio.create_task(first.run())
+        await wait_for(lambda: first.is_leader)
+        second_task = asyncio.create_task(second.run())
+        await asyncio.sleep(0.3)
+        assert not second.is_leader
+
+        # Остановленный лидер удаляет аренду, второй забирает ее с ближайшим heartbeat
+        await first.stop()
+        await first_task
+        await wait_for(lambda: second.is_leader, timeout=0.5)
+        await second.stop()
+        await second_task
+        assert events == [("first", "up"), ("first", "down"), ("second", "up"), ("second", "down")]
+
+    run_db(scenario)
+
+
+def test_takeover_after_leader_loses_database(run_db):
+    async def scenario():
+        events = []
+        first, second = make_elector(events, "first"), make_elector(events, "second")
+        first_task = asyncio.create_task(first.run())
+        await wait_for(lambda: first.is_leader)
+        second_task = asyncio.create_task(second.run())
+
+        async def broken_acquire():
+            raise OSError("database is unavailable")
+
+        # Лидер перестает продлевать аренду: сам снимает роль до ее истечения,
+        # а второй воркер забирает аренду только после истечения
+        first._try_acquire = broken_acquire
+        await wait_for(lambda: not first.is_leader)
+        await wait_for(lambda: second.is_leader)
+        assert events.index(("first", "down")) < events.index(("second", "up"))
+
+        for elector, task in ((first, first_task), (second, second_task)):
+            await elector.stop()
+            await task
+
+    run_db(scenario)
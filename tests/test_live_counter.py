@@ -0,0 +1,34 @@
+import asyncio
+import bot.db as db
+from bot.live_counter import LiveCounter
+
+
+class FakeBot:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_reply_markup(self, chat_id, message_id, reply_markup):
+        self.edits.append((chat_id, message_id, reply_markup.inline_keyboard[0][0].text))
+
+
+def test_click_storm_gives_bounded_edits_with_db_count(run_db):
+    async def scenario():
+        ids = await db.create_giveaways("Розыгрыш", 1, "2099-01-01 00:00:00", [-100])
+        giveaway_id = ids[-100]
+        bot, counter = FakeBot(), LiveCounter(interval=0.1)
+        for user_id in range(1, 51):
+            await db.add_participant(giveaway_id, user_id)
+            counter.update(bot, giveaway_id, -100, 7)
+        await asyncio.sleep(0.25)
+        assert bot.edits == [(-100, 7, "Участвовать (50)")]
+
+        # Другой воркер записал участников: правка берет число из базы, а не из памяти
+        await db.db_connection.execute(
+            "UPDATE giveaways SET participants_count = 80 WHERE id = ?", (giveaway_id,))
+        await db.db_connection.commit()
+        counter.update(bot, giveaway_id, -100, 7)
+        await asyncio.sleep(0.25)
+        assert bot.edits[-1] == (-100, 7, "Участвовать (80)")
+        assert len(bot.edits) == 2 and not counter._tasks
+
+    run_db(scenario)
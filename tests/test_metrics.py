@@ -0,0 +1,17 @@
+from bot.metrics import Counter, Gauge, REGISTRY, render
+
+
+def test_collected_counter_renders_as_counter():
+    sent = {"interactive": 3}
+    counter = Counter("test_sent_total", "Отправлено", ("lane",), collect=lambda: {(k,): v for k, v in sent.items()})
+    gauge = Gauge("test_queued", "В очереди", collect=lambda: {(): 2})
+    try:
+        text = render()
+        assert "# TYPE test_sent_total counter" in text
+        assert 'test_sent_total{lane="interactive"} 3' in text
+        sent["interactive"] = 5
+        assert 'test_sent_total{lane="interactive"} 5' in render()
+        assert "# TYPE test_queued gauge\ntest_queued 2" in text
+    finally:
+        REGISTRY.remove(counter)
+        REGISTRY.remove(gauge)
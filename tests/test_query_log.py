@@ -0,0 +1,50 @@
+import asyncio
+import aiosqlite
+from bot.query_log import OTHER, InstrumentedConnection, QueryStats, fingerprint, is_full_scan, redact
+
+
+def test_fingerprint_replaces_literals():
+    assert fingerprint("SELECT * FROM users WHERE user_id = 42 AND username = 'O''Brien'") == \
+        "SELECT * FROM users WHERE user_id = ? AND username = ?"
+    assert fingerprint("SELECT 1.5, col2 FROM t2") == "SELECT ?, col2 FROM t2"
+
+
+def test_fingerprint_normalizes_whitespace_and_placeholder_lists():
+    assert fingerprint("SELECT *\n  FROM users\n  WHERE user_id IN (?, ?,?)") == \
+        "SELECT * FROM users WHERE user_id IN (?, ...)"
+    assert fingerprint("SELECT * FROM users WHERE user_id IN (1, 2, 3)") == \
+        fingerprint("SELECT * FROM users WHERE user_id IN (4,5)")
+    # Одиночный плейсхолдер в скобках - не список
+    assert fingerprint("INSERT INTO t (a) VALUES (?)") == "INSERT INTO t (a) VALUES (?)"
+
+
+def test_redact_hides_values():
+    assert redact(None) == "()"
+    assert redact((42, "secret", b"xy", None)) == "(int, str[6], bytes[2], NoneType)"
+    assert redact({"search": "user%"}) == "(str[5])"
+
+
+def test_is_full_scan():
+    assert is_full_scan(["SCAN participants"])
+    assert not is_full_scan(["SEARCH participants USING INDEX sqlite_autoindex_participants_1 (giveaway_id=?)"])
+    assert not is_full_scan(["  SCAN users USING COVERING INDEX idx_users_invited"])
+    assert not is_full_scan(None)
+
+
+def test_stats_overflow_bucket_has_no_plan():
+    async def scenario():
+        stats = QueryStats(slow_ms=0, max_fingerprints=2)
+        connection = InstrumentedConnection(await aiosqlite.connect(":memory:"), stats)
+        try:
+            await connection.execute("CREATE TABLE t (a INTEGER)")
+            await connection.execute("SELECT * FROM t WHERE a = 1")
+            await connection.execute("SELECT * FROM t WHERE a = 2")
+            await connection.execute("SELECT a FROM t ORDER BY a")
+        finally:
+            await connection.close()
+        return stats
+
+    stats = asyncio.run(scenario())
+    select = stats.queries["SELECT * FROM t WHERE a = ?"]
+    assert select["count"] == 2 and is_full_scan(select["plan"])
+    assert stats.queries[OTHER]["count"] == 1 and stats.queries[OTHER]["plan"] is None
@@ -0,0 +1,46 @@
+import asyncio
+from bot.sharding import UpdateSharder, get_shard, get_shard_key
+
+
+def message(update_id: int, user_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {"message_id": 1, "from": {"id": user_id}, "chat": {"id": chat_id}, "text": "/start"}
+    }
+
+
+def test_shard_key_prefers_user():
+    assert get_shard_key(message(1, 42, -100)) == 42
+    assert get_shard_key({"update_id": 2, "callback_query": {"id": "q", "from": {"id": 42}, "message": {"chat": {"id": -100}}}}) == 42
+    assert get_shard_key({"update_id": 3, "chat_member": {"chat": {"id": -100}, "from": {"id": 42}}}) == 42
+
+
+def test_shard_key_falls_back_to_chat_then_update_id():
+    assert get_shard_key({"update_id": 4, "channel_post": {"message_id": 1, "chat": {"id": -100}}}) == -100
+    assert get_shard_key({"update_id": 5, "poll": {"id": "p", "options": []}}) == 5
+
+
+def test_user_updates_go_to_one_worker():
+    workers = 4
+    shards = {get_shard(message(update_id, 42, chat_id), workers) for update_id, chat_id in enumerate((42, -100, -200))}
+    assert len(shards) == 1
+    assert {get_shard(message(1, user_id, user_id), workers) for user_id in range(100)} == set(range(workers))
+
+
+def test_dispatch_keeps_user_order():
+    sharder = UpdateSharder(3, queue_size=10)
+    updates = [message(update_id, update_id % 2, 0) for update_id in range(6)]
+
+    async def dispatch():
+        for update in updates:
+            await sharder.dispatch(update)
+
+    asyncio.run(dispatch())
+    try:
+        for user_id in (0, 1):
+            worker_queue = sharder.queues[get_shard(updates[user_id], 3)]
+            received = [worker_queue.get(timeout=5)["update_id"] for _ in range(3)]
+            assert received == [update["update_id"] for update in updates if update["message"]["from"]["id"] == user_id]
+    finally:
+        for worker_queue in sharder.queues:
+            worker_queue.close()
@@ -0,0 +1,25 @@
+import bot.db as db
+
+
+def test_referral_counted_once_for_new_user(run_db):
+    async def scenario():
+        await db.add_user(1, "referrer", "Referrer")
+        registration = await db.add_user(2, "friend", "Friend", referrer_id=1)
+        assert registration == {'is_new_user': True, 'referral_counted': True, 'invited_count': 1}
+        assert await db.get_user_referral_status(2) == 1
+
+        # Повторный /start по ссылке обновляет данные, но реферал не засчитывает
+        registration = await db.add_user(2, "friend2", "Friend", referrer_id=1)
+        assert registration == {'is_new_user': False, 'referral_counted': False, 'invited_count': None}
+        assert (await db.get_user_info(1))["invited_friends"] == 1
+
+    run_db(scenario)
+
+
+def test_unknown_referrer_is_not_stored(run_db):
+    async def scenario():
+        registration = await db.add_user(2, "friend", "Friend", referrer_id=999)
+        assert registration == {'is_new_user': True, 'referral_counted': False, 'invited_count': None}
+        assert await db.get_user_referral_status(2) is None
+
+    run_db(scenario)
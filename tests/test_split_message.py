@@ -0,0 +1,44 @@
+from bot.scheduler import MESSAGE_LIMIT, split_message
+
+
+def test_short_text_is_one_message():
+    assert split_message("Заголовок\n", ["a", "b"], "\nПодвал") == ["Заголовок\na\nb\n\nПодвал"]
+
+
+def test_chunk_fills_exactly_to_limit():
+    header = "H\n"
+    # Заголовок и строки с переводами строк занимают ровно MESSAGE_LIMIT символов
+    line = "x" * (MESSAGE_LIMIT - len(header) - 1)
+    chunks = split_message(header, [line])
+    assert chunks == [header + line]
+    assert len(header + line + "\n") == MESSAGE_LIMIT
+
+    chunks = split_message(header, [line, "y"])
+    assert chunks == [header + line, "y"]
+
+
+def test_one_extra_character_moves_line_to_next_message():
+    header = "H\n"
+    line = "x" * (MESSAGE_LIMIT - len(header))
+    assert split_message(header, [line]) == [header.rstrip("\n"), line]
+
+
+def test_every_chunk_fits_and_lines_are_not_split():
+    lines = [f"{index}: " + "w" * (index % 97) for index in range(2000)]
+    chunks = split_message("🏆 Победители:\n\n", lines, "\n\nПоздравляем!")
+    assert len(chunks) > 1
+    assert all(len(chunk) <= MESSAGE_LIMIT for chunk in chunks)
+    joined = "\n".join(chunks)
+    assert all(line in joined.split("\n") for line in lines)
+    assert chunks[-1].endswith("Поздравляем!")
+
+
+def test_overlong_line_is_truncated():
+    chunks = split_message("", ["z" * (MESSAGE_LIMIT * 2)])
+    assert chunks == ["z" * (MESSAGE_LIMIT - 1)]
+
+
+def test_footer_that_does_not_fit_starts_new_message():
+    line = "x" * (MESSAGE_LIMIT - 10)
+    chunks = split_message("", [line], "f" * 20)
+    assert chunks == [line, "f" * 20]
@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+from bot.config import Config
+from bot.middlewares import OVERLOADED_TEXT, THROTTLED_TEXT, ThrottlingMiddleware
+
+
+class FakeCallback(SimpleNamespace):
+    def __init__(self, data: str, user_id: int):
+        super().__init__(data=data, from_user=SimpleNamespace(id=user_id), answers=[])
+
+    async def answer(self, text: str = None, cache_time: int = None):
+        self.answers.append((text, cache_time))
+
+
+async def handler(event, data):
+    return "handled"
+
+
+def press(middleware, data: str, user_id: int = 1):
+    event = FakeCallback(data, user_id)
+    return asyncio.run(middleware(handler, event, {})), event
+
+
+def test_window_limits_each_user(monkeypatch):
+    monkeypatch.setattr(Config, "ADMIN_IDS", [])
+    middleware = ThrottlingMiddleware(rules={"pt1": (2, 60)})
+    assert press(middleware, "pt1:1")[0] == "handled"
+    assert press(middleware, "pt1:1")[0] == "handled"
+    result, event = press(middleware, "pt1:1")
+    assert result is None
+    assert event.answers[0][0] == THROTTLED_TEXT and 0 < event.answers[0][1] <= 61
+    # Окно у каждого пользователя свое, а префиксы без правила не ограничиваются
+    assert press(middleware, "pt1:1", user_id=2)[0] == "handled"
+    assert press(middleware, "other:1")[0] == "handled"
+
+
+def test_window_slides(monkeypatch):
+    monkeypatch.setattr(Config, "ADMIN_IDS", [])
+    now = [1000.0]
+    monkeypatch.setattr("bot.middlewares.time.monotonic", lambda: now[0])
+    middleware = ThrottlingMiddleware(rules={"pt1": (1, 10)})
+    assert press(middleware, "pt1:1")[0] == "handled"
+    now[0] += 9.9
+    assert press(middleware, "pt1:1")[0] is None
+    now[0] += 0.2
+    assert press(middleware, "pt1:1")[0] == "handled"
+
+
+def test_longest_prefix_wins_and_admins_are_not_throttled(monkeypatch):
+    monkeypatch.setattr(Config, "ADMIN_IDS", [7])
+    middleware = ThrottlingMiddleware(rules={"w": (100, 60), "wt1": (1, 60)})
+    assert press(middleware, "wt1:1")[0] == "handled"
+    assert press(middleware, "wt1:1")[0] is None
+    assert press(middleware, "wp1:1")[0] == "handled"
+    for _ in range(3):
+        assert press(middleware, "wt1:1", user_id=7)[0] == "handled"
+
+
+def test_concurrency_cap(monkeypatch):
+    monkeypatch.setattr(Config, "ADMIN_IDS", [])
+    middleware = ThrottlingMiddleware(rules={"pt1": (100, 60)}, max_concurrent=1)
+    middleware.in_flight = 1
+    result, event = press(middleware, "pt1:1")
+    assert result is None and event.answers == [(OVERLOADED_TEXT, 1)]
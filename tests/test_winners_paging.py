@@ -0,0 +1,113 @@
+import bot.db as db
+import bot.keyboards as kb
+from bot.callbacks import ToggleWinner, WinnersPage
+
+
+FIRST_USER_ID = 1001
+PARTICIPANTS = 25
+
+
+async def create_giveaway(participants: int = PARTICIPANTS) -> int:
+    ids = await db.create_giveaways("Розыгрыш", 3, "2099-01-01 00:00:00", [-100])
+    giveaway_id = ids[-100]
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + participants):
+        await db.add_user(user_id, f"user{user_id}", f"User {user_id}")
+        await db.add_participant(giveaway_id, user_id)
+    return giveaway_id
+
+
+def navigation(keyboard) -> dict:
+    """Кнопки навигации клавиатуры выбора победителей: текст -> распакованные данные"""
+    row = next(
+        row for row in keyboard.inline_keyboard
+        if any(button.text.startswith(("📄", "⬅️", "Вперёд")) for button in row)
+    )
+    return {
+        button.text: WinnersPage.unpack(button.callback_data)
+        if button.callback_data.startswith(WinnersPage.__prefix__ + ":") else None
+        for button in row
+    }
+
+
+async def open_page(giveaway_id: int, callback: WinnersPage) -> dict:
+    if callback.before is not None:
+        return await db.get_participants_page(giveaway_id, before_user_id=callback.before, limit=kb.WINNERS_PAGE_SIZE)
+    return await db.get_participants_page(giveaway_id, after_user_id=callback.after or 0, limit=kb.WINNERS_PAGE_SIZE)
+
+
+def test_forward_and_back(run_db):
+    async def scenario():
+        giveaway_id = await create_giveaway()
+        first = await db.get_participants_page(giveaway_id, limit=kb.WINNERS_PAGE_SIZE)
+        assert first["total"] == PARTICIPANTS
+        assert not first["has_prev"] and first["has_next"]
+        keyboard = await kb.get_winners_selection_keyboard(giveaway_id, first, 0)
+        assert "⬅️ Назад" not in navigation(keyboard)
+
+        second = await open_page(giveaway_id, navigation(keyboard)["Вперёд ➡️"])
+        assert [user["user_id"] for user in second["participants"]][0] == FIRST_USER_ID + 10
+        assert second["has_prev"] and second["has_next"]
+
+        keyboard = await kb.get_winners_selection_keyboard(giveaway_id, second, 1)
+        back = await open_page(giveaway_id, navigation(keyboard)["⬅️ Назад"])
+        assert back["participants"] == first["participants"]
+        assert not back["has_prev"]
+
+    run_db(scenario)
+
+
+def test_toggle_on_first_page_then_back_is_not_offered(run_db):
+    async def scenario():
+        giveaway_id = await create_giveaway()
+        page = await db.get_participants_page(giveaway_id, limit=kb.WINNERS_PAGE_SIZE)
+        keyboard = await kb.get_winners_selection_keyboard(giveaway_id, page, 0)
+        toggle = ToggleWinner.unpack(keyboard.inline_keyboard[0][0].callback_data)
+
+        # Так перерисовывает страницу обработчик toggle_winner
+        assert await db.toggle_winner(giveaway_id, toggle.user_id) == "added"
+        page = await db.get_participants_page(giveaway_id, after_user_id=toggle.after, limit=kb.WINNERS_PAGE_SIZE)
+        assert page["participants"][0]["is_winner"]
+        assert not page["has_prev"]
+        keyboard = await kb.get_winners_selection_keyboard(giveaway_id, page, toggle.page)
+        assert "⬅️ Назад" not in navigation(keyboard)
+        assert "📄 1/3" in navigation(keyboard)
+
+    run_db(scenario)
+
+
+def test_toggle_on_later_page_then_back(run_db):
+    async def scenario():
+        giveaway_id = await create_giveaway()
+        second = await db.get_participants_page(
+            giveaway_id, after_user_id=FIRST_USER_ID + 9, limit=kb.WINNERS_PAGE_SIZE)
+        keyboard = await kb.get_winners_selection_keyboard(giveaway_id, second, 1)
+        toggle = ToggleWinner.unpack(keyboard.inline_keyboard[0][0].callback_data)
+
+        await db.toggle_winner(giveaway_id, toggle.user_id)
+        page = await db.get_participants_page(giveaway_id, after_user_id=toggle.after, limit=kb.WINNERS_PAGE_SIZE)
+        assert page["participants"] == [dict(user, is_winner=user["user_id"] == toggle.user_id)
+                                        for user in second["participants"]]
+        keyboard = await kb.get_winners_selection_keyboard(giveaway_id, page, toggle.page)
+        back = await open_page(giveaway_id, navigation(keyboard)["⬅️ Назад"])
+        assert [user["user_id"] for user in back["participants"]] == list(range(FIRST_USER_ID, FIRST_USER_ID + 10))
+
+    run_db(scenario)
+
+
+def test_search_has_prev(run_db):
+    async def scenario():
+        giveaway_id = await create_giveaway()
+        # Под "user101" подходят только user1010..user1019
+        page = await db.get_participants_page(giveaway_id, limit=4, search="@user101")
+        assert [user["user_id"] for user in page["participants"]] == [1010, 1011, 1012, 1013]
+        assert page["has_next"] and not page["has_prev"]
+
+        # Курсор перед первой найденной записью: участник 1009 есть, но под поиск не подходит
+        page = await db.get_participants_page(giveaway_id, after_user_id=1009, limit=4, search="user101")
+        assert not page["has_prev"]
+
+        page = await db.get_participants_page(giveaway_id, after_user_id=1017, limit=4, search="user101")
+        assert [user["user_id"] for user in page["participants"]] == [1018, 1019]
+        assert page["has_prev"] and not page["has_next"]
+
+    run_db(scenario)